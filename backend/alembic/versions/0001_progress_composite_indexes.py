@@ -0,0 +1,29 @@
+"""Replace single-column progress indexes with a (user_id, habit, date) composite
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from typing import Sequence, Union
+from alembic import op
+
+revision: str = "0001"
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (user_id, date) range scans are served by uq_progress_user_date_habit, whose
+# leading columns are (user_id, date); a separate index on them would only add write cost.
+def upgrade() -> None:
+    op.create_index(
+        "ix_progress_user_habit_date", "progress", ["user_id", "habit", "date"], if_not_exists=True
+    )
+    op.drop_index("ix_progress_date", table_name="progress", if_exists=True)
+    op.drop_index("ix_progress_habit", table_name="progress", if_exists=True)
+    op.drop_index("ix_progress_user_id", table_name="progress", if_exists=True)
+
+def downgrade() -> None:
+    op.create_index("ix_progress_user_id", "progress", ["user_id"], if_not_exists=True)
+    op.create_index("ix_progress_habit", "progress", ["habit"], if_not_exists=True)
+    op.create_index("ix_progress_date", "progress", ["date"], if_not_exists=True)
+    op.drop_index("ix_progress_user_habit_date", table_name="progress", if_exists=True)
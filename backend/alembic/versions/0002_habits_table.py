@@ -0,0 +1,86 @@
+"""Move habit names and categories into a habits table referenced by progress.habit_id
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+
+A habit's category used to be stored on every progress row; the migrated habit takes
+the category of its most recent row that has one. The daily rollup is keyed by habit
+(see 0006), so run `python rollup.py verify` (and `rebuild` if it reports mismatches)
+afterwards.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0002"
+down_revision: Union[str, Sequence[str], None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # init_db may already have created the (empty) table on startup
+    if "habits" not in inspector.get_table_names():
+        op.create_table(
+            "habits",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("category", sa.String(), nullable=True),
+            sa.Column("archived", sa.Boolean(), nullable=False),
+            sa.Column("sort_order", sa.Integer(), nullable=False),
+            sa.UniqueConstraint("user_id", "name", name="uq_habits_user_name"),
+        )
+
+    progress_columns = {column["name"] for column in inspector.get_columns("progress")}
+    if "habit_id" in progress_columns and "habit" not in progress_columns:
+        return  # progress was created by init_db with the current schema; nothing to move
+
+    op.execute("""
+        INSERT INTO habits (user_id, name, category, archived, sort_order)
+        SELECT p.user_id, p.habit,
+               (SELECT c.category FROM progress c
+                WHERE c.user_id = p.user_id AND c.habit = p.habit AND c.category IS NOT NULL
+                ORDER BY c.date DESC LIMIT 1),
+               false, 0
+        FROM progress p
+        WHERE NOT EXISTS (SELECT 1 FROM habits h WHERE h.user_id = p.user_id AND h.name = p.habit)
+        GROUP BY p.user_id, p.habit
+    """)
+
+    op.add_column("progress", sa.Column("habit_id", sa.Integer(), nullable=True))
+    op.execute("""
+        UPDATE progress SET habit_id = (
+            SELECT h.id FROM habits h WHERE h.user_id = progress.user_id AND h.name = progress.habit
+        )
+    """)
+
+    op.drop_index("ix_progress_user_habit_date", table_name="progress", if_exists=True)
+    with op.batch_alter_table("progress") as batch:
+        batch.drop_constraint("uq_progress_user_date_habit", type_="unique")
+        batch.drop_column("habit")
+        batch.drop_column("category")
+        batch.alter_column("habit_id", existing_type=sa.Integer(), nullable=False)
+        batch.create_foreign_key("fk_progress_habit_id_habits", "habits", ["habit_id"], ["id"])
+        batch.create_unique_constraint("uq_progress_user_date_habit", ["user_id", "date", "habit_id"])
+    op.create_index("ix_progress_user_habit_date", "progress", ["user_id", "habit_id", "date"])
+
+def downgrade() -> None:
+    op.drop_index("ix_progress_user_habit_date", table_name="progress")
+    with op.batch_alter_table("progress") as batch:
+        batch.add_column(sa.Column("habit", sa.String(), nullable=True))
+        batch.add_column(sa.Column("category", sa.String(), nullable=True))
+    op.execute("""
+        UPDATE progress SET
+            habit = (SELECT h.name FROM habits h WHERE h.id = progress.habit_id),
+            category = (SELECT h.category FROM habits h WHERE h.id = progress.habit_id)
+    """)
+    with op.batch_alter_table("progress") as batch:
+        batch.drop_constraint("uq_progress_user_date_habit", type_="unique")
+        batch.drop_constraint("fk_progress_habit_id_habits", type_="foreignkey")
+        batch.drop_column("habit_id")
+        batch.alter_column("habit", existing_type=sa.String(), nullable=False)
+        batch.create_unique_constraint("uq_progress_user_date_habit", ["user_id", "date", "habit"])
+    op.create_index("ix_progress_user_habit_date", "progress", ["user_id", "habit", "date"])
+    op.drop_table("habits")
@@ -0,0 +1,35 @@
+"""Add habit_bitmaps for the bitmap progress storage mode
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+
+The table is only read and written when PROGRESS_STORAGE=bitmap. Existing progress rows
+are copied into it with `python bitmap_storage.py import`.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0003"
+down_revision: Union[str, Sequence[str], None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # init_db may already have created the (empty) table on startup
+    if "habit_bitmaps" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "habit_bitmaps",
+        sa.Column("habit_id", sa.Integer(), sa.ForeignKey("habits.id"), primary_key=True),
+        sa.Column("year", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("tracked", sa.LargeBinary(), nullable=False),
+        sa.Column("completed", sa.LargeBinary(), nullable=False),
+    )
+    op.create_index("ix_habit_bitmaps_user_year", "habit_bitmaps", ["user_id", "year"])
+
+def downgrade() -> None:
+    op.drop_index("ix_habit_bitmaps_user_year", table_name="habit_bitmaps")
+    op.drop_table("habit_bitmaps")
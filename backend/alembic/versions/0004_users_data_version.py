@@ -0,0 +1,28 @@
+"""Add users.data_version, the per-user counter conditional GETs derive ETags from
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+
+Existing users start at 0; every write to a user's progress, habits or profile bumps it.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0004"
+down_revision: Union[str, Sequence[str], None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    # init_db creates the column on databases it builds from scratch
+    if "data_version" in {column["name"] for column in sa.inspect(op.get_bind()).get_columns("users")}:
+        return
+    op.add_column(
+        "users", sa.Column("data_version", sa.Integer(), nullable=False, server_default="0")
+    )
+
+def downgrade() -> None:
+    with op.batch_alter_table("users") as batch:
+        batch.drop_column("data_version")
@@ -0,0 +1,46 @@
+"""Add progress.change_seq and progress_tombstones for the progress change feed
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+
+Existing records get change_seq 0, so only a full sync (no cursor) returns them until
+they are written again.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0005"
+down_revision: Union[str, Sequence[str], None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    inspector = sa.inspect(op.get_bind())
+    # init_db creates the column and its index on databases it builds from scratch
+    if "change_seq" not in {column["name"] for column in inspector.get_columns("progress")}:
+        op.add_column(
+            "progress", sa.Column("change_seq", sa.Integer(), nullable=False, server_default="0")
+        )
+    op.create_index("ix_progress_user_change_seq", "progress", ["user_id", "change_seq"], if_not_exists=True)
+    # init_db may already have created the (empty) table on startup
+    if "progress_tombstones" not in inspector.get_table_names():
+        op.create_table(
+            "progress_tombstones",
+            sa.Column("id", sa.Integer(), primary_key=True),
+            sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+            sa.Column("habit_id", sa.Integer(), nullable=False),
+            sa.Column("date", sa.Date(), nullable=False),
+            sa.Column("change_seq", sa.Integer(), nullable=False),
+        )
+        op.create_index(
+            "ix_progress_tombstones_user_change_seq", "progress_tombstones", ["user_id", "change_seq"]
+        )
+
+def downgrade() -> None:
+    op.drop_index("ix_progress_tombstones_user_change_seq", table_name="progress_tombstones")
+    op.drop_table("progress_tombstones")
+    op.drop_index("ix_progress_user_change_seq", table_name="progress")
+    with op.batch_alter_table("progress") as batch:
+        batch.drop_column("change_seq")
@@ -0,0 +1,41 @@
+"""Replace progress_daily_rollup.category_counts with per-habit daily counts
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+
+Analytics now read per-habit completion from the rollup instead of grouping raw
+progress. The rollup is derived data, so existing rows are deleted here and rebuilt
+from progress on the next startup (or with `python rollup.py rebuild`).
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0006"
+down_revision: Union[str, Sequence[str], None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def _rollup_columns() -> list:
+    inspector = sa.inspect(op.get_bind())
+    if "progress_daily_rollup" not in inspector.get_table_names():
+        return []
+    return [column["name"] for column in inspector.get_columns("progress_daily_rollup")]
+
+def upgrade() -> None:
+    columns = _rollup_columns()
+    if not columns or "habit_counts" in columns:
+        return  # init_db creates the table with the current columns on startup
+    op.execute("DELETE FROM progress_daily_rollup")
+    with op.batch_alter_table("progress_daily_rollup") as batch:
+        batch.add_column(sa.Column("habit_counts", sa.JSON(), nullable=False, server_default="{}"))
+        batch.drop_column("category_counts")
+
+def downgrade() -> None:
+    if "habit_counts" not in _rollup_columns():
+        return
+    op.execute("DELETE FROM progress_daily_rollup")
+    with op.batch_alter_table("progress_daily_rollup") as batch:
+        batch.add_column(sa.Column("category_counts", sa.JSON(), nullable=False, server_default="{}"))
+        batch.drop_column("habit_counts")
@@ -0,0 +1,37 @@
+"""Add habit_bitmaps.change_seq so the change feed works with bitmap storage
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+
+Existing bitmaps get change_seq 0, so only a full sync (no cursor) returns them until
+they are written again.
+"""
+from typing import Sequence, Union
+from alembic import op
+import sqlalchemy as sa
+
+revision: str = "0007"
+down_revision: Union[str, Sequence[str], None] = "0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def _bitmap_columns() -> list:
+    inspector = sa.inspect(op.get_bind())
+    if "habit_bitmaps" not in inspector.get_table_names():
+        return []
+    return [column["name"] for column in inspector.get_columns("habit_bitmaps")]
+
+def upgrade() -> None:
+    columns = _bitmap_columns()
+    if not columns or "change_seq" in columns:
+        return  # init_db creates the table with the current columns on startup
+    op.add_column(
+        "habit_bitmaps", sa.Column("change_seq", sa.Integer(), nullable=False, server_default="0")
+    )
+
+def downgrade() -> None:
+    if "change_seq" not in _bitmap_columns():
+        return
+    with op.batch_alter_table("habit_bitmaps") as batch:
+        batch.drop_column("change_seq")
@@ -0,0 +1,57 @@
+import logging
+from datetime import date
+from typing import Awaitable, Callable, Dict
+from application_status import ApplicationStatus
+from cache import CacheBackend, LRUCache, UserVersions, estimate_size
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+CACHE_NAME = "analytics"
+
+class AnalyticsCache:
+    """Caches completion stats per (user, range), invalidated by version counters.
+
+    Keys embed the user's data version read from the database for the request, which every
+    committed write bumps, so entries stay correct across workers. The in-process counter
+    bumped by invalidate_user additionally orphans this worker's entries right after its
+    own writes. Stale entries are never served and age out of the LRU.
+    """
+
+    def __init__(self, backend: CacheBackend, versions: UserVersions):
+        self.backend = backend
+        self.versions = versions
+
+    async def get_or_compute(
+        self,
+        user_id: int,
+        data_version: int,
+        start_date: date,
+        end_date: date,
+        include_habits: bool,
+        compute: Callable[[], Awaitable[Dict]],
+    ) -> Dict:
+        """Return cached stats for the window or compute and store them."""
+        key = (user_id, data_version, self.versions.get(user_id), start_date, end_date, include_habits)
+        cached = self.backend.get(key)
+        if cached is not None:
+            ApplicationStatus.record_cache_event(CACHE_NAME, "hits")
+            return cached
+        ApplicationStatus.record_cache_event(CACHE_NAME, "misses")
+        stats = await compute()
+        self.backend.set(key, stats, estimate_size(stats))
+        return stats
+
+    def invalidate_user(self, user_id: int) -> None:
+        """Make every cached window of a user stale; call after committing a progress write."""
+        self.versions.bump(user_id)
+
+analytics_cache = AnalyticsCache(
+    LRUCache(
+        max_entries=Config.ANALYTICS_CACHE_MAX_ENTRIES,
+        max_bytes=Config.ANALYTICS_CACHE_MAX_BYTES,
+        ttl_seconds=Config.ANALYTICS_CACHE_TTL_SECONDS or None,
+        on_evict=lambda: ApplicationStatus.record_cache_event(CACHE_NAME, "evictions"),
+    ),
+    UserVersions(),
+)
@@ -1,6 +1,9 @@
 import logging
+from collections import defaultdict
 from datetime import datetime
 from threading import Lock
+from typing import Dict
+from shared_metrics import shared_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -9,6 +12,8 @@ class ApplicationStatus:
     _startup_time: datetime = datetime.now()
     _total_requests: int = 0
     _total_errors: int = 0
+    # cache name -> {"hits": n, "misses": n, "evictions": n}
+    _cache_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: {"hits": 0, "misses": 0, "evictions": 0})
     _lock = Lock()
 
     @classmethod
@@ -25,16 +30,39 @@ class ApplicationStatus:
             cls._total_errors += 1
         logger.debug(f"Total errors incremented to {cls._total_errors}")
 
+    @classmethod
+    def record_cache_event(cls, cache: str, event: str) -> None:
+        """Count a cache hit, miss or eviction for the named cache."""
+        with cls._lock:
+            cls._cache_stats[cache][event] += 1
+
     @classmethod
     def get_status(cls) -> dict:
-        """Return application status including uptime, requests, and errors."""
+        """Return application status including uptime, requests, and errors.
+
+        Uptime, request and error totals are aggregated across every worker on the host;
+        "worker" holds this process's own counters.
+        """
+        host = shared_metrics.aggregate()
         with cls._lock:
             uptime_seconds = (datetime.now() - cls._startup_time).total_seconds()
             status = {
                 "startup_time": cls._startup_time.isoformat(),
-                "uptime_seconds": int(uptime_seconds),
-                "total_requests": cls._total_requests,
-                "total_errors": cls._total_errors,
+                "uptime_seconds": max(host["uptime_seconds"], int(uptime_seconds)),
+                "workers": host["workers"],
+                "total_requests": host["total_requests"],
+                "total_errors": host["total_errors"],
+                "worker": {
+                    "uptime_seconds": int(uptime_seconds),
+                    "total_requests": cls._total_requests,
+                    "total_errors": cls._total_errors,
+                },
+                "caches": {name: dict(stats) for name, stats in cls._cache_stats.items()},
             }
-        logger.info(f"Application status: {status}")
-        return status
\ No newline at end of file
+        logger.debug(f"Application status: {status}")
+        return status
+
+    @classmethod
+    def get_route_latencies(cls) -> dict:
+        """Return host-wide per-route request counts, errors and p50/p95/p99 latency."""
+        return shared_metrics.aggregate()["routes"]
@@ -1,5 +1,7 @@
 import logging
-from typing import Dict
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional
 import datetime
 from datetime import timedelta
 from fastapi import Depends, HTTPException, APIRouter
@@ -8,9 +10,11 @@ from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-import httpx
-from passlib.context import CryptContext
+import google_auth
 from config import Config
+from password_hashing import password_hasher
+from cache import LRUCache
+from application_status import ApplicationStatus
 from schemas import GoogleLoginRequest, RegisterRequest, LoginRequest
 from user_repository import get_or_create_user 
 from models import User 
@@ -18,7 +22,6 @@ from database import get_db
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/auth", tags=["auth"])
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 logger = logging.getLogger(__name__)
@@ -28,34 +31,69 @@ SECRET_KEY = Config.SECRET_KEY
 ALGORITHM = Config.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = Config.ACCESS_TOKEN_EXPIRE_MINUTES
 
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Detached, read-only view of the authenticated user served from the principal cache."""
+    id: int
+    email: str
+    name: Optional[str]
+    avatar_url: Optional[str]
+    google_sub: Optional[str]
+    data_version: int
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, name=user.name,
+                   avatar_url=user.avatar_url, google_sub=user.google_sub, data_version=user.data_version)
+
+# Verified bearer token -> (user_id, exp timestamp); entries expire with the token itself
+_token_cache = LRUCache(
+    max_entries=Config.AUTH_CACHE_MAX_ENTRIES,
+    on_evict=lambda: ApplicationStatus.record_cache_event("auth_tokens", "evictions"),
+)
+# user_id -> UserSnapshot
+_user_cache = LRUCache(
+    max_entries=Config.AUTH_CACHE_MAX_ENTRIES,
+    ttl_seconds=Config.AUTH_USER_CACHE_TTL_SECONDS,
+    on_evict=lambda: ApplicationStatus.record_cache_event("auth_users", "evictions"),
+)
+
+def invalidate_user_snapshot(user_id: int) -> None:
+    """Drop a cached user snapshot after the user row changes."""
+    _user_cache.delete(user_id)
+
+async def reload_user_snapshot(db: AsyncSession, user_id: int) -> Optional[UserSnapshot]:
+    """Re-read a user and replace its cached snapshot, e.g. when the data version shows it is stale."""
+    result = await db.execute(select(User).where(User.id == user_id).execution_options(populate_existing=True))
+    user = result.scalar_one_or_none()
+    if user is None:
+        _user_cache.delete(user_id)
+        return None
+    snapshot = UserSnapshot.from_user(user)
+    _user_cache.set(user_id, snapshot)
+    return snapshot
+
 class LoginResponse(BaseModel):
     access_token: str
     token_type: str
     user: Dict[str, str | None]  # id as string, avatar_url nullable
 
 async def verify_google_token(id_token: str) -> Dict[str, str]:
-    """Verify a Google OAuth2 id_token."""
+    """Verify a Google OAuth2 id_token locally against Google's cached signing keys."""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://oauth2.googleapis.com/tokeninfo",
-                params={"id_token": id_token}
-            )
-            response.raise_for_status()
-            token_info = response.json()
-
-        if token_info.get("aud") != Config.GOOGLE_CLIENT_ID:
-            raise HTTPException(status_code=401, detail="Token audience mismatch")
-        
-        if "sub" not in token_info or "email" not in token_info:
-            raise HTTPException(status_code=401, detail="Invalid token payload")
-        
-        return token_info
-    except httpx.HTTPStatusError as e:
+        token_info = await google_auth.verify_id_token(id_token)
+    except google_auth.SigningKeysUnavailable as e:
+        logger.error(f"Google signing keys unavailable: {e}")
+        raise HTTPException(status_code=503, detail="Google sign-in is temporarily unavailable")
+    except JWTError as e:
         raise HTTPException(status_code=401, detail=f"Token verification failed: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token verification error: {str(e)}")
 
+    if "sub" not in token_info or "email" not in token_info:
+        raise HTTPException(status_code=401, detail="Invalid token payload")
+    return token_info
+
 def create_access_token(data: dict) -> str:
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -63,30 +101,48 @@ def create_access_token(data: dict) -> str:
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> User:
-    """Get the current user from a JWT token."""
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserSnapshot:
+    """Get the current user from a JWT token.
+
+    Verified tokens and user snapshots are cached, so repeated requests with the same
+    token skip both signature verification and the users lookup.
+    """
     credentials_exception = HTTPException(
         status_code=401,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    cached_token = _token_cache.get(token)
+    if cached_token and cached_token[1] > time.time():
+        ApplicationStatus.record_cache_event("auth_tokens", "hits")
+        user_id = cached_token[0]
+    else:
+        ApplicationStatus.record_cache_event("auth_tokens", "misses")
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            sub: str = payload.get("sub")
+            if sub is None:
+                raise credentials_exception
+            user_id = int(sub)
+        except (JWTError, ValueError):
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    result = await db.execute(select(User).where(User.id == int(user_id)))
-    user = result.scalar_one_or_none()
-    if user is None:
+        if payload.get("exp") is not None:
+            _token_cache.set(token, (user_id, payload["exp"]))
+
+    snapshot = _user_cache.get(user_id)
+    if snapshot is not None:
+        ApplicationStatus.record_cache_event("auth_users", "hits")
+        return snapshot
+    ApplicationStatus.record_cache_event("auth_users", "misses")
+
+    snapshot = await reload_user_snapshot(db, user_id)
+    if snapshot is None:
         raise credentials_exception
-    return user
+    return snapshot
 
 async def register_user(request: RegisterRequest, db: AsyncSession) -> Dict[str, str]:
     """Register a new user with email and password."""
-    hashed_password = pwd_context.hash(request.password)
+    hashed_password = await password_hasher.hash(request.password)
     new_user = User(email=request.email, password_hash=hashed_password, name=request.name)
     db.add(new_user)
     try:
@@ -103,7 +159,7 @@ async def login_user(request: LoginRequest, db: AsyncSession) -> Dict[str, str]:
     """Authenticate a user with email and password."""
     result = await db.execute(select(User).where(User.email == request.email))
     user = result.scalar_one_or_none()
-    if not user or not pwd_context.verify(request.password, user.password_hash):
+    if not user or not await password_hasher.verify(request.password, user.password_hash):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     access_token = create_access_token(data={"sub": str(user.id)})
@@ -0,0 +1,272 @@
+"""Latency, query-count and memory benchmark for the logic layer and the main routes.
+
+Runs each case against a database from generate_data.py (built in a temporary file when
+--db is not given): the logic functions are called directly, and the routes go through
+main.app over an in-process ASGI transport. Every case reports median/p95/mean latency,
+SQL statements per call and the tracemalloc peak of one extra call. With --baseline the
+results are compared against a stored report and regressions make the run exit with 1.
+
+    python benchmarks/endpoint_benchmark.py [--db bench.db] [--users 200] [--habits 8] [--days 365]
+        [--repeat 30] [--json out.json] [--baseline baseline.json] [--save-baseline baseline.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from generate_data import BENCHMARK_EMAIL_PATTERN, benchmark_email, habit_rows, use_database
+
+logger = logging.getLogger(__name__)
+
+# Default allowed slowdown / memory growth over the baseline before a case is flagged
+LATENCY_TOLERANCE = 0.25
+MEMORY_TOLERANCE = 0.25
+
+@dataclass
+class Case:
+    """One benchmarked operation; run gets a random user id, setup and teardown are untimed."""
+    name: str
+    run: Callable[[int], Awaitable[Any]]
+    setup: Optional[Callable[[int], Awaitable[None]]] = None
+    teardown: Optional[Callable[[int], Awaitable[None]]] = None
+
+class QueryCounter:
+    """Counts statements on the app's engines, including those issued inside requests."""
+
+    def __init__(self, engines: Sequence):
+        from sqlalchemy import event
+        self.count = 0
+        for engine in {id(e): e for e in engines}.values():
+            event.listen(engine.sync_engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _after_cursor_execute(self, *args) -> None:
+        self.count += 1
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def measure(case: Case, user_ids: List[int], repeat: int, warmup: int, counter: QueryCounter, seed: int) -> Dict:
+    rng = random.Random(seed)
+    timings: List[float] = []
+    queries: List[int] = []
+    for i in range(warmup + repeat + 1):
+        user_id = rng.choice(user_ids)
+        if case.setup:
+            await case.setup(user_id)
+        traced = i == warmup + repeat
+        if traced:
+            # One extra call under tracemalloc, which would distort the timed ones
+            tracemalloc.start()
+        before = counter.count
+        started = time.perf_counter()
+        await case.run(user_id)
+        elapsed = time.perf_counter() - started
+        issued = counter.count - before
+        if traced:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+        elif i >= warmup:
+            timings.append(elapsed * 1000)
+            queries.append(issued)
+        if case.teardown:
+            await case.teardown(user_id)
+    return {
+        "p50_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(percentile(timings, 95), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        "queries": statistics.median(queries),
+        "peak_kib": round(peak / 1024, 1),
+    }
+
+def build_cases(dataset: Dict, token_for: Callable[[int], str]) -> List[Case]:
+    import httpx
+    from database import async_session_maker
+    from analytics_cache import analytics_cache
+    from logic import get_progress_by_date, get_weekly_progress, get_completion_stats, bulk_update_progress
+    from main import app
+    from schemas import BulkUpdate
+    from streak_calculations import recalculate_streaks_for_habit, recalc_all_streaks
+    from streak_queue import streak_queue
+    from user_repository import fetch_habits
+
+    end_date = date.fromisoformat(dataset["end_date"])
+    start_date = date.fromisoformat(dataset["start_date"])
+    week_start = end_date - timedelta(days=6)
+    month_start = end_date - timedelta(days=29)
+    habit_names = [row["name"] for row in habit_rows(0, dataset["habits"])]
+    rng = random.Random(dataset["seed"])
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://benchmark")
+
+    def bulk_payload() -> BulkUpdate:
+        return BulkUpdate(date=end_date, updates={name: rng.random() < 0.5 for name in habit_names})
+
+    def headers(user_id: int) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {token_for(user_id)}"}
+
+    async def in_session(fn: Callable, *args) -> Any:
+        async with async_session_maker() as db:
+            return await fn(db, *args)
+
+    async def fresh_analytics(user_id: int) -> None:
+        analytics_cache.invalidate_user(user_id)
+
+    async def drain_streaks(user_id: int) -> None:
+        await streak_queue.drain()
+
+    async def first_habit_streaks(user_id: int) -> None:
+        async with async_session_maker() as db:
+            habit = (await fetch_habits(db, user_id))[0]
+            await recalculate_streaks_for_habit(db, habit.id, user_id, from_date=start_date)
+
+    async def get(path: str, user_id: int) -> None:
+        response = await client.get(path, headers=headers(user_id))
+        response.raise_for_status()
+
+    async def put_bulk(user_id: int) -> None:
+        response = await client.put(
+            "/api/progress/bulk", headers=headers(user_id), json=bulk_payload().model_dump(mode="json")
+        )
+        response.raise_for_status()
+
+    return [
+        Case("logic.get_progress_by_date", lambda u: in_session(
+            lambda db: get_progress_by_date(end_date, db, u))),
+        Case("logic.get_weekly_progress", lambda u: in_session(get_weekly_progress, u, week_start)),
+        Case("logic.get_completion_stats[30d]", lambda u: in_session(
+            get_completion_stats, u, month_start, end_date), setup=fresh_analytics),
+        Case("logic.get_completion_stats[full]", lambda u: in_session(
+            get_completion_stats, u, start_date, end_date), setup=fresh_analytics),
+        Case("logic.bulk_update_progress", lambda u: in_session(
+            lambda db: bulk_update_progress(bulk_payload(), db, u)), teardown=drain_streaks),
+        Case("streaks.recalculate_habit[full]", first_habit_streaks),
+        Case("streaks.recalc_all_streaks[user]", lambda u: in_session(recalc_all_streaks, [u])),
+        Case("GET /api/progress/{date}", lambda u: get(f"/api/progress/{end_date}", u)),
+        Case("GET /api/progress/weekly", lambda u: get(f"/api/progress/weekly?start={week_start}", u)),
+        Case("GET /api/analytics/completion", lambda u: get(
+            f"/api/analytics/completion?start={month_start}&end={end_date}", u), setup=fresh_analytics),
+        Case("PUT /api/progress/bulk", put_bulk, teardown=drain_streaks),
+    ]
+
+async def run(args: argparse.Namespace) -> Dict:
+    from sqlalchemy import select
+    from auth import create_access_token
+    from database import async_session_maker, engine, read_engine, dispose_engine, init_db
+    from models import User
+    import generate_data
+
+    await init_db()
+    if not args.reuse:
+        await generate_data.generate(
+            async_session_maker, args.users, args.habits, args.days, args.density, args.coverage, args.seed
+        )
+    async with async_session_maker() as db:
+        dataset = await generate_data.describe(db)
+        result = await db.execute(select(User.id).where(User.email.like(BENCHMARK_EMAIL_PATTERN)))
+        user_ids = sorted(result.scalars().all())
+    if not user_ids:
+        raise SystemExit(f"{args.db} holds no generate_data.py users")
+    dataset["seed"] = args.seed
+
+    tokens = {u: create_access_token({"sub": str(u), "email": benchmark_email(u)}) for u in user_ids}
+    counter = QueryCounter([engine, read_engine])
+    report = {"dataset": dataset, "repeat": args.repeat, "cases": {}}
+    try:
+        for case in build_cases(dataset, tokens.__getitem__):
+            if args.only and not any(part in case.name for part in args.only):
+                continue
+            result = await measure(case, user_ids, args.repeat, args.warmup, counter, args.seed)
+            report["cases"][case.name] = result
+            logger.info(f"{case.name}: {result}")
+    finally:
+        await dispose_engine()
+    return report
+
+def compare(report: Dict, baseline: Dict, latency_tolerance: float, memory_tolerance: float) -> List[str]:
+    """Return a description of every case that regressed against the baseline."""
+    regressions = []
+    if {k: v for k, v in baseline.get("dataset", {}).items() if k != "progress_rows"} != {
+        k: v for k, v in report["dataset"].items() if k != "progress_rows"
+    }:
+        logger.warning("Baseline was recorded on a differently shaped dataset; comparisons may be meaningless")
+    for name, current in report["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        if current["p50_ms"] > base["p50_ms"] * (1 + latency_tolerance):
+            regressions.append(f"{name}: p50 {base['p50_ms']} -> {current['p50_ms']} ms")
+        if current["queries"] > base["queries"]:
+            regressions.append(f"{name}: queries {base['queries']} -> {current['queries']}")
+        if current["peak_kib"] > base["peak_kib"] * (1 + memory_tolerance):
+            regressions.append(f"{name}: peak memory {base['peak_kib']} -> {current['peak_kib']} KiB")
+    return regressions
+
+def print_report(report: Dict, baseline: Optional[Dict]) -> None:
+    dataset = report["dataset"]
+    print(f"\n{dataset['users']} users x {dataset['habits']} habits x {dataset['days']} days, "
+          f"{dataset['progress_rows']} rows, {dataset['storage']} storage, {report['repeat']} runs per case\n")
+    print(f"{'case':<36}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}{'queries':>9}{'peak KiB':>10}{'vs base':>10}")
+    for name, result in report["cases"].items():
+        base = (baseline or {}).get("cases", {}).get(name)
+        delta = f"{(result['p50_ms'] / base['p50_ms'] - 1) * 100:+.0f}%" if base and base["p50_ms"] else ""
+        print(f"{name:<36}{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['mean_ms']:>10.3f}"
+              f"{result['queries']:>9g}{result['peak_kib']:>10.1f}{delta:>10}")
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark logic functions and routes on synthetic data.")
+    parser.add_argument("--db", help="SQLite file to generate (default: a temporary file)")
+    parser.add_argument("--reuse", action="store_true", help="Benchmark an existing --db instead of generating it")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--habits", type=int, default=8)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--density", type=float, default=0.7)
+    parser.add_argument("--coverage", type=float, default=0.95)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=30, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed calls per case before timing")
+    parser.add_argument("--only", action="append", help="Run only cases whose name contains this (repeatable)")
+    parser.add_argument("--json", help="Write the report to this file")
+    parser.add_argument("--baseline", help="Compare against this report and exit 1 on regressions")
+    parser.add_argument("--save-baseline", help="Write the report to this file as the new baseline")
+    parser.add_argument("--latency-tolerance", type=float, default=LATENCY_TOLERANCE)
+    parser.add_argument("--memory-tolerance", type=float, default=MEMORY_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if args.reuse and not args.db:
+        parser.error("--reuse needs --db")
+    args.db = args.db or os.path.join(tempfile.mkdtemp(prefix="endpoint-bench-"), "bench.db")
+    if not args.reuse and os.path.exists(args.db):
+        parser.error(f"{args.db} already exists; pass --reuse to benchmark it as is")
+    use_database(args.db)
+    report = asyncio.run(run(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+    if baseline is None:
+        return 0
+    regressions = compare(report, baseline, args.latency_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+    sys.exit(main())
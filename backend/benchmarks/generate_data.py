@@ -0,0 +1,173 @@
+"""Seed a SQLite database with synthetic users, habits and progress history.
+
+The shape is configurable: `--users` users with `--habits` habits each and `--days` days
+of history ending yesterday, each record completed with probability `--density` and
+present with probability `--coverage`. Streaks are stored already computed and the daily
+rollup (and the habit bitmaps, when PROGRESS_STORAGE=bitmap) is rebuilt, so the database
+is ready to serve.
+
+    python benchmarks/generate_data.py --db bench.db [--users 200] [--habits 8] [--days 365]
+                                       [--density 0.7] [--coverage 0.95] [--seed 42]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Sequence
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+logger = logging.getLogger(__name__)
+
+# Users written per transaction
+GENERATE_USER_BATCH_SIZE = 50
+# Rows per executemany batch
+INSERT_BATCH_SIZE = 5000
+# Generated users are recognised by their email
+BENCHMARK_EMAIL_PATTERN = "bench-user-%@example.com"
+
+def use_database(db_path: str) -> str:
+    """Point the app at a SQLite file. Must run before any backend module is imported."""
+    url = f"sqlite+aiosqlite:///{os.path.abspath(db_path)}"
+    os.environ["DATABASE_URL"] = url
+    os.environ.pop("DATABASE_READ_URL", None)
+    return url
+
+def benchmark_email(user_id: int) -> str:
+    return BENCHMARK_EMAIL_PATTERN.replace("%", str(user_id))
+
+def habit_rows(user_id: int, habits: int) -> List[Dict]:
+    return [
+        {"user_id": user_id, "name": f"habit-{h:02d}", "category": f"category-{h % 3}",
+         "archived": False, "sort_order": h}
+        for h in range(habits)
+    ]
+
+def progress_rows(
+    rng: random.Random, user_id: int, habit_ids: Sequence[int], start_date: date, days: int,
+    density: float, coverage: float,
+) -> List[Dict]:
+    """Build a user's records with streaks computed as streak_calculations does."""
+    rows = []
+    for habit_id in habit_ids:
+        streak = 0
+        for offset in range(days):
+            if rng.random() >= coverage:
+                continue  # No record; missing days do not break a streak
+            status = rng.random() < density
+            streak = streak + 1 if status else 0
+            rows.append({
+                "user_id": user_id, "habit_id": habit_id, "date": start_date + timedelta(days=offset),
+                "status": status, "streak": streak,
+            })
+    return rows
+
+async def generate(
+    session_factory: Callable,
+    users: int,
+    habits: int,
+    days: int,
+    density: float,
+    coverage: float = 1.0,
+    seed: int = 42,
+    end_date: Optional[date] = None,
+) -> Dict:
+    """Fill an empty database and return a description of the generated dataset."""
+    from sqlalchemy import insert, select
+    from config import Config
+    from models import User, Habit, Progress
+    from rollup import rebuild_rollups
+
+    rng = random.Random(seed)
+    end_date = end_date or date.today() - timedelta(days=1)
+    start_date = end_date - timedelta(days=days - 1)
+    started = time.perf_counter()
+    total = 0
+    for first in range(1, users + 1, GENERATE_USER_BATCH_SIZE):
+        batch = range(first, min(users, first + GENERATE_USER_BATCH_SIZE - 1) + 1)
+        async with session_factory() as db:
+            await db.execute(insert(User), [{"id": u, "email": benchmark_email(u)} for u in batch])
+            await db.execute(insert(Habit), [row for u in batch for row in habit_rows(u, habits)])
+            result = await db.execute(
+                select(Habit.user_id, Habit.id).where(Habit.user_id.in_(list(batch))).order_by(Habit.id)
+            )
+            habit_ids: Dict[int, List[int]] = {}
+            for user_id, habit_id in result.all():
+                habit_ids.setdefault(user_id, []).append(habit_id)
+            rows = [
+                row for u in batch
+                for row in progress_rows(rng, u, habit_ids[u], start_date, days, density, coverage)
+            ]
+            for i in range(0, len(rows), INSERT_BATCH_SIZE):
+                await db.execute(insert(Progress), rows[i:i + INSERT_BATCH_SIZE])
+            await db.commit()
+        total += len(rows)
+        logger.info(f"Generated users {batch[0]}..{batch[-1]}: {total} progress rows so far")
+
+    await rebuild_rollups(session_factory)
+    if Config.PROGRESS_STORAGE == "bitmap":
+        from bitmap_storage import import_progress_rows
+        await import_progress_rows(session_factory)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Generated {total} progress rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/sec)")
+    async with session_factory() as db:
+        return await describe(db)
+
+async def describe(db) -> Dict:
+    """Describe the generated dataset in a database, e.g. one reused across benchmark runs."""
+    from sqlalchemy import Integer, cast, func, select
+    from config import Config
+    from models import User, Habit, Progress
+
+    users = select(User.id).where(User.email.like(BENCHMARK_EMAIL_PATTERN))
+    user_count = await db.scalar(select(func.count()).select_from(users.subquery()))
+    habit_count = await db.scalar(select(func.count(Habit.id)).where(Habit.user_id.in_(users)))
+    result = await db.execute(
+        select(func.count(Progress.id), func.sum(cast(Progress.status, Integer)), func.min(Progress.date), func.max(Progress.date))
+        .where(Progress.user_id.in_(users))
+    )
+    rows, completed, first, last = result.one()
+    return {
+        "users": user_count,
+        "habits": habit_count // user_count if user_count else 0,
+        "days": (last - first).days + 1 if rows else 0,
+        "start_date": first.isoformat() if rows else None,
+        "end_date": last.isoformat() if rows else None,
+        "progress_rows": rows,
+        "density": round(completed / rows, 3) if rows else 0.0,
+        "storage": Config.PROGRESS_STORAGE,
+    }
+
+async def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Seed a SQLite database with synthetic habit data.")
+    parser.add_argument("--db", required=True, help="SQLite file to create (must not exist)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--habits", type=int, default=8, help="Habits per user")
+    parser.add_argument("--days", type=int, default=365, help="Days of history ending yesterday")
+    parser.add_argument("--density", type=float, default=0.7, help="Probability a record is completed")
+    parser.add_argument("--coverage", type=float, default=0.95, help="Probability a day has a record")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    if os.path.exists(args.db):
+        parser.error(f"{args.db} already exists")
+
+    use_database(args.db)
+    from database import async_session_maker, init_db, dispose_engine
+    await init_db()
+    try:
+        await generate(
+            async_session_maker, args.users, args.habits, args.days, args.density, args.coverage, args.seed
+        )
+    finally:
+        await dispose_engine()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    sys.exit(asyncio.run(main()))
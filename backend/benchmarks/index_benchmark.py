@@ -0,0 +1,235 @@
+"""Query-plan and timing benchmark for the progress table index layouts.
+
+Builds a synthetic SQLite dataset (one million rows by default), then for each index
+layout prints EXPLAIN QUERY PLAN and median latency of the app's main progress queries,
+plus the cost of inserting a batch of rows with that layout in place.
+
+    python benchmarks/index_benchmark.py [--rows 1000000] [--users 1000] [--habits 10] [--json out.json]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+START_DATE = date(2023, 1, 1)
+
+SCHEMA_DDL = (
+    """
+    CREATE TABLE habits (
+        id INTEGER NOT NULL PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        name VARCHAR NOT NULL,
+        category VARCHAR,
+        archived BOOLEAN NOT NULL,
+        sort_order INTEGER NOT NULL,
+        CONSTRAINT uq_habits_user_name UNIQUE (user_id, name)
+    )
+    """,
+    """
+    CREATE TABLE progress (
+        id INTEGER NOT NULL PRIMARY KEY,
+        date DATE NOT NULL,
+        status BOOLEAN NOT NULL,
+        streak INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        habit_id INTEGER NOT NULL REFERENCES habits (id),
+        CONSTRAINT uq_progress_user_date_habit UNIQUE (user_id, date, habit_id)
+    )
+    """,
+)
+
+# Secondary indexes per layout; the unique constraint's index exists in both
+LAYOUTS: Dict[str, List[str]] = {
+    "single-column": [
+        "CREATE INDEX ix_progress_date ON progress (date)",
+        "CREATE INDEX ix_progress_habit_id ON progress (habit_id)",
+        "CREATE INDEX ix_progress_user_id ON progress (user_id)",
+    ],
+    "composite": [
+        "CREATE INDEX ix_progress_user_habit_date ON progress (user_id, habit_id, date)",
+    ],
+}
+
+# The access paths used by user_repository and streak_calculations
+QUERIES: Dict[str, str] = {
+    "date_range": (
+        "SELECT p.* FROM progress p JOIN habits h ON h.id = p.habit_id "
+        "WHERE p.user_id = :user_id AND p.date BETWEEN :start AND :end ORDER BY p.date, h.sort_order, h.name"
+    ),
+    "daily_habit_counts": (
+        "SELECT habit_id, date, sum(status), count(id) FROM progress "
+        "WHERE user_id = :user_id AND date BETWEEN :start AND :end GROUP BY habit_id, date"
+    ),
+    "habit_completion_counts": (
+        "SELECT habit_id, sum(status), count(id) FROM progress "
+        "WHERE user_id = :user_id AND date BETWEEN :start AND :end GROUP BY habit_id"
+    ),
+    "streak_scan": (
+        "SELECT id, date, status, streak FROM progress WHERE user_id = :user_id AND habit_id = :habit_id "
+        "AND date >= :start ORDER BY date LIMIT 256"
+    ),
+    "streak_before": (
+        "SELECT streak FROM progress WHERE user_id = :user_id AND habit_id = :habit_id AND date < :start "
+        "ORDER BY date DESC LIMIT 1"
+    ),
+    "user_habit_ids": "SELECT DISTINCT habit_id FROM progress WHERE user_id = :user_id",
+    "habit_listing": (
+        "SELECT id, name, category FROM habits WHERE user_id = :user_id AND archived = 0 "
+        "ORDER BY sort_order, name"
+    ),
+}
+
+def habit_id(user_id: int, habit: int, habits: int) -> int:
+    return (user_id - 1) * habits + habit + 1
+
+def build_dataset(conn: sqlite3.Connection, rows: int, users: int, habits: int, seed: int) -> int:
+    """Fill progress with users x habits daily series totalling about `rows` rows."""
+    rng = random.Random(seed)
+    days = max(1, rows // (users * habits))
+    for ddl in SCHEMA_DDL:
+        conn.execute(ddl)
+    inserted = 0
+    for user_id in range(1, users + 1):
+        conn.executemany(
+            "INSERT INTO habits (id, user_id, name, category, archived, sort_order) VALUES (?, ?, ?, ?, 0, 0)",
+            [(habit_id(user_id, h, habits), user_id, f"habit_{h:02d}", None) for h in range(habits)],
+        )
+        batch: List[Tuple] = []
+        for h in range(habits):
+            streak = 0
+            for day in range(days):
+                status = rng.random() < 0.7
+                streak = streak + 1 if status else 0
+                batch.append(((START_DATE + timedelta(days=day)).isoformat(), status, streak, user_id,
+                              habit_id(user_id, h, habits)))
+        conn.executemany(
+            "INSERT INTO progress (date, status, streak, user_id, habit_id) VALUES (?, ?, ?, ?, ?)", batch
+        )
+        inserted += len(batch)
+    conn.commit()
+    return inserted
+
+def apply_layout(conn: sqlite3.Connection, layout: str) -> None:
+    existing = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'progress' AND sql IS NOT NULL"
+    ).fetchall()
+    for (name,) in existing:
+        conn.execute(f"DROP INDEX {name}")
+    for ddl in LAYOUTS[layout]:
+        conn.execute(ddl)
+    conn.execute("ANALYZE")
+    conn.commit()
+
+def query_plan(conn: sqlite3.Connection, sql: str, params: dict) -> List[str]:
+    return [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()]
+
+def time_query(conn: sqlite3.Connection, sql: str, param_sets: List[dict]) -> float:
+    """Return the median latency in milliseconds over the parameter sets."""
+    timings = []
+    for params in param_sets:
+        started = time.perf_counter()
+        conn.execute(sql, params).fetchall()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+def time_inserts(conn: sqlite3.Connection, users: int, habits: int, count: int) -> float:
+    """Insert `count` rows past the generated range with the current layout; returns rows/sec."""
+    rows = []
+    for i in range(count):
+        user_id = 1 + (i // habits) % users
+        rows.append(((START_DATE + timedelta(days=5000 + i // (users * habits))).isoformat(),
+                     True, 1, user_id, habit_id(user_id, i % habits, habits)))
+    started = time.perf_counter()
+    conn.executemany("INSERT INTO progress (date, status, streak, user_id, habit_id) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    elapsed = time.perf_counter() - started
+    conn.execute("DELETE FROM progress WHERE date >= ?", ((START_DATE + timedelta(days=5000)).isoformat(),))
+    conn.commit()
+    return count / elapsed
+
+def run(rows: int, users: int, habits: int, repeat: int, insert_rows: int, seed: int, db_path: str) -> dict:
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    started = time.perf_counter()
+    total = build_dataset(conn, rows, users, habits, seed)
+    logger.info(f"Generated {total} rows in {time.perf_counter() - started:.1f}s at {db_path}")
+
+    rng = random.Random(seed + 1)
+    days = max(1, rows // (users * habits))
+    param_sets = []
+    for _ in range(repeat):
+        offset = rng.randrange(max(1, days - 30))
+        user_id = rng.randint(1, users)
+        param_sets.append({
+            "user_id": user_id,
+            "habit_id": habit_id(user_id, rng.randrange(habits), habits),
+            "start": (START_DATE + timedelta(days=offset)).isoformat(),
+            "end": (START_DATE + timedelta(days=offset + 29)).isoformat(),
+        })
+
+    report = {"rows": total, "users": users, "habits": habits, "layouts": {}}
+    for layout in LAYOUTS:
+        apply_layout(conn, layout)
+        results = {}
+        for name, sql in QUERIES.items():
+            results[name] = {
+                "plan": query_plan(conn, sql, param_sets[0]),
+                "median_ms": round(time_query(conn, sql, param_sets), 4),
+            }
+        report["layouts"][layout] = {
+            "queries": results,
+            "insert_rows_per_sec": round(time_inserts(conn, users, habits, insert_rows)),
+        }
+    conn.close()
+    return report
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['rows']} rows, {report['users']} users, {report['habits']} habits\n")
+    layouts = list(report["layouts"])
+    print(f"{'query':<26}" + "".join(f"{layout + ' ms':>22}" for layout in layouts))
+    for name in QUERIES:
+        print(f"{name:<26}" + "".join(
+            f"{report['layouts'][layout]['queries'][name]['median_ms']:>22.3f}" for layout in layouts
+        ))
+    print(f"{'insert rows/sec':<26}" + "".join(
+        f"{report['layouts'][layout]['insert_rows_per_sec']:>22}" for layout in layouts
+    ))
+    for layout in layouts:
+        print(f"\nQuery plans ({layout}):")
+        for name, result in report["layouts"][layout]["queries"].items():
+            print(f"  {name}: {' | '.join(result['plan'])}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark progress index layouts on synthetic data.")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--habits", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=200, help="Timed executions per query")
+    parser.add_argument("--insert-rows", type=int, default=20000, help="Rows inserted to measure write cost")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--db", help="SQLite file to build (default: a temporary file)")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="index-bench-"), "progress.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    report = run(args.rows, args.users, args.habits, args.repeat, args.insert_rows, args.seed, db_path)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    main()
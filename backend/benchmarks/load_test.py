@@ -0,0 +1,332 @@
+"""Concurrent mixed-workload load test for the API.
+
+Virtual users each loop over a weighted mix of operations (toggling habits, bulk
+updates, and polling the daily, weekly and analytics endpoints) until the duration or
+request budget runs out. The target is either main.app in-process over an ASGI
+transport, with a generate_data.py database and the app's lifespan (streak worker
+included), or a running server given by --base-url, where the virtual users register
+their own accounts.
+
+Reports throughput, per-route p50/p95/p99 latency, error counts and SQLite lock errors as
+JSON (stdout, or --json), plus a table on stderr.
+
+    python benchmarks/load_test.py [--base-url http://localhost:8000] [--concurrency 20]
+        [--duration 30 | --requests 5000] [--mix toggle=40,bulk=10,daily=20,weekly=20,analytics=10]
+        [--db load.db] [--users 200] [--days 90] [--json out.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from generate_data import BACKEND_DIR, BENCHMARK_EMAIL_PATTERN, benchmark_email, habit_rows, use_database
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MIX = "toggle=40,bulk=10,daily=20,weekly=20,analytics=10"
+# Seen in driver errors and response details when a SQLite writer gives up waiting for the lock
+SQLITE_LOCK_MARKERS = ("database is locked", "database table is locked")
+
+@dataclass
+class RouteStats:
+    latencies_ms: List[float] = field(default_factory=list)
+    errors: int = 0
+    status_counts: Dict[str, int] = field(default_factory=dict)
+
+    def record(self, status: str, elapsed_ms: float, failed: bool) -> None:
+        self.latencies_ms.append(elapsed_ms)
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        if failed:
+            self.errors += 1
+
+    def summary(self, elapsed_seconds: float) -> Dict[str, Any]:
+        ordered = sorted(self.latencies_ms)
+        return {
+            "requests": len(ordered),
+            "errors": self.errors,
+            "error_rate": round(self.errors / len(ordered), 4) if ordered else 0.0,
+            "throughput_rps": round(len(ordered) / elapsed_seconds, 2) if elapsed_seconds else 0.0,
+            "p50_ms": round(percentile(ordered, 50), 3),
+            "p95_ms": round(percentile(ordered, 95), 3),
+            "p99_ms": round(percentile(ordered, 99), 3),
+            "mean_ms": round(statistics.fmean(ordered), 3) if ordered else 0.0,
+            "status_counts": dict(sorted(self.status_counts.items())),
+        }
+
+class LockErrorCounter:
+    """Counts statements that failed on a SQLite lock timeout (in-process runs only)."""
+
+    def __init__(self, engines: Sequence):
+        from sqlalchemy import event
+        self.count = 0
+        for engine in {id(e): e for e in engines}.values():
+            event.listen(engine.sync_engine, "handle_error", self._handle_error)
+
+    def _handle_error(self, context) -> None:
+        if any(marker in str(context.original_exception) for marker in SQLITE_LOCK_MARKERS):
+            self.count += 1
+
+def percentile(ordered: List[float], pct: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}', expected one of {', '.join(OPERATIONS)}")
+        try:
+            mix[name.strip()] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"invalid weight in '{part}'")
+    if not any(weight > 0 for weight in mix.values()):
+        raise argparse.ArgumentTypeError("the mix needs at least one positive weight")
+    return mix
+
+# Operations return (route label, method, path, json body)
+Request = Tuple[str, str, str, Optional[dict]]
+
+def op_toggle(rng: random.Random, habits: List[str], today: date) -> Request:
+    day = today - timedelta(days=rng.randrange(7))
+    body = {"date": day.isoformat(), "habit": rng.choice(habits), "status": rng.random() < 0.6}
+    return "POST /api/progress", "POST", "/api/progress", body
+
+def op_bulk(rng: random.Random, habits: List[str], today: date) -> Request:
+    updates = {habit: rng.random() < 0.6 for habit in habits}
+    return "PUT /api/progress/bulk", "PUT", "/api/progress/bulk", {"date": today.isoformat(), "updates": updates}
+
+def op_daily(rng: random.Random, habits: List[str], today: date) -> Request:
+    day = today - timedelta(days=rng.randrange(7))
+    return "GET /api/progress/{progress_date}", "GET", f"/api/progress/{day.isoformat()}", None
+
+def op_weekly(rng: random.Random, habits: List[str], today: date) -> Request:
+    return "GET /api/progress/weekly", "GET", "/api/progress/weekly", None
+
+def op_analytics(rng: random.Random, habits: List[str], today: date) -> Request:
+    days = rng.choice((7, 30, 90))
+    return "GET /api/analytics/completion", "GET", f"/api/analytics/completion?days={days}", None
+
+OPERATIONS: Dict[str, Callable[[random.Random, List[str], date], Request]] = {
+    "toggle": op_toggle,
+    "bulk": op_bulk,
+    "daily": op_daily,
+    "weekly": op_weekly,
+    "analytics": op_analytics,
+}
+
+async def drive(
+    client, tokens: Sequence[str], habits: List[str], mix: Dict[str, float], concurrency: int,
+    duration: Optional[float], max_requests: Optional[int], think_ms: float, seed: int,
+) -> Tuple[Dict[str, RouteStats], float, int]:
+    """Run the virtual users; returns per-route stats, elapsed seconds and lock errors seen in responses."""
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    stats: Dict[str, RouteStats] = {}
+    issued = 0
+    lock_responses = 0
+    today = date.today()
+    started = time.perf_counter()
+    deadline = started + duration if duration else None
+
+    async def virtual_user(index: int) -> None:
+        nonlocal issued, lock_responses
+        rng = random.Random(seed + index)
+        headers = {"Authorization": f"Bearer {tokens[index % len(tokens)]}"}
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if max_requests is not None:
+                if issued >= max_requests:
+                    return
+                issued += 1
+            label, method, path, body = OPERATIONS[rng.choices(names, weights)[0]](rng, habits, today)
+            request_started = time.perf_counter()
+            try:
+                response = await client.request(method, path, headers=headers, json=body)
+                status, failed = str(response.status_code), response.status_code >= 400
+                if failed and any(marker in response.text for marker in SQLITE_LOCK_MARKERS):
+                    lock_responses += 1
+            except Exception as e:
+                status, failed = type(e).__name__, True
+            elapsed_ms = (time.perf_counter() - request_started) * 1000
+            stats.setdefault(label, RouteStats()).record(status, elapsed_ms, failed)
+            if think_ms:
+                await asyncio.sleep(rng.uniform(0, 2 * think_ms) / 1000)
+
+    await asyncio.gather(*(virtual_user(i) for i in range(concurrency)))
+    return stats, time.perf_counter() - started, lock_responses
+
+async def run_in_process(args: argparse.Namespace, mix: Dict[str, float]) -> Dict[str, Any]:
+    import httpx
+    from sqlalchemy import select
+    from auth import create_access_token
+    from config import Config
+    from database import async_session_maker, engine, read_engine, init_db
+    from models import User
+    from main import app
+    import generate_data
+
+    await init_db()
+    if not args.reuse:
+        await generate_data.generate(
+            async_session_maker, args.users, args.habits, args.days, args.density, args.coverage, args.seed
+        )
+    async with async_session_maker() as db:
+        dataset = await generate_data.describe(db)
+        result = await db.execute(select(User.id).where(User.email.like(BENCHMARK_EMAIL_PATTERN)))
+        user_ids = sorted(result.scalars().all())
+    if not user_ids:
+        raise SystemExit(f"{args.db} holds no generate_data.py users")
+    tokens = [create_access_token({"sub": str(u), "email": benchmark_email(u)}) for u in user_ids]
+    habits = [row["name"] for row in habit_rows(0, dataset["habits"])]
+
+    lock_counter = LockErrorCounter([engine, read_engine])
+    # The lifespan starts the streak worker and disposes the engines afterwards, as under uvicorn
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+            stats, elapsed, lock_responses = await drive(
+                client, tokens, habits, mix, args.concurrency, args.duration, args.requests,
+                args.think_ms, args.seed,
+            )
+    return {
+        "target": "asgi",
+        "dataset": dataset,
+        "database": Config.DATABASE_URL,
+        "stats": stats,
+        "elapsed": elapsed,
+        "sqlite_lock_errors": lock_counter.count,
+    }
+
+async def run_against_server(args: argparse.Namespace, mix: Dict[str, float]) -> Dict[str, Any]:
+    import httpx
+
+    habits = [row["name"] for row in habit_rows(0, args.habits)]
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        tokens = []
+        for user_id in range(1, args.users + 1):
+            credentials = {"email": f"load-{benchmark_email(user_id)}", "password": args.password}
+            response = await client.post("/api/auth/register", json=credentials)
+            if response.status_code != 200:
+                response = await client.post("/api/auth/login", json=credentials)
+            response.raise_for_status()
+            tokens.append(response.json()["access_token"])
+        logger.info(f"Authenticated {len(tokens)} load test users against {args.base_url}")
+        stats, elapsed, lock_responses = await drive(
+            client, tokens, habits, mix, args.concurrency, args.duration, args.requests, args.think_ms, args.seed
+        )
+    return {
+        "target": args.base_url,
+        "dataset": {"users": args.users, "habits": args.habits},
+        "stats": stats,
+        "elapsed": elapsed,
+        # Only lock errors whose message reaches the response body are visible remotely
+        "sqlite_lock_errors": lock_responses,
+    }
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_report(args: argparse.Namespace, mix: Dict[str, float], result: Dict[str, Any]) -> Dict[str, Any]:
+    stats: Dict[str, RouteStats] = result.pop("stats")
+    elapsed = result.pop("elapsed")
+    overall = RouteStats()
+    for route_stats in stats.values():
+        overall.latencies_ms.extend(route_stats.latencies_ms)
+        overall.errors += route_stats.errors
+        for status, count in route_stats.status_counts.items():
+            overall.status_counts[status] = overall.status_counts.get(status, 0) + count
+    return {
+        "revision": git_revision(),
+        **result,
+        "concurrency": args.concurrency,
+        "mix": mix,
+        "duration_seconds": round(elapsed, 3),
+        "total": overall.summary(elapsed),
+        "routes": {label: stats[label].summary(elapsed) for label in sorted(stats)},
+    }
+
+def print_table(report: Dict[str, Any]) -> None:
+    out = sys.stderr
+    total = report["total"]
+    print(
+        f"\n{report['target']}: {total['requests']} requests in {report['duration_seconds']}s "
+        f"({total['throughput_rps']} req/s) at concurrency {report['concurrency']}, "
+        f"{total['errors']} errors, {report['sqlite_lock_errors']} SQLite lock errors\n", file=out,
+    )
+    print(f"{'route':<36}{'reqs':>8}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}", file=out)
+    for label, route in list(report["routes"].items()) + [("total", total)]:
+        print(f"{label:<36}{route['requests']:>8}{route['throughput_rps']:>9.1f}{route['p50_ms']:>10.2f}"
+              f"{route['p95_ms']:>10.2f}{route['p99_ms']:>10.2f}{route['errors']:>8}", file=out)
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive the API with concurrent mixed traffic.")
+    parser.add_argument("--base-url", help="Running server to load; default is main.app in-process")
+    parser.add_argument("--concurrency", type=int, default=20, help="Virtual users")
+    parser.add_argument("--duration", type=float, help="Seconds to run (default 30 unless --requests is given)")
+    parser.add_argument("--requests", type=int, help="Stop after this many requests")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"Operation weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users", type=int, default=200, help="Accounts to spread the virtual users over")
+    parser.add_argument("--habits", type=int, default=8)
+    parser.add_argument("--json", help="Write the report here instead of stdout")
+    in_process = parser.add_argument_group("in-process target")
+    in_process.add_argument("--db", help="SQLite file to generate (default: a temporary file)")
+    in_process.add_argument("--reuse", action="store_true", help="Load an existing --db instead of generating it")
+    in_process.add_argument("--days", type=int, default=90)
+    in_process.add_argument("--density", type=float, default=0.7)
+    in_process.add_argument("--coverage", type=float, default=0.95)
+    remote = parser.add_argument_group("--base-url target")
+    remote.add_argument("--password", default="load-test-password", help="Password of the load test accounts")
+    remote.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    args = parser.parse_args(argv)
+    if args.duration is None and args.requests is None:
+        args.duration = 30.0
+    if args.concurrency < 1 or args.users < 1:
+        parser.error("--concurrency and --users must be positive")
+
+    if args.base_url:
+        result = asyncio.run(run_against_server(args, args.mix))
+    else:
+        if args.reuse and not args.db:
+            parser.error("--reuse needs --db")
+        args.db = args.db or os.path.join(tempfile.mkdtemp(prefix="load-test-"), "load.db")
+        if not args.reuse and os.path.exists(args.db):
+            parser.error(f"{args.db} already exists; pass --reuse to load it as is")
+        use_database(args.db)
+        result = asyncio.run(run_in_process(args, args.mix))
+
+    report = build_report(args, args.mix, result)
+    print_table(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+    # Under load most writes exceed the slow-query threshold; the report covers latency
+    logging.getLogger("db_instrumentation").setLevel(logging.ERROR)
+    sys.exit(main())
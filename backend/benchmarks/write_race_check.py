@@ -0,0 +1,129 @@
+"""Concurrency check for the progress stores' read-modify-write paths.
+
+Many sessions write the same habit-year at once, each setting a different day, while
+others fill disjoint ranges of a second habit and open the daily view of a third. Afterwards every written day must be
+present with its status and the user's data version must have moved at least once per write;
+a lost update (e.g. two bitmap writers reading the same yearly blob) makes the check
+fail with exit code 1. Runs against a fresh temporary SQLite file per storage mode.
+
+    python benchmarks/write_race_check.py [--storage row|bitmap|both] [--writers 40]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+from datetime import date, timedelta
+from typing import List, Optional, Sequence
+
+from generate_data import habit_rows, use_database
+
+logger = logging.getLogger(__name__)
+
+YEAR = 2024
+FILL_SPAN_DAYS = 7
+
+async def check_store(storage: str, writers: int) -> List[str]:
+    """Race writers against one store and return a description of every lost write."""
+    from sqlalchemy import insert, select
+    from database import async_session_maker, init_db
+    from models import Habit, User
+    from progress_store import RowProgressStore, set_progress_store
+    from user_repository import fetch_data_version
+
+    if storage == "bitmap":
+        from bitmap_storage import BitmapProgressStore
+        store = set_progress_store(BitmapProgressStore())
+    else:
+        store = set_progress_store(RowProgressStore())
+
+    await init_db()
+    async with async_session_maker() as db:
+        await db.execute(insert(User), [{"id": 1, "email": "race@example.com"}])
+        await db.execute(insert(Habit), habit_rows(1, 3))
+        await db.commit()
+        result = await db.execute(select(Habit.id).where(Habit.user_id == 1).order_by(Habit.id))
+        toggled, filled, viewed = result.scalars().all()
+
+    first_day = date(YEAR, 1, 1)
+    write_days = [first_day + timedelta(days=i) for i in range(writers)]
+    fill_starts = [first_day + timedelta(days=i * FILL_SPAN_DAYS) for i in range(writers // 2)]
+
+    async def write(day: date) -> None:
+        async with async_session_maker() as db:
+            await store.write_statuses(db, 1, day, {toggled: day.day % 2 == 0})
+
+    async def fill(start: date) -> None:
+        async with async_session_maker() as db:
+            await store.fill_missing(db, 1, [filled], start, start + timedelta(days=FILL_SPAN_DAYS - 1))
+
+    async def view(day: date) -> None:
+        async with async_session_maker() as db:
+            await store.day_cells(db, 1, day, [viewed])
+
+    results = await asyncio.gather(
+        *(write(day) for day in write_days), *(fill(start) for start in fill_starts),
+        *(view(day) for day in write_days), return_exceptions=True,
+    )
+    problems = [f"{storage}: write failed: {result!r}" for result in results if isinstance(result, Exception)]
+    async with async_session_maker() as db:
+        last_day = max(write_days[-1], fill_starts[-1] + timedelta(days=FILL_SPAN_DAYS - 1))
+        cells = await store.range_cells(db, 1, first_day, last_day)
+        version = await fetch_data_version(db, 1)
+    statuses = {(cell.habit_id, cell.date): cell.status for cell in cells}
+    for day in write_days:
+        if statuses.get((toggled, day)) != (day.day % 2 == 0):
+            problems.append(f"{storage}: write for habit {toggled} on {day} was lost")
+        if (viewed, day) not in statuses:
+            problems.append(f"{storage}: day view of habit {viewed} on {day} was not materialized")
+    for start in fill_starts:
+        for offset in range(FILL_SPAN_DAYS):
+            day = start + timedelta(days=offset)
+            if (filled, day) not in statuses:
+                problems.append(f"{storage}: filled day {day} of habit {filled} was lost")
+    expected_version = 2 * len(write_days) + len(fill_starts)
+    # Row-mode fills also bump for the streak recalculation that follows them
+    if version < expected_version:
+        problems.append(f"{storage}: data version is {version}, expected at least {expected_version}")
+    return problems
+
+async def run(storage: str, writers: int) -> List[str]:
+    from database import dispose_engine
+    try:
+        return await check_store(storage, writers)
+    finally:
+        await dispose_engine()
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check progress writes for lost updates under concurrency.")
+    parser.add_argument("--storage", choices=["row", "bitmap", "both"], default="both")
+    parser.add_argument("--writers", type=int, default=40, help="Concurrent day writes (at most 180)")
+    args = parser.parse_args(argv)
+    if not 2 <= args.writers <= 180:
+        parser.error("--writers must be between 2 and 180")
+
+    # The engine binds DATABASE_URL at import, so each mode runs in its own process
+    storages = ["row", "bitmap"] if args.storage == "both" else [args.storage]
+    if len(storages) > 1:
+        status = 0
+        for storage in storages:
+            status |= os.spawnv(os.P_WAIT, sys.executable, [
+                sys.executable, os.path.abspath(__file__), "--storage", storage, "--writers", str(args.writers),
+            ])
+        return status
+
+    use_database(os.path.join(tempfile.mkdtemp(prefix="write-race-"), "race.db"))
+    problems = asyncio.run(run(storages[0], args.writers))
+    for problem in problems:
+        logger.error(problem)
+    if problems:
+        return 1
+    logger.info(f"{storages[0]}: no lost writes across {args.writers} concurrent writers")
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logger.setLevel(logging.INFO)
+    logging.getLogger("db_instrumentation").setLevel(logging.ERROR)
+    sys.exit(main())
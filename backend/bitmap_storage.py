@@ -0,0 +1,464 @@
+import argparse
+import asyncio
+import logging
+import sys
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_session_maker, init_db
+from models import Habit, HabitBitmap, Progress, User
+from progress_store import ChangeBatch, ChangeCursor, CompletionMatrix, ProgressCell
+from user_repository import bump_data_version, fetch_data_version, fetch_habits, UPSERT_CHUNK_SIZE
+from analytics_cache import analytics_cache
+
+logger = logging.getLogger(__name__)
+
+# One bit per day of a (leap) year
+YEAR_BITS = 366
+YEAR_BYTES = (YEAR_BITS + 7) // 8
+
+# Bitmap cells have no row id; their id encodes (habit_id, days since CELL_ID_EPOCH)
+CELL_ID_EPOCH = date(1970, 1, 1)
+CELL_ID_SPAN = 1 << 17
+
+# Users converted per transaction by the import command
+IMPORT_USER_BATCH_SIZE = 200
+
+# Bit helpers. Bitmaps are little-endian, so the bytes read as one int have bit n == day n.
+def day_bit(day: date) -> int:
+    return day.timetuple().tm_yday - 1
+
+def empty_bitmap() -> bytes:
+    return bytes(YEAR_BYTES)
+
+def set_bit(blob: bytes, bit: int, value: bool) -> bytes:
+    """Return a copy of blob with one bit set or cleared."""
+    buf = bytearray(blob)
+    if value:
+        buf[bit >> 3] |= 1 << (bit & 7)
+    else:
+        buf[bit >> 3] &= ~(1 << (bit & 7)) & 0xFF
+    return bytes(buf)
+
+def get_bit(blob: bytes, bit: int) -> bool:
+    return bool(blob[bit >> 3] & (1 << (bit & 7)))
+
+def to_int(blob: bytes) -> int:
+    return int.from_bytes(blob, "little")
+
+def count_bits(bits: int, first: int, last: int) -> int:
+    """Popcount of bits first..last inclusive."""
+    return ((bits >> first) & ((1 << (last - first + 1)) - 1)).bit_count()
+
+def unpack(blob: bytes) -> np.ndarray:
+    """Return the bitmap as a 0/1 array indexed by day of year."""
+    return np.unpackbits(np.frombuffer(blob, dtype=np.uint8), bitorder="little")[:YEAR_BITS]
+
+def trailing_streak(tracked: int, completed: int, last: int) -> Tuple[int, bool]:
+    """Count completed days after the last miss at or before bit `last`.
+
+    A miss is a tracked day that is not completed; untracked days neither extend nor
+    break a streak, matching the row engine. Returns (count, whether a miss was found);
+    without a miss the streak continues from the previous year.
+    """
+    mask = (1 << (last + 1)) - 1
+    misses = tracked & ~completed & mask
+    done = completed & mask
+    if misses:
+        return (done >> misses.bit_length()).bit_count(), True
+    return done.bit_count(), False
+
+def streak_through(history: Mapping[int, HabitBitmap], day: date) -> int:
+    """Streak of a habit as of `day` (inclusive), scanning back across its yearly bitmaps."""
+    total = 0
+    for year in sorted((y for y in history if y <= day.year), reverse=True):
+        bitmap = history[year]
+        last = day_bit(day) if year == day.year else YEAR_BITS - 1
+        streak, found_miss = trailing_streak(to_int(bitmap.tracked), to_int(bitmap.completed), last)
+        total += streak
+        if found_miss:
+            break
+    return total
+
+def streak_series(history: Mapping[int, HabitBitmap], start_date: date, end_date: date) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return (tracked, completed, streak) arrays over the days of start_date..end_date."""
+    tracked, completed = _range_bits(history, start_date, end_date)
+    # Running completions, reset at every miss and seeded with the streak entering the range
+    misses = (tracked == 1) & (completed == 0)
+    running = np.cumsum(completed) + streak_through(history, start_date - timedelta(days=1))
+    return tracked, completed, running - np.maximum.accumulate(np.where(misses, running, 0))
+
+def cell_id(habit_id: int, day: date) -> int:
+    return habit_id * CELL_ID_SPAN + (day - CELL_ID_EPOCH).days
+
+def decode_cell_id(value: int) -> Tuple[int, date]:
+    habit_id, offset = divmod(value, CELL_ID_SPAN)
+    return habit_id, CELL_ID_EPOCH + timedelta(days=offset)
+
+def _range_bits(history: Mapping[int, HabitBitmap], start_date: date, end_date: date) -> Tuple[np.ndarray, np.ndarray]:
+    """Return (tracked, completed) 0/1 arrays over the days of start_date..end_date."""
+    days = (end_date - start_date).days + 1
+    tracked = np.zeros(days, dtype=np.int64)
+    completed = np.zeros(days, dtype=np.int64)
+    for year in range(start_date.year, end_date.year + 1):
+        bitmap = history.get(year)
+        if bitmap is None:
+            continue
+        first = max(start_date, date(year, 1, 1))
+        last = min(end_date, date(year, 12, 31))
+        offset = (first - start_date).days
+        span = slice(day_bit(first), day_bit(last) + 1)
+        tracked[offset:offset + span.stop - span.start] = unpack(bitmap.tracked)[span]
+        completed[offset:offset + span.stop - span.start] = unpack(bitmap.completed)[span]
+    return tracked, completed
+
+class BitmapProgressStore:
+    """Stores each habit's history as two packed bitsets per calendar year.
+
+    A year costs 92 bytes per habit instead of up to 366 rows. Day toggles rewrite one
+    bit, range counts are popcounts, and streaks are derived on read by scanning back to
+    the last miss, so nothing has to be recomputed after an edit. Each habit-year is
+    stamped with the data version of its last write, which drives the change feed.
+    """
+
+    async def _load(
+        self,
+        db: AsyncSession,
+        user_id: int,
+        habit_ids: Optional[Sequence[int]] = None,
+        first_year: Optional[int] = None,
+        last_year: Optional[int] = None,
+        for_update: bool = False,
+    ) -> Dict[int, Dict[int, HabitBitmap]]:
+        """Load bitmaps as {habit_id: {year: bitmap}} in one query, refreshing any already in the session.
+
+        Writers must call bump_data_version first: its update of the user row holds that row's
+        lock (and on SQLite the database write lock) for the rest of the transaction, so the
+        read-modify-write of each yearly blob is serialized. FOR UPDATE adds row locks where supported.
+        """
+        query = select(HabitBitmap).where(HabitBitmap.user_id == user_id)
+        if habit_ids is not None:
+            query = query.where(HabitBitmap.habit_id.in_(habit_ids))
+        if first_year is not None:
+            query = query.where(HabitBitmap.year >= first_year)
+        if last_year is not None:
+            query = query.where(HabitBitmap.year <= last_year)
+        if for_update and db.bind.dialect.name == "postgresql":
+            query = query.with_for_update()
+        result = await db.execute(query.execution_options(populate_existing=True))
+        histories: Dict[int, Dict[int, HabitBitmap]] = defaultdict(dict)
+        for bitmap in result.scalars().all():
+            histories[bitmap.habit_id][bitmap.year] = bitmap
+        return histories
+
+    def _bitmap_for(
+        self, db: AsyncSession, histories: Dict[int, Dict[int, HabitBitmap]], user_id: int, habit_id: int, year: int
+    ) -> HabitBitmap:
+        bitmap = histories[habit_id].get(year)
+        if bitmap is None:
+            bitmap = HabitBitmap(
+                habit_id=habit_id, year=year, user_id=user_id, tracked=empty_bitmap(), completed=empty_bitmap()
+            )
+            db.add(bitmap)
+            histories[habit_id][year] = bitmap
+        return bitmap
+
+    def _cell(self, history: Mapping[int, HabitBitmap], habit_id: int, day: date) -> Optional[ProgressCell]:
+        bitmap = history.get(day.year)
+        if bitmap is None or not get_bit(bitmap.tracked, day_bit(day)):
+            return None
+        status = get_bit(bitmap.completed, day_bit(day))
+        return ProgressCell(
+            id=cell_id(habit_id, day), date=day, habit_id=habit_id, status=status,
+            streak=streak_through(history, day) if status else 0,
+        )
+
+    async def write_statuses(
+        self, db: AsyncSession, user_id: int, day: date, statuses: Mapping[int, bool]
+    ) -> None:
+        try:
+            if not statuses:
+                return
+            change_seq = await bump_data_version(db, user_id)
+            histories = await self._load(db, user_id, list(statuses), day.year, day.year, for_update=True)
+            bit = day_bit(day)
+            for habit_id, status in statuses.items():
+                bitmap = self._bitmap_for(db, histories, user_id, habit_id, day.year)
+                bitmap.tracked = set_bit(bitmap.tracked, bit, True)
+                bitmap.completed = set_bit(bitmap.completed, bit, status)
+                bitmap.change_seq = change_seq
+            await db.commit()
+            analytics_cache.invalidate_user(user_id)
+        except Exception as e:
+            logger.error(f"Error writing bitmap progress for user {user_id} on {day}: {e}")
+            await db.rollback()
+            raise
+
+    async def day_cells(
+        self, db: AsyncSession, user_id: int, day: date, habit_ids: Sequence[int]
+    ) -> Dict[int, ProgressCell]:
+        histories = await self._load(db, user_id, habit_ids, last_year=day.year)
+        bit = day_bit(day)
+
+        def untracked(histories: Dict[int, Dict[int, HabitBitmap]]) -> List[int]:
+            return [
+                habit_id for habit_id in habit_ids
+                if day.year not in histories[habit_id] or not get_bit(histories[habit_id][day.year].tracked, bit)
+            ]
+
+        if untracked(histories):
+            try:
+                # Re-read under the write lock; a concurrent request may have filled the day already
+                change_seq = await bump_data_version(db, user_id)
+                histories = await self._load(db, user_id, habit_ids, last_year=day.year, for_update=True)
+                missing = untracked(histories)
+                for habit_id in missing:
+                    bitmap = self._bitmap_for(db, histories, user_id, habit_id, day.year)
+                    bitmap.tracked = set_bit(bitmap.tracked, bit, True)
+                    bitmap.change_seq = change_seq
+                if not missing:
+                    await bump_data_version(db, user_id, step=-1)
+                await db.commit()
+                if missing:
+                    analytics_cache.invalidate_user(user_id)
+            except Exception as e:
+                logger.error(f"Error creating missing bitmap progress for user {user_id} on {day}: {e}")
+                await db.rollback()
+                raise
+        return {habit_id: self._cell(histories[habit_id], habit_id, day) for habit_id in habit_ids}
+
+    async def range_cells(self, db: AsyncSession, user_id: int, start_date: date, end_date: date) -> List[ProgressCell]:
+        habits = await fetch_habits(db, user_id, include_archived=True)
+        histories = await self._load(db, user_id, last_year=end_date.year)
+        days = (end_date - start_date).days + 1
+        series = []
+        for habit in habits:
+            history = histories.get(habit.id)
+            if not history:
+                continue
+            tracked, completed, streaks = streak_series(history, start_date, end_date)
+            if not tracked.any():
+                continue
+            series.append((habit.id, tracked, completed, streaks))
+
+        cells: List[ProgressCell] = []
+        for offset in range(days):
+            day = start_date + timedelta(days=offset)
+            for habit_id, tracked, completed, streaks in series:
+                if tracked[offset]:
+                    cells.append(ProgressCell(
+                        id=cell_id(habit_id, day), date=day, habit_id=habit_id,
+                        status=bool(completed[offset]), streak=int(streaks[offset]),
+                    ))
+        return cells
+
+    async def update_cell(
+        self, db: AsyncSession, user_id: int, cell_id: int, updates: Mapping[str, Any]
+    ) -> Optional[ProgressCell]:
+        habit_id, day = decode_cell_id(cell_id)
+        habit = await db.get(Habit, habit_id)
+        if habit is None or habit.user_id != user_id:
+            return None
+        histories = await self._load(db, user_id, [habit_id], last_year=day.year)
+        if self._cell(histories[habit_id], habit_id, day) is None:
+            return None
+        # Streaks are derived from the bits, so only status can be written
+        if "status" in updates:
+            await self.write_statuses(db, user_id, day, {habit_id: updates["status"]})
+            histories = await self._load(db, user_id, [habit_id], last_year=day.year)
+        return self._cell(histories[habit_id], habit_id, day)
+
+    async def completion_matrix(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> CompletionMatrix:
+        days = (end_date - start_date).days + 1
+        histories = await self._load(db, user_id, first_year=start_date.year, last_year=end_date.year)
+        habit_ids, totals, completed = [], [], []
+        for habit_id in sorted(histories):
+            tracked_days, completed_days = _range_bits(histories[habit_id], start_date, end_date)
+            if tracked_days.any():
+                habit_ids.append(habit_id)
+                totals.append(tracked_days)
+                completed.append(completed_days)
+        if not habit_ids:
+            return CompletionMatrix.empty(days)
+        return CompletionMatrix(habit_ids, np.vstack(totals), np.vstack(completed))
+
+    async def habit_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[int, int, int]]:
+        histories = await self._load(db, user_id, first_year=start_date.year, last_year=end_date.year)
+        counts = []
+        for habit_id in sorted(histories):
+            total = done = 0
+            for year, bitmap in histories[habit_id].items():
+                first = day_bit(max(start_date, date(year, 1, 1)))
+                last = day_bit(min(end_date, date(year, 12, 31)))
+                total += count_bits(to_int(bitmap.tracked), first, last)
+                done += count_bits(to_int(bitmap.completed), first, last)
+            if total:
+                counts.append((habit_id, total, done))
+        return counts
+
+    async def daily_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[date, int, int]]:
+        matrix = await self.completion_matrix(db, user_id, start_date, end_date)
+        totals = matrix.totals.sum(axis=0)
+        completed = matrix.completed.sum(axis=0)
+        return [
+            (start_date + timedelta(days=int(offset)), int(completed[offset]), int(totals[offset]))
+            for offset in np.flatnonzero(totals)
+        ]
+
+    async def fill_missing(
+        self, db: AsyncSession, user_id: int, habit_ids: Sequence[int], start_date: date, end_date: date,
+        chunk_size: int = UPSERT_CHUNK_SIZE,
+    ) -> int:
+        # A whole range is one OR per habit-year bitmap, so chunk_size does not apply
+        try:
+            change_seq = await bump_data_version(db, user_id)
+            histories = await self._load(db, user_id, habit_ids, start_date.year, end_date.year, for_update=True)
+            created = 0
+            for habit_id in habit_ids:
+                for year in range(start_date.year, end_date.year + 1):
+                    first = day_bit(max(start_date, date(year, 1, 1)))
+                    last = day_bit(min(end_date, date(year, 12, 31)))
+                    mask = ((1 << (last - first + 1)) - 1) << first
+                    bitmap = self._bitmap_for(db, histories, user_id, habit_id, year)
+                    tracked = to_int(bitmap.tracked)
+                    if mask & ~tracked:
+                        created += (mask & ~tracked).bit_count()
+                        bitmap.tracked = (tracked | mask).to_bytes(YEAR_BYTES, "little")
+                        bitmap.change_seq = change_seq
+            if not created:
+                await bump_data_version(db, user_id, step=-1)
+            await db.commit()
+            if created:
+                analytics_cache.invalidate_user(user_id)
+            return created
+        except Exception as e:
+            logger.error(f"Error filling missing bitmap progress for user {user_id}: {e}")
+            await db.rollback()
+            raise
+
+    async def changes_since(
+        self, db: AsyncSession, user_id: int, cursor: Optional[ChangeCursor], limit: int
+    ) -> ChangeBatch:
+        # Bits carry no per-day version, so a write re-sends every cell of its habit-year, and
+        # the habit's later years follow at the same version since their derived streaks may
+        # have shifted. Bits are never cleared, so there are no deletions to report.
+        # Read the version first: bitmaps stamped up to it are committed along with it
+        through_seq = await fetch_data_version(db, user_id)
+        start = cursor or ChangeCursor(-1)
+        query = select(HabitBitmap.habit_id).distinct().where(HabitBitmap.user_id == user_id)
+        if start.after_id is None:
+            query = query.where(HabitBitmap.change_seq > start.seq)
+        else:
+            query = query.where(HabitBitmap.change_seq >= start.seq)
+        habit_ids = (await db.execute(query)).scalars().all()
+        histories = await self._load(db, user_id, habit_ids) if habit_ids else {}
+
+        changes: List[Tuple[int, ProgressCell]] = []
+        for habit_id, history in histories.items():
+            change_seq = -1
+            for year in sorted(history):
+                change_seq = max(change_seq, history[year].change_seq)
+                if change_seq > through_seq:
+                    break  # Written after the version was read; sent on the next call
+                if change_seq < start.seq:
+                    continue
+                tracked, completed, streaks = streak_series(history, date(year, 1, 1), date(year, 12, 31))
+                for offset in np.flatnonzero(tracked):
+                    day = date(year, 1, 1) + timedelta(days=int(offset))
+                    cell = ProgressCell(
+                        id=cell_id(habit_id, day), date=day, habit_id=habit_id,
+                        status=bool(completed[offset]), streak=int(streaks[offset]),
+                    )
+                    if change_seq > start.seq or (start.after_id is not None and cell.id > start.after_id):
+                        changes.append((change_seq, cell))
+        changes.sort(key=lambda change: (change[0], change[1].id))
+
+        has_more = len(changes) > limit
+        changes = changes[:limit]
+        if has_more:
+            next_cursor = ChangeCursor(changes[-1][0], changes[-1][1].id)
+        else:
+            next_cursor = ChangeCursor(max(through_seq, start.seq))
+        return ChangeBatch([cell for _, cell in changes], [], next_cursor, has_more)
+
+def pack_rows(rows: Iterable[Tuple[int, int, date, bool]]) -> List[Dict[str, Any]]:
+    """Pack (user_id, habit_id, date, status) rows into habit_bitmaps values."""
+    bitmaps: Dict[Tuple[int, int], Dict[str, Any]] = {}
+    for user_id, habit_id, day, status in rows:
+        key = (habit_id, day.year)
+        entry = bitmaps.get(key)
+        if entry is None:
+            entry = bitmaps[key] = {
+                "habit_id": habit_id, "year": day.year, "user_id": user_id,
+                "tracked": bytearray(YEAR_BYTES), "completed": bytearray(YEAR_BYTES),
+            }
+        bit = day_bit(day)
+        entry["tracked"][bit >> 3] |= 1 << (bit & 7)
+        if status:
+            entry["completed"][bit >> 3] |= 1 << (bit & 7)
+    for entry in bitmaps.values():
+        entry["tracked"] = bytes(entry["tracked"])
+        entry["completed"] = bytes(entry["completed"])
+    return list(bitmaps.values())
+
+async def import_progress_rows(
+    session_factory: Callable[[], AsyncSession], user_ids: Optional[Sequence[int]] = None
+) -> int:
+    """Replace the bitmaps of the given users (default: all) with their progress rows. Returns bitmaps written."""
+    async with session_factory() as db:
+        if user_ids:
+            users = sorted(set(user_ids))
+        else:
+            result = await db.execute(select(Progress.user_id).distinct().order_by(Progress.user_id))
+            users = result.scalars().all()
+
+    written = 0
+    for start in range(0, len(users), IMPORT_USER_BATCH_SIZE):
+        batch = users[start:start + IMPORT_USER_BATCH_SIZE]
+        async with session_factory() as db:
+            result = await db.execute(
+                select(Progress.user_id, Progress.habit_id, Progress.date, Progress.status)
+                .where(Progress.user_id.in_(batch))
+            )
+            bitmaps = pack_rows(result.all())
+            await bump_data_version(db, batch)
+            versions = dict((await db.execute(select(User.id, User.data_version).where(User.id.in_(batch)))).all())
+            for bitmap in bitmaps:
+                bitmap["change_seq"] = versions[bitmap["user_id"]]
+            await db.execute(delete(HabitBitmap).where(HabitBitmap.user_id.in_(batch)))
+            if bitmaps:
+                await db.execute(HabitBitmap.__table__.insert(), bitmaps)
+            await db.commit()
+        for user_id in batch:
+            analytics_cache.invalidate_user(user_id)
+        written += len(bitmaps)
+        logger.info(f"Imported progress for users {batch[0]}..{batch[-1]}: {len(bitmaps)} bitmaps")
+    logger.info(f"Bitmap import complete: {written} bitmaps for {len(users)} users")
+    return written
+
+async def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the habit_bitmaps table used by PROGRESS_STORAGE=bitmap.")
+    parser.add_argument("command", choices=["import"], help="import: rebuild bitmaps from progress rows")
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                        help="Limit to a user (repeatable); default is all users")
+    args = parser.parse_args(argv)
+
+    await init_db()
+    await import_progress_rows(async_session_maker, args.user_ids)
+    return 0
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(asyncio.run(main()))
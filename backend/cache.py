@@ -0,0 +1,112 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Protocol, Tuple
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+class CacheBackend(Protocol):
+    """Storage interface for the result caches; a shared store can implement it later."""
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or None when absent or expired."""
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> None:
+        """Store a value with its approximate size in bytes."""
+
+    def delete(self, key: Hashable) -> None:
+        """Drop a value if present."""
+
+    def clear(self) -> None:
+        """Drop every value."""
+
+class LRUCache:
+    """Thread-safe in-process LRU cache bounded by entry count and approximate bytes, with optional TTL."""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        max_bytes: Optional[int] = None,
+        ttl_seconds: Optional[float] = None,
+        on_evict: Optional[Callable[[], None]] = None,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._on_evict = on_evict
+        # key -> (value, size, stored_at)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                return None
+            value, size, stored_at = entry
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any, size: int = 1) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, time.monotonic())
+            self._bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self._bytes > self.max_bytes)
+            ):
+                self._remove(next(iter(self._entries)))
+                if self._on_evict:
+                    self._on_evict()
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def _remove(self, key: Hashable) -> None:
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+def estimate_size(value: Any) -> int:
+    """Approximate the memory footprint of a JSON-like value by its serialized length."""
+    return len(json.dumps(value, default=str))
+
+class UserVersions:
+    """Per-user version counters; bumping a user's version orphans every cache key built from it."""
+
+    def __init__(self):
+        self._versions: Dict[int, int] = {}
+        self._lock = Lock()
+
+    def get(self, user_id: int) -> int:
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id: int) -> int:
+        with self._lock:
+            version = self._versions.get(user_id, 0) + 1
+            self._versions[user_id] = version
+        logger.debug(f"Cache version for user {user_id} bumped to {version}")
+        return version
@@ -0,0 +1,94 @@
+import base64
+import json
+import logging
+from datetime import date
+from typing import Any, Dict, Optional, Sequence
+import numpy as np
+from fastapi import Request
+from fastapi.responses import Response
+from models import Habit
+from progress_store import ProgressCell
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is used without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+# Selected with ?format=compact or by listing this media type in the Accept header
+COMPACT_MEDIA_TYPE = "application/vnd.habits.compact+json"
+COMPACT_VERSION = 1
+
+def wants_compact(request: Request, format: Optional[str]) -> bool:
+    """Return whether a request asked for the compact encoding; an explicit format wins over Accept."""
+    if format is not None:
+        return format == "compact"
+    return COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+
+def pack_bits(bits: np.ndarray) -> str:
+    """Base64 of a 0/1 array packed little-endian: bit i is (byte i // 8) >> (i % 8) & 1."""
+    return base64.b64encode(np.packbits(bits.astype(np.uint8), bitorder="little").tobytes()).decode("ascii")
+
+def encode_grid(habits: Sequence[Habit], cells: Sequence[ProgressCell], start_date: date, end_date: date) -> Dict:
+    """Encode grid cells as parallel arrays.
+
+    Habits that have cells in the range are listed once, in display order, and the
+    (habit, day) matrix is flattened habit-major: bit h * days + d of `present` and
+    `status` is habit h on day start + d. `ids` and `streaks` hold one entry per
+    present cell, in that same order.
+    """
+    days = (end_date - start_date).days + 1
+    index = {habit.id: i for i, habit in enumerate(habits)}
+    habit_idx = np.fromiter((index[cell.habit_id] for cell in cells), dtype=np.intp, count=len(cells))
+    day_idx = np.fromiter(((cell.date - start_date).days for cell in cells), dtype=np.intp, count=len(cells))
+    used = np.unique(habit_idx)
+    # Renumber rows so habits without cells in the range are left out
+    row = np.searchsorted(used, habit_idx)
+    flat = row * days + day_idx
+    order = np.argsort(flat, kind="stable")
+
+    present = np.zeros(len(used) * days, dtype=np.uint8)
+    present[flat] = 1
+    status = np.zeros(len(used) * days, dtype=np.uint8)
+    status[flat] = np.fromiter((cell.status for cell in cells), dtype=np.uint8, count=len(cells))
+    ids = np.fromiter((cell.id for cell in cells), dtype=np.int64, count=len(cells))
+    streaks = np.fromiter((cell.streak for cell in cells), dtype=np.int64, count=len(cells))
+    listed = [habits[i] for i in used.tolist()]
+    return {
+        "format": "compact",
+        "version": COMPACT_VERSION,
+        "start": start_date.isoformat(),
+        "days": days,
+        "habitIds": [habit.id for habit in listed],
+        "habits": [habit.name for habit in listed],
+        "categories": [habit.category for habit in listed],
+        "present": pack_bits(present),
+        "status": pack_bits(status),
+        "ids": ids[order].tolist(),
+        "streaks": streaks[order].tolist(),
+    }
+
+def encode_stats(stats: Dict, start_date: date) -> Dict:
+    """Encode completion analytics with habit names once and per-habit values as parallel arrays."""
+    names = list(stats["completionRates"])
+    stacked = stats["stackedData"]
+    return {
+        "format": "compact",
+        "version": COMPACT_VERSION,
+        "start": start_date.isoformat(),
+        "days": len(stats["dates"]),
+        "habits": names,
+        "completionRates": [stats["completionRates"][name] for name in names],
+        "stackedData": None if stacked is None else [stacked[name] for name in names],
+        "lineData": stats["lineData"],
+    }
+
+class CompactResponse(Response):
+    """JSON response in the compact media type, serialized with orjson when it is installed."""
+    media_type = COMPACT_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, separators=(",", ":")).encode("utf-8")
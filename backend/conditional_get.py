@@ -0,0 +1,63 @@
+import hashlib
+import logging
+from datetime import date
+from typing import Dict, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from compact_encoding import COMPACT_MEDIA_TYPE
+from user_repository import fetch_data_version
+
+logger = logging.getLogger(__name__)
+
+# Clients may keep the response but must revalidate it before every use
+CACHE_CONTROL = "private, no-cache"
+
+def compute_etag(user_id: int, version: int, request: Request) -> str:
+    """Weak ETag for a user's view at a data version.
+
+    The tag covers the path, the query parameters, whether the compact encoding was
+    negotiated, and today's date (several views default to ranges ending today).
+    """
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    compact = COMPACT_MEDIA_TYPE in request.headers.get("accept", "")
+    key = f"{user_id}|{request.url.path}|{query}|{compact}|{date.today().isoformat()}"
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=12).hexdigest()
+    return f'W/"{version}-{digest}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+def _headers_at(request: Request, user_id: int, version: int) -> Dict[str, str]:
+    return {
+        "ETag": compute_etag(user_id, version, request),
+        "Cache-Control": CACHE_CONTROL,
+        "Vary": "Accept",
+    }
+
+async def validator_headers(request: Request, db: AsyncSession, user_id: int) -> Dict[str, str]:
+    """ETag and caching headers for a user's view at their current data version."""
+    return _headers_at(request, user_id, await fetch_data_version(db, user_id))
+
+async def check_not_modified(
+    request: Request, db: AsyncSession, user_id: int
+) -> Tuple[int, Dict[str, str], Optional[Response]]:
+    """Return the data version, the validator headers for a GET and, when If-None-Match matches, a 304 to send instead.
+
+    The data version is read before the view is built, so a write that lands in between
+    yields a response tagged with the older version; the next revalidation then misses
+    and refetches. Bodies served from a per-process cache must be looked up by this same
+    version, so a write committed by another worker cannot pair a new tag with a stale body.
+    """
+    version = await fetch_data_version(db, user_id)
+    headers = _headers_at(request, user_id, version)
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        logger.debug(f"Not modified: {request.url.path} for user {user_id}")
+        return version, headers, Response(status_code=304, headers=headers)
+    return version, headers, None
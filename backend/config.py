@@ -26,11 +26,49 @@ class Config:
     # Authentication & security
     SECRET_KEY: str = os.getenv("SECRET_KEY", "fallback-secret-key")
     GOOGLE_CLIENT_ID: str = os.getenv("GOOGLE_CLIENT_ID", "fallback-client-id")
+    GOOGLE_JWKS_URL: str = os.getenv("GOOGLE_JWKS_URL", "https://www.googleapis.com/oauth2/v3/certs")
+    # Local JWKS file used instead of GOOGLE_JWKS_URL (offline development and tests)
+    GOOGLE_JWKS_FILE: str = os.getenv("GOOGLE_JWKS_FILE", "")
     ALGORITHM: str = os.getenv("ALGORITHM", "HS256")
     ACCESS_TOKEN_EXPIRE_MINUTES: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "60"))
+    # Password hashing pool: concurrent bcrypt workers and how many may wait before 503
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_MAX_QUEUE: int = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+    PASSWORD_HASH_RETRY_AFTER_SECONDS: int = int(os.getenv("PASSWORD_HASH_RETRY_AFTER_SECONDS", "1"))
+    # Verified-token and user-snapshot cache; the TTL is how long a stale snapshot may be served
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
+    AUTH_USER_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "60"))
+
+    # Directory for per-worker metrics files shared by all workers on the host (empty: per-process only)
+    METRICS_DIR: str = os.getenv("METRICS_DIR", "")
 
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///backend/progress.db")
+    # Optional read-only database (e.g. a replica) used by GET routes; empty means DATABASE_URL
+    DATABASE_READ_URL: str = os.getenv("DATABASE_READ_URL", "")
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+    # Applied to every SQLite connection
+    SQLITE_JOURNAL_MODE: str = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS: str = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS: int = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KB: int = int(os.getenv("SQLITE_CACHE_SIZE_KB", "20000"))
+
+    # Analytics result cache (TTL of 0 keeps entries until invalidated or evicted)
+    ANALYTICS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "2048"))
+    ANALYTICS_CACHE_MAX_BYTES: int = int(os.getenv("ANALYTICS_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    ANALYTICS_CACHE_TTL_SECONDS: float = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "300"))
+
+    # Progress storage engine: "rows" (one row per habit per day) or "bitmap" (packed bits per habit-year)
+    PROGRESS_STORAGE: str = os.getenv("PROGRESS_STORAGE", "rows")
+
+    # SQL instrumentation: slow-query log threshold and repeated-statement (N+1) detection
+    SQL_SLOW_QUERY_MS: float = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+    SQL_NPLUSONE_THRESHOLD: int = int(os.getenv("SQL_NPLUSONE_THRESHOLD", "20"))
+    SQL_NPLUSONE_RAISE: bool = os.getenv("SQL_NPLUSONE_RAISE", str(ENV == "development")).lower() == "true"
 
     # CORS
     ALLOWED_ORIGINS: list[str] = os.getenv("ALLOWED_ORIGINS", "").split(",")
@@ -50,10 +88,16 @@ class Config:
         logger = logging.getLogger(__name__)
         if not Config.DATABASE_URL:
             raise ValueError("DATABASE_URL is not set")
+        # Progress upserts use ON CONFLICT, which only these dialects provide
+        backend = Config.DATABASE_URL.split(":", 1)[0].split("+", 1)[0]
+        if backend not in ("sqlite", "postgresql"):
+            raise ValueError(f"Unsupported DATABASE_URL backend: {backend}. Use SQLite or PostgreSQL")
         if Config.SECRET_KEY == "fallback-secret-key":
             logger.warning("Using fallback SECRET_KEY. Set a strong key in .env for security")
         if "*" in Config.ALLOWED_ORIGINS and Config.ENV != "development":
             logger.warning("ALLOWED_ORIGINS includes '*'. This is insecure for production")
+        if Config.PROGRESS_STORAGE not in ("rows", "bitmap"):
+            raise ValueError(f"Invalid PROGRESS_STORAGE: {Config.PROGRESS_STORAGE}. Use 'rows' or 'bitmap'")
         if not 1024 <= Config.PORT <= 65535:
             logger.error(f"Invalid PORT: {Config.PORT}. Resetting to 8001")
             Config.PORT = 8001
@@ -1,26 +1,84 @@
 import logging
 import asyncio
+import sqlite3
 from typing import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.exc import SQLAlchemyError
 from config import Config
 from models import Base  # Import Base from models.py
+from db_instrumentation import instrument_engine
 
 logger = logging.getLogger(__name__)
 
+# recalc_all_streaks compiles to UPDATE ... FROM, added in SQLite 3.33 (window functions need 3.25)
+MIN_SQLITE_VERSION = (3, 33, 0)
+
+def check_sqlite_version() -> None:
+    """Fail at startup rather than on the first streak recalculation when SQLite is too old."""
+    if sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f"Streak recalculation needs SQLite {'.'.join(map(str, MIN_SQLITE_VERSION))}+ "
+            f"for UPDATE ... FROM; found {sqlite3.sqlite_version}"
+        )
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+    """Apply WAL and related pragmas to every new SQLite connection."""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={Config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={Config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(Config.SQLITE_BUSY_TIMEOUT_MS)}")
+        # Negative cache_size is in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(Config.SQLITE_CACHE_SIZE_KB)}")
+    finally:
+        cursor.close()
+
+def create_engine_from_url(database_url: str) -> AsyncEngine:
+    """Create an instrumented async engine with the configured pool and SQLite settings."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        check_sqlite_version()
+    options = {
+        "echo": Config.DEBUG,
+        "pool_pre_ping": Config.DB_POOL_PRE_PING,
+    }
+    # In-memory SQLite uses a single static connection, which takes no pool sizing
+    if not _is_memory_sqlite(url):
+        options.update(
+            pool_size=Config.DB_POOL_SIZE,
+            max_overflow=Config.DB_MAX_OVERFLOW,
+            pool_timeout=Config.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=Config.DB_POOL_RECYCLE_SECONDS,
+        )
+    new_engine = create_async_engine(url, **options)
+    if url.get_backend_name() == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+    instrument_engine(new_engine)
+    return new_engine
+
 # Database engine setup
-engine = create_async_engine(
-    Config.DATABASE_URL,
-    echo=Config.DEBUG,
-)
+engine = create_engine_from_url(Config.DATABASE_URL)
+
+# Optional read-only engine (e.g. a replica) for GET routes; defaults to the primary
+read_engine = create_engine_from_url(Config.DATABASE_READ_URL) if Config.DATABASE_READ_URL else engine
 
-# Async session factory
+# Async session factories
 async_session_maker = sessionmaker(
     bind=engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
+read_session_maker = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
 
 async def init_db(retries: int = 3, delay: float = 2.0) -> None:
     """Initialize the database and create tables with retry logic."""
@@ -48,10 +106,24 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         finally:
             await session.close()
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency for read-only sessions, served by the read engine when configured."""
+    async with read_session_maker() as session:
+        try:
+            yield session
+        except SQLAlchemyError as e:
+            logger.error(f"Read session error: {e}")
+            await session.rollback()
+            raise
+        finally:
+            await session.close()
+
 async def dispose_engine() -> None:
-    """Dispose of the database engine gracefully."""
+    """Dispose of the database engines gracefully."""
     try:
         await engine.dispose()
+        if read_engine is not engine:
+            await read_engine.dispose()
         logger.info("Database engine disposed")
     except Exception as e:
         logger.error(f"Failed to dispose database engine: {e}")
@@ -0,0 +1,74 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar, Token
+from dataclasses import dataclass, field
+from typing import Optional, Set
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class NPlusOneDetected(RuntimeError):
+    """Raised in development when a request repeats one statement shape too often."""
+
+@dataclass
+class RequestQueryStats:
+    """SQL activity of a single request."""
+    correlation_id: str
+    query_count: int = 0
+    total_seconds: float = 0.0
+    shapes: Counter = field(default_factory=Counter)
+    reported_shapes: Set[str] = field(default_factory=set)
+
+_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+def start_request(correlation_id: str) -> Token:
+    """Begin collecting SQL stats for the current request context."""
+    return _request_stats.set(RequestQueryStats(correlation_id))
+
+def finish_request(token: Token) -> Optional[RequestQueryStats]:
+    """Stop collecting and return the request's SQL stats."""
+    stats = _request_stats.get()
+    _request_stats.reset(token)
+    return stats
+
+def current_stats() -> Optional[RequestQueryStats]:
+    return _request_stats.get()
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._query_started
+    stats = _request_stats.get()
+    correlation_id = stats.correlation_id if stats else "N/A"
+
+    if elapsed * 1000 >= Config.SQL_SLOW_QUERY_MS:
+        logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms) - Correlation-ID: {correlation_id} - "
+            f"{statement} - Parameters: {parameters}"
+        )
+    if stats is None:
+        return
+
+    stats.query_count += 1
+    stats.total_seconds += elapsed
+    # Parameters are bound separately, so the statement text is the query's shape
+    stats.shapes[statement] += 1
+    repeats = stats.shapes[statement]
+    if repeats > Config.SQL_NPLUSONE_THRESHOLD and statement not in stats.reported_shapes:
+        stats.reported_shapes.add(statement)
+        message = (
+            f"Possible N+1: statement executed {repeats} times in one request - "
+            f"Correlation-ID: {correlation_id} - {statement}"
+        )
+        logger.warning(message)
+        if Config.SQL_NPLUSONE_RAISE:
+            raise NPlusOneDetected(message)
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Attach query counting, slow-query logging and N+1 detection to an engine."""
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
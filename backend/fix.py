@@ -1,29 +1,227 @@
+"""Backfill missing progress records as not completed for all users or a selected set.
+
+Each user's active habits get a record for every day of the window. Users are processed
+concurrently, each in its own session, and records are written in chunks of one bulk
+INSERT ... ON CONFLICT DO NOTHING (or one bitmap update per habit-year in bitmap
+storage mode), so existing records are never touched. Finished users are recorded in a
+checkpoint file, and rerunning with the same arguments resumes where a crash stopped.
+
+    python fix.py [--user-id N ...] [--days 31] [--end-date YYYY-MM-DD] [--chunk-size 500]
+                  [--concurrency 4] [--checkpoint fix_checkpoint.json] [--restart] [--dry-run]
+"""
+import argparse
 import asyncio
+import json
 import logging
+import os
+import sys
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from database import async_session_maker, init_db
-from logic import fill_missing_data
-from streak_calculations import recalc_all_streaks
-from schemas import ALLOWED_HABITS
+from models import Habit
+from progress_store import get_progress_store
+from user_repository import fetch_habits, UPSERT_CHUNK_SIZE
 
 logger = logging.getLogger(__name__)
 
-async def run_fix(user_id: int = 2) -> None:
-    """Run data consistency fixes and streak recalculation for a user."""
+DEFAULT_CHECKPOINT = "fix_checkpoint.json"
+# Users processed at once; on SQLite their writes still serialize on the database lock
+FIX_CONCURRENCY = 4
+# Log a progress line every this many finished users
+PROGRESS_LOG_INTERVAL = 100
+
+class Checkpoint:
+    """Users already backfilled by a run with the same parameters, persisted as JSON."""
+
+    def __init__(self, path: str, params: Dict[str, Any]):
+        self.path = path
+        self.params = params
+        self.done: set = set()
+        self.created = 0
+
+    def load(self) -> bool:
+        """Load a previous run's progress. Returns False if the file belongs to a run with other parameters."""
+        if not os.path.exists(self.path):
+            return True
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get("params") != self.params:
+            return False
+        self.done = set(state.get("done", []))
+        self.created = state.get("created", 0)
+        return True
+
+    def save(self) -> None:
+        # Write to a temporary file and rename, so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"params": self.params, "done": sorted(self.done), "created": self.created}, f)
+        os.replace(tmp_path, self.path)
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def _backfill_user_ids(db: AsyncSession, user_ids: Optional[Sequence[int]]) -> List[int]:
+    """Return the requested users, or every user with an active habit."""
+    if user_ids:
+        return sorted(set(user_ids))
+    result = await db.execute(select(Habit.user_id).where(Habit.archived.is_(False)).distinct())
+    return sorted(result.scalars().all())
+
+async def _count_missing(db: AsyncSession, user_id: int, habit_ids: Sequence[int], start_date: date, end_date: date) -> int:
+    days = (end_date - start_date).days + 1
+    counts = await get_progress_store().habit_counts(db, user_id, start_date, end_date)
+    wanted = set(habit_ids)
+    existing = sum(total for habit_id, total, _ in counts if habit_id in wanted)
+    return days * len(habit_ids) - existing
+
+async def backfill_missing_progress(
+    session_factory: Callable[[], AsyncSession],
+    user_ids: Optional[Sequence[int]] = None,
+    days: int = 31,
+    end_date: Optional[date] = None,
+    chunk_size: int = UPSERT_CHUNK_SIZE,
+    concurrency: int = FIX_CONCURRENCY,
+    checkpoint: Optional[Checkpoint] = None,
+    dry_run: bool = False,
+) -> int:
+    """Create missing records over the `days` days ending at end_date (default today).
+
+    Returns the number of records created, or that would be created on a dry run.
+    """
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=days - 1)
+    async with session_factory() as db:
+        users = await _backfill_user_ids(db, user_ids)
+    pending = [user_id for user_id in users if checkpoint is None or user_id not in checkpoint.done]
+    if len(pending) < len(users):
+        logger.info(f"Resuming from checkpoint: {len(users) - len(pending)} of {len(users)} users already done")
+    logger.info(
+        f"{'Counting' if dry_run else 'Filling'} missing progress from {start_date} to {end_date} "
+        f"for {len(pending)} users"
+    )
+
+    store = get_progress_store()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    lock = asyncio.Lock()
+    failed = asyncio.Event()
+    created = 0
+    finished = 0
+    started = time.perf_counter()
+
+    async def run_user(user_id: int) -> None:
+        nonlocal created, finished
+        async with semaphore:
+            if failed.is_set():
+                return
+            async with session_factory() as db:
+                habit_ids = [habit.id for habit in await fetch_habits(db, user_id)]
+                if not habit_ids:
+                    count = 0
+                elif dry_run:
+                    count = await _count_missing(db, user_id, habit_ids, start_date, end_date)
+                else:
+                    count = await store.fill_missing(db, user_id, habit_ids, start_date, end_date, chunk_size)
+        async with lock:
+            created += count
+            finished += 1
+            if checkpoint is not None and not dry_run:
+                checkpoint.done.add(user_id)
+                checkpoint.created += count
+                checkpoint.save()
+            if finished % PROGRESS_LOG_INTERVAL == 0:
+                elapsed = time.perf_counter() - started
+                logger.info(f"{finished}/{len(pending)} users, {created} records, {created / elapsed:.0f} rows/sec")
+
+    async def run_or_stop(user_id: int) -> None:
+        try:
+            await run_user(user_id)
+        except BaseException:
+            failed.set()
+            raise
+
+    # After a failure no new user starts; users in flight finish rather than being cancelled,
+    # since cancelling a statement mid-transaction can leak its connection and write lock
+    tasks = [asyncio.create_task(run_or_stop(user_id)) for user_id in pending]
+    try:
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        errors = [result for result in results if isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+    finally:
+        elapsed = time.perf_counter() - started
+        rate = created / elapsed if elapsed > 0 else 0.0
+        logger.info(
+            f"{'Would create' if dry_run else 'Created'} {created} records for {finished} users "
+            f"in {elapsed:.1f}s ({rate:.0f} rows/sec)"
+        )
+    return created
+
+def _parse_date(value: str) -> date:
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date '{value}', expected YYYY-MM-DD")
+
+async def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Backfill missing progress records as not completed.")
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                        help="Limit to a user (repeatable); default is all users with active habits")
+    parser.add_argument("--days", type=int, default=31, help="Days to fill, ending at --end-date")
+    parser.add_argument("--end-date", type=_parse_date, help="Last day to fill (default: today)")
+    parser.add_argument("--chunk-size", type=int, default=UPSERT_CHUNK_SIZE, help="Records per INSERT statement")
+    parser.add_argument("--concurrency", type=int, default=FIX_CONCURRENCY, help="Users processed at once")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="Ignore and replace an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the records that would be created")
+    args = parser.parse_args(argv)
+    if args.days < 1 or args.chunk_size < 1 or args.concurrency < 1:
+        parser.error("--days, --chunk-size and --concurrency must be positive")
+
+    end_date = args.end_date or date.today()
+    checkpoint = None
+    if not args.dry_run:
+        # The end date is pinned so a resumed run fills the same window
+        checkpoint = Checkpoint(args.checkpoint, {
+            "user_ids": sorted(set(args.user_ids)) if args.user_ids else None,
+            "days": args.days,
+            "end_date": end_date.isoformat(),
+        })
+        if args.restart:
+            checkpoint.remove()
+        elif args.end_date is None and os.path.exists(args.checkpoint):
+            with open(args.checkpoint) as f:
+                end_date = date.fromisoformat(json.load(f)["params"]["end_date"])
+            checkpoint.params["end_date"] = end_date.isoformat()
+        if not checkpoint.load():
+            logger.error(
+                f"Checkpoint {args.checkpoint} is from a run with different arguments; "
+                f"rerun with those arguments or pass --restart"
+            )
+            return 1
+
+    await init_db()
     try:
-        await init_db()  # Ensure tables are created
-        async with async_session_maker() as db:
-            logger.info(f"Starting fix for user {user_id}")
-            await fill_missing_data(db, ALLOWED_HABITS, user_id)
-            logger.info("Missing data filled; recalculating streaks...")
-            await recalc_all_streaks(db)
-            logger.info(f"Fix completed successfully for user {user_id}")
+        await backfill_missing_progress(
+            async_session_maker, args.user_ids, args.days, end_date,
+            args.chunk_size, args.concurrency, checkpoint, args.dry_run,
+        )
     except Exception as e:
-        logger.error(f"Fix failed for user {user_id}: {e}")
-        raise  # Re-raise to exit with error code
+        logger.error(f"Backfill failed: {e}")
+        if checkpoint is not None:
+            logger.error(f"Finished users are saved in {args.checkpoint}; rerun with the same arguments to resume")
+        return 1
+    if checkpoint is not None:
+        checkpoint.remove()
+    return 0
 
 if __name__ == "__main__":
     logging.basicConfig(
         level=logging.INFO,
         format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
-    asyncio.run(run_fix())
\ No newline at end of file
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+import re
+import time
+from typing import Dict, List, Optional, Protocol, Tuple
+import httpx
+from jose import jwt, JWTError
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_ISSUERS = ("accounts.google.com", "https://accounts.google.com")
+# Used when the certs response carries no usable Cache-Control max-age
+DEFAULT_KEYS_MAX_AGE_SECONDS = 3600
+# Refresh this long before the advertised expiry, and wait this long between failed attempts
+KEYS_REFRESH_MARGIN_SECONDS = 300
+KEYS_RETRY_SECONDS = 30
+# An unknown kid forces at most one refresh per this interval
+KEYS_MIN_FORCED_REFRESH_SECONDS = 60
+
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+class SigningKeysUnavailable(Exception):
+    """Raised when no Google signing keys can be loaded."""
+
+class KeySource(Protocol):
+    """Where Google's public signing keys (JWKS) come from."""
+
+    async def fetch(self) -> Tuple[List[dict], float]:
+        """Return the JWK dicts and how many seconds they may be cached."""
+
+class HttpJWKSSource:
+    """Loads keys from Google's certs endpoint through the shared pooled client."""
+
+    def __init__(self, client: httpx.AsyncClient, url: str = Config.GOOGLE_JWKS_URL):
+        self.client = client
+        self.url = url
+
+    async def fetch(self) -> Tuple[List[dict], float]:
+        response = await self.client.get(self.url)
+        response.raise_for_status()
+        match = _MAX_AGE_RE.search(response.headers.get("cache-control", ""))
+        max_age = int(match.group(1)) if match else DEFAULT_KEYS_MAX_AGE_SECONDS
+        return response.json()["keys"], max_age
+
+class FileJWKSSource:
+    """Loads keys from a local JWKS file, e.g. a test fixture for offline runs."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    async def fetch(self) -> Tuple[List[dict], float]:
+        with open(self.path) as f:
+            return json.load(f)["keys"], DEFAULT_KEYS_MAX_AGE_SECONDS
+
+class GoogleKeyStore:
+    """Caches signing keys by kid and refreshes them in the background before they expire."""
+
+    def __init__(self, source: KeySource):
+        self.source = source
+        self._keys: Dict[str, dict] = {}
+        self._expires_at = 0.0
+        self._last_refresh = 0.0
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def refresh(self) -> None:
+        """Fetch the current key set, replacing the cached one."""
+        keys, max_age = await self.source.fetch()
+        self._keys = {key["kid"]: key for key in keys}
+        self._last_refresh = time.monotonic()
+        self._expires_at = self._last_refresh + max_age
+        logger.info(f"Loaded {len(self._keys)} Google signing keys, valid for {max_age}s")
+
+    async def get_key(self, kid: str) -> dict:
+        """Return the key for kid, refreshing when the set is expired or the kid is unknown."""
+        key = self._keys.get(kid)
+        if key is not None and time.monotonic() < self._expires_at:
+            return key
+        async with self._lock:
+            now = time.monotonic()
+            stale = now >= self._expires_at
+            unknown = kid not in self._keys and now - self._last_refresh >= KEYS_MIN_FORCED_REFRESH_SECONDS
+            if stale or unknown:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    logger.warning(f"Failed to refresh Google signing keys: {e}")
+                    if not self._keys:
+                        raise SigningKeysUnavailable(str(e)) from e
+        key = self._keys.get(kid)
+        if key is None:
+            raise JWTError(f"Unknown signing key id '{kid}'")
+        return key
+
+    async def start(self) -> None:
+        """Load the keys and start the background refresh task."""
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Initial Google signing key load failed, will retry: {e}")
+            self._expires_at = time.monotonic() + KEYS_RETRY_SECONDS
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            delay = max(KEYS_RETRY_SECONDS, self._expires_at - time.monotonic() - KEYS_REFRESH_MARGIN_SECONDS)
+            await asyncio.sleep(delay)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.warning(f"Background refresh of Google signing keys failed: {e}")
+
+_http_client: Optional[httpx.AsyncClient] = None
+_key_store: Optional[GoogleKeyStore] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the app-wide pooled HTTP client, creating it on first use."""
+    global _http_client
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(5.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+    return _http_client
+
+def get_key_store() -> GoogleKeyStore:
+    """Return the key store, using GOOGLE_JWKS_FILE when set and the certs endpoint otherwise."""
+    global _key_store
+    if _key_store is None:
+        if Config.GOOGLE_JWKS_FILE:
+            source: KeySource = FileJWKSSource(Config.GOOGLE_JWKS_FILE)
+        else:
+            source = HttpJWKSSource(get_http_client())
+        _key_store = GoogleKeyStore(source)
+    return _key_store
+
+def set_key_source(source: KeySource) -> GoogleKeyStore:
+    """Replace the key source, e.g. with a fixture in tests."""
+    global _key_store
+    _key_store = GoogleKeyStore(source)
+    return _key_store
+
+async def startup() -> None:
+    await get_key_store().start()
+
+async def shutdown() -> None:
+    global _http_client
+    if _key_store is not None:
+        await _key_store.stop()
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def verify_id_token(id_token: str) -> dict:
+    """Verify a Google ID token's signature, audience, issuer and expiry locally and return its claims."""
+    kid = jwt.get_unverified_header(id_token).get("kid")
+    key = await get_key_store().get_key(kid)
+    return jwt.decode(
+        id_token,
+        key,
+        algorithms=[key.get("alg", "RS256")],
+        audience=Config.GOOGLE_CLIENT_ID,
+        issuer=GOOGLE_ISSUERS,
+    )
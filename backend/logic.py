@@ -1,26 +1,37 @@
 import logging
 from datetime import date, timedelta
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
+import numpy as np
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from schemas import ProgressCreate, ProgressRead, ProgressUpdate, BulkUpdate
-from user_repository import (
-    fetch_all_progress_by_date, fetch_progress_date_range, fetch_all_habits,
-    update_progress_status, fetch_progress_by_date_and_habit
-)
-from models import Progress
+from schemas import ProgressCreate, ProgressRead, ProgressUpdate, BulkUpdate, ProgressChanges
+from user_repository import fetch_habits, ensure_habits
+from models import Habit
+from progress_store import ChangeCursor, ProgressCell, get_progress_store
+from compact_encoding import encode_grid
 
 logger = logging.getLogger(__name__)
 
+# Longest window served by the progress grid endpoint
+MAX_GRID_DAYS = 366
+# Page size bounds of the change feed
+DEFAULT_CHANGES_LIMIT = 1000
+MAX_CHANGES_LIMIT = 5000
+
+def to_progress_read(row: ProgressCell, habit: Habit, completion_pct: Optional[float] = None) -> ProgressRead:
+    """Build the API representation of a progress cell and its habit."""
+    return ProgressRead(
+        id=row.id, date=row.date, habit=habit.name,
+        status=row.status, streak=row.streak, completion_pct=completion_pct,
+        category=habit.category
+    )
+
 async def update_progress(progress: ProgressCreate, db: AsyncSession, user_id: int) -> None:
     """Update a single habit progress entry."""
     habit_str = progress.habit
     try:
-        await update_progress_status(
-            db=db, date_obj=progress.date, habit=habit_str, user_id=user_id,
-            updates={"status": progress.status}
-        )
+        habit_ids = await ensure_habits(db, user_id, [habit_str], {habit_str: progress.category})
+        await get_progress_store().write_statuses(db, user_id, progress.date, {habit_ids[habit_str]: progress.status})
         logger.info(f"Updated progress for {habit_str} on {progress.date} for user {user_id}")
     except Exception as e:
         logger.error(f"Error updating progress: {e}")
@@ -29,11 +40,10 @@ async def update_progress(progress: ProgressCreate, db: AsyncSession, user_id: i
 async def bulk_update_progress(data: BulkUpdate, db: AsyncSession, user_id: int) -> None:
     """Update multiple habit progress entries for a specific date."""
     try:
-        for habit, status in data.updates.items():  # Adjusted to dict structure
-            await update_progress_status(
-                db=db, date_obj=data.date, habit=habit, user_id=user_id,
-                updates={"status": status}
-            )
+        habit_ids = await ensure_habits(db, user_id, data.updates.keys())
+        await get_progress_store().write_statuses(
+            db, user_id, data.date, {habit_ids[habit]: status for habit, status in data.updates.items()}
+        )
         logger.info(f"Bulk update successful for date {data.date} for user {user_id}")
     except Exception as e:
         logger.error(f"Bulk update failed: {e}")
@@ -42,198 +52,191 @@ async def bulk_update_progress(data: BulkUpdate, db: AsyncSession, user_id: int)
 async def get_progress_by_date(date_obj: date, db: AsyncSession, user_id: int) -> List[ProgressRead]:
     """Get progress for all habits on a specific date."""
     try:
-        # Fetch all habits for the user
-        habits = await fetch_all_habits(db, user_id)
+        # Fetch the user's active habits
+        habits = await fetch_habits(db, user_id)
         if not habits:
             logger.info(f"No habits found for user {user_id}, returning empty progress")
             return []
 
-        rows = await fetch_all_progress_by_date(db, date_obj, user_id)
-        row_map = {r.habit: r for r in rows}
-        completed = sum(1 for r in rows if r.status)
+        # Missing habits for the day are materialized as not completed
+        cells = await get_progress_store().day_cells(db, user_id, date_obj, [habit.id for habit in habits])
+        completed = sum(1 for cell in cells.values() if cell.status)
         completion_pct = round((completed / len(habits)) * 100) if habits else 0
-
-        results: List[ProgressRead] = []
-        for habit in habits:
-            if habit in row_map:
-                row = row_map[habit]
-                results.append(ProgressRead(
-                    id=row.id, date=row.date, habit=row.habit,
-                    status=row.status, streak=row.streak, completion_pct=completion_pct,
-                    category=row.category  # Include category
-                ))
-            else:
-                await update_progress_status(
-                    db=db, date_obj=date_obj, habit=habit, user_id=user_id,
-                    updates={"status": False}
-                )
-                new_record = await fetch_progress_by_date_and_habit(db, date_obj, habit, user_id)
-                results.append(ProgressRead(
-                    id=new_record.id, date=new_record.date, habit=new_record.habit,
-                    status=new_record.status, streak=new_record.streak, completion_pct=completion_pct,
-                    category=new_record.category  # Include category
-                ))
-        return results
+        return [to_progress_read(cells[habit.id], habit, completion_pct) for habit in habits]
     except Exception as e:
         logger.error(f"Error fetching progress for {date_obj}: {e}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch progress: {str(e)}")
 
-async def get_weekly_progress(db: AsyncSession, user_id: int, start_date: Optional[date] = None) -> List[ProgressRead]:
-    """Fetch progress for the last 7 days for each habit."""
-    today = date.today()
-    week_start = start_date or (today - timedelta(days=6))
+async def fetch_progress_grid_cells(
+    db: AsyncSession, user_id: int, start_date: date, end_date: date
+) -> Tuple[Dict[int, Habit], List[ProgressCell]]:
+    """Return {habit_id: habit} (archived included) and the store's cells for a date range.
+
+    Cells are ordered by date then habit display order; (date, habit) cells without a
+    record are omitted.
+    """
+    habits = {habit.id: habit for habit in await fetch_habits(db, user_id, include_archived=True)}
+    cells = await get_progress_store().range_cells(db, user_id, start_date, end_date)
+    return habits, cells
+
+async def get_progress_grid(db: AsyncSession, user_id: int, start_date: date, end_date: date) -> List[ProgressRead]:
+    """Fetch the habit x date grid for an inclusive date range.
+
+    Cells come from the store already ordered by date then habit, so the grid is
+    built in one pass; (date, habit) cells without a record are omitted. Archived
+    habits keep their history in the grid.
+    """
     try:
-        habits = await fetch_all_habits(db, user_id)
-        if not habits:
-            logger.info(f"No habits found for user {user_id}, returning empty weekly progress")
-            return []
-
-        # Fetch all existing records for the date range
-        rows = await fetch_progress_date_range(db, week_start, today, user_id)
-        row_map = {(row.date, row.habit): row for row in rows}
-        results: List[ProgressRead] = []
-
-        for i in range(7):
-            current_date = week_start + timedelta(days=i)
-            for habit in habits:
-                key = (current_date, habit)
-                if key in row_map:
-                    row = row_map[key]
-                    results.append(ProgressRead(
-                        id=row.id, date=row.date, habit=row.habit,
-                        status=row.status, streak=row.streak, completion_pct=None,
-                        category=row.category
-                    ))
-                else:
-                    # Check for existence explicitly before creating
-                    existing = await fetch_progress_by_date_and_habit(db, current_date, habit, user_id)
-                    if existing:
-                        results.append(ProgressRead(
-                            id=existing.id, date=existing.date, habit=existing.habit,
-                            status=existing.status, streak=existing.streak, completion_pct=None,
-                            category=existing.category
-                        ))
-                    # Optionally skip creation here and assume records are created elsewhere
-                    # else:
-                    #     await update_progress_status(
-                    #         db=db, date_obj=current_date, habit=habit, user_id=user_id,
-                    #         updates={"status": False}
-                    #     )
-                    #     new_record = await fetch_progress_by_date_and_habit(db, current_date, habit, user_id)
-                    #     results.append(ProgressRead(
-                    #         id=new_record.id, date=new_record.date, habit=new_record.habit,
-                    #         status=new_record.status, streak=new_record.streak, completion_pct=None,
-                    #         category=new_record.category
-                    #     ))
-        logger.info(f"Weekly progress fetched for user {user_id}")
+        habits, cells = await fetch_progress_grid_cells(db, user_id, start_date, end_date)
+        results = [to_progress_read(cell, habits[cell.habit_id]) for cell in cells]
+        logger.info(f"Progress grid {start_date}..{end_date} fetched for user {user_id}: {len(results)} cells")
         return results
     except Exception as e:
-        logger.error(f"Error fetching weekly progress: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to fetch weekly progress: {str(e)}")
+        logger.error(f"Error fetching progress grid {start_date}..{end_date}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch progress grid: {str(e)}")
+
+async def get_progress_grid_compact(db: AsyncSession, user_id: int, start_date: date, end_date: date) -> Dict:
+    """Fetch the grid for a date range in the compact columnar encoding, without per-cell models."""
+    try:
+        habits, cells = await fetch_progress_grid_cells(db, user_id, start_date, end_date)
+        logger.info(f"Compact progress grid {start_date}..{end_date} fetched for user {user_id}: {len(cells)} cells")
+        return encode_grid(list(habits.values()), cells, start_date, end_date)
+    except Exception as e:
+        logger.error(f"Error fetching compact progress grid {start_date}..{end_date}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch progress grid: {str(e)}")
+
+def week_range(start_date: Optional[date] = None) -> Tuple[date, date]:
+    """Return the 7 days starting at start_date (default: the last 7 days)."""
+    week_start = start_date or (date.today() - timedelta(days=6))
+    return week_start, week_start + timedelta(days=6)
 
-async def get_completion_stats(db: AsyncSession, user_id: int, start_date: date, end_date: date) -> Dict:
+async def get_weekly_progress(db: AsyncSession, user_id: int, start_date: Optional[date] = None) -> List[ProgressRead]:
+    """Fetch progress for the 7 days starting at start_date (default: the last 7 days)."""
+    return await get_progress_grid(db, user_id, *week_range(start_date))
+
+async def get_completion_stats(
+    db: AsyncSession, user_id: int, start_date: date, end_date: date, include_habits: bool = True
+) -> Dict:
+    """Build completion analytics for a date range.
+
+    Per-habit rates and stackedData come from the store's (habit, day) count matrix, and
+    lineData from its column sums. With include_habits=False only per-day and per-habit
+    totals are read and stackedData is omitted. Row storage serves all of them from the
+    daily rollup, one row per day.
+    """
+    store = get_progress_store()
     # Calculate number of days in range
     days_diff = (end_date - start_date).days + 1
-    dates = [start_date + timedelta(days=i) for i in range(days_diff)]
-
-    # Query progress records using modern async syntax
-    stmt = (
-        select(Progress)
-        .where(
-            Progress.user_id == user_id,
-            Progress.date >= start_date,
-            Progress.date <= end_date
-        )
-    )
-    result = await db.execute(stmt)
-    results = result.scalars().all()  # Fetch all Progress objects
+    dates = np.arange(start_date, end_date + timedelta(days=1), dtype="datetime64[D]").astype(str).tolist()
+    habit_names = {habit.id: habit.name for habit in await fetch_habits(db, user_id, include_archived=True)}
+
+    if not include_habits:
+        # lineData from per-day counts; days without records stay 0.0
+        day_completed = np.zeros(days_diff)
+        day_totals = np.zeros(days_diff)
+        daily = await store.daily_counts(db, user_id, start_date, end_date)
+        if daily:
+            daily_dates, daily_completed, daily_total = zip(*daily)
+            daily_idx = (np.array(daily_dates, dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.intp)
+            day_completed[daily_idx] = daily_completed
+            day_totals[daily_idx] = daily_total
+        habit_rows = await store.habit_counts(db, user_id, start_date, end_date)
+        return {
+            "completionRates": {
+                habit_names[habit_id]: completed / total for habit_id, total, completed in habit_rows
+            },
+            "stackedData": None,
+            "dates": dates,
+            "lineData": _line_data(day_completed, day_totals)
+        }
 
-    if not results:
+    matrix = await store.completion_matrix(db, user_id, start_date, end_date)
+    if not matrix.habit_ids:
         return {
             "completionRates": {},
             "stackedData": {},
-            "dates": [d.isoformat() for d in dates],
+            "dates": dates,
             "lineData": [0.0] * days_diff
         }
 
-    # Calculate completion rates per habit
-    habit_counts: Dict[str, int] = {}
-    habit_totals: Dict[str, int] = {}
-    daily_totals: Dict[str, Dict[str, int]] = {d.isoformat(): {"completed": 0, "total": 0} for d in dates}
-
-    for progress in results:
-        habit = progress.habit
-        date_str = progress.date.isoformat()
-        habit_counts[habit] = habit_counts.get(habit, 0) + (1 if progress.status else 0)
-        habit_totals[habit] = habit_totals.get(habit, 0) + 1
-        daily_totals[date_str]["completed"] += 1 if progress.status else 0
-        daily_totals[date_str]["total"] += 1
-
-    completion_rates = {
-        habit: habit_counts[habit] / habit_totals[habit] if habit_totals[habit] > 0 else 0.0
-        for habit in habit_totals
-    }
+    # Habits keyed by name, in name order
+    names = [habit_names[habit_id] for habit_id in matrix.habit_ids]
+    order = np.argsort(np.array(names, dtype=object))
+    names = [names[i] for i in order]
 
-    # Build stackedData (daily counts per habit)
-    stacked_data: Dict[str, List[int]] = {habit: [0] * days_diff for habit in habit_totals}
-    for progress in results:
-        habit = progress.habit
-        day_index = (progress.date - start_date).days
-        if progress.status:
-            stacked_data[habit][day_index] += 1
-
-    # Calculate lineData (daily completion percentages)
-    line_data = [
-        (daily_totals[d.isoformat()]["completed"] / daily_totals[d.isoformat()]["total"] * 100)
-        if daily_totals[d.isoformat()]["total"] > 0 else 0.0
-        for d in dates
-    ]
+    # Completion rate per habit over the whole range
+    habit_completed = matrix.completed[order].sum(axis=1)
+    habit_totals = matrix.totals[order].sum(axis=1)
+    completion_rates = dict(zip(names, (habit_completed / habit_totals).tolist()))
+
+    # stackedData: daily completed counts per habit
+    stacked_data = dict(zip(names, matrix.completed[order].tolist()))
 
     return {
         "completionRates": completion_rates,
         "stackedData": stacked_data,
-        "dates": [d.isoformat() for d in dates],
-        "lineData": line_data
+        "dates": dates,
+        "lineData": _line_data(matrix.completed.sum(axis=0), matrix.totals.sum(axis=0))
     }
 
-async def fill_missing_data(db: AsyncSession, habits: List[str], user_id: int) -> None:
-    """Fill missing progress records with default status=False for a user."""
+def _line_data(completed: np.ndarray, totals: np.ndarray) -> List[float]:
+    """Daily completion percentages, 0.0 for days without records."""
+    completed = np.asarray(completed, dtype=np.float64)
+    totals = np.asarray(totals, dtype=np.float64)
+    return (np.divide(completed, totals, out=np.zeros(len(totals)), where=totals > 0) * 100).tolist()
+
+async def fill_missing_data(db: AsyncSession, habits: List[str], user_id: int, days: int = 31) -> int:
+    """Fill missing progress records with default status=False for a user over the last `days` days."""
     today = date.today()
     try:
-        for habit in habits:
-            for i in range(31):  # Last 30 days + today
-                current_date = today - timedelta(days=i)
-                await update_progress_status(
-                    db=db, date_obj=current_date, habit=habit, user_id=user_id,
-                    updates={"status": False}
-                )
-        logger.info(f"Missing data filled for user {user_id}")
+        habit_ids = await ensure_habits(db, user_id, habits)
+        created = await get_progress_store().fill_missing(
+            db, user_id, [habit_ids[habit] for habit in habits], today - timedelta(days=days - 1), today
+        )
+        logger.info(f"Missing data filled for user {user_id}: {created} records created")
+        return created
     except Exception as e:
         logger.error(f"Error filling missing data for user {user_id}: {e}")
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to fill missing data: {str(e)}")
 
 async def patch_progress_record(progress_id: int, updates: ProgressUpdate, db: AsyncSession, user_id: int) -> ProgressRead:
-    """Patch a specific progress record by ID."""
+    """Patch a specific progress record by ID and return it with its recalculated streak."""
     try:
-        result = await db.execute(select(Progress).where(Progress.id == progress_id, Progress.user_id == user_id))
-        record = result.scalar_one_or_none()
-        if not record:
-            raise HTTPException(status_code=404, detail="Progress record not found or unauthorized")
         updates_dict = updates.dict(exclude_unset=True)
         if not updates_dict:
             raise HTTPException(status_code=400, detail="No fields provided for update")
-        for key, value in updates_dict.items():
-            setattr(record, key, value)
-        await db.commit()
-        await db.refresh(record)
-        return ProgressRead(
-            id=record.id, date=record.date, habit=record.habit,
-            status=record.status, streak=record.streak, category=record.category
-        )
+        cell = await get_progress_store().update_cell(db, user_id, progress_id, updates_dict)
+        if cell is None:
+            raise HTTPException(status_code=404, detail="Progress record not found or unauthorized")
+        return to_progress_read(cell, await db.get(Habit, cell.habit_id))
     except HTTPException as he:
         raise he
     except Exception as e:
         logger.error(f"Error patching progress record {progress_id}: {e}")
         await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Failed to patch progress record: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to patch progress record: {str(e)}")
+
+async def get_progress_changes(
+    db: AsyncSession, user_id: int, since: Optional[str], limit: int = DEFAULT_CHANGES_LIMIT
+) -> ProgressChanges:
+    """Fetch progress records written after a change feed cursor, plus deleted record ids.
+
+    Without since every record is returned, paged like any other sync. Streak changes made
+    by recalculation are included, and a habit rename re-sends that habit's records.
+    """
+    try:
+        cursor = ChangeCursor.parse(since) if since is not None else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid change cursor")
+    try:
+        batch = await get_progress_store().changes_since(db, user_id, cursor, limit)
+        habits = {habit.id: habit for habit in await fetch_habits(db, user_id, include_archived=True)}
+        logger.info(f"Change feed for user {user_id} since {since}: {len(batch.cells)} changed, {len(batch.deleted)} deleted")
+        return ProgressChanges(
+            changes=[to_progress_read(cell, habits[cell.habit_id]) for cell in batch.cells],
+            deleted=batch.deleted, cursor=str(batch.cursor), hasMore=batch.has_more,
+        )
+    except Exception as e:
+        logger.error(f"Error fetching progress changes for user {user_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch progress changes: {str(e)}")
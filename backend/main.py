@@ -7,6 +7,11 @@ from config import Config, configure_logging
 from database import dispose_engine, init_db
 from routes import router as api_router
 from middleware import MetricsMiddleware
+from streak_queue import streak_queue
+import google_auth
+from password_hashing import password_hasher
+from rollup import backfill_rollups_if_empty
+from database import async_session_maker
 from exceptions import validation_exception_handler, general_exception_handler
 
 # Configure logging
@@ -17,7 +22,13 @@ configure_logging()
 async def lifespan(app: FastAPI):
     """Handle startup and shutdown events."""
     await init_db()  # Startup
+    await backfill_rollups_if_empty(async_session_maker)
+    await streak_queue.start()
+    await google_auth.startup()
     yield
+    await google_auth.shutdown()
+    await streak_queue.stop()
+    password_hasher.shutdown()
     await dispose_engine()  # Shutdown
 
 # Create FastAPI app
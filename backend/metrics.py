@@ -0,0 +1,158 @@
+import bisect
+import logging
+import os
+from threading import Lock
+from typing import Dict, List, Sequence, Tuple
+from shared_metrics import shared_metrics
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds; the implicit +Inf bucket catches the rest
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128)
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """Per-route request metrics keyed by (method, route template), for this worker process only."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.response_size: Dict[Tuple[str, str], Histogram] = {}
+        self.db_queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_seconds: Dict[Tuple[str, str], float] = {}
+        self._lock = Lock()
+
+    def observe(self, method: str, route: str, status: int, duration: float, size: int) -> None:
+        key = (method, route)
+        with self._lock:
+            self.requests[(method, route, status)] = self.requests.get((method, route, status), 0) + 1
+            latency = self.latency.get(key)
+            if latency is None:
+                latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+                self.response_size[key] = Histogram(SIZE_BUCKETS)
+            latency.observe(duration)
+            self.response_size[key].observe(size)
+
+    def observe_queries(self, method: str, route: str, query_count: int, db_seconds: float) -> None:
+        key = (method, route)
+        with self._lock:
+            queries = self.db_queries.get(key)
+            if queries is None:
+                queries = self.db_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            queries.observe(query_count)
+            self.db_seconds[key] = self.db_seconds.get(key, 0.0) + db_seconds
+
+    def render_prometheus(self) -> str:
+        """Render every metric in the Prometheus text exposition format (0.0.4).
+
+        The app_* and http_host_* series are aggregated across every worker on the host
+        from the shared metrics store. The remaining http_* series come from this worker's
+        registry and carry a pid label, since each scrape may land on a different worker.
+        """
+        host = shared_metrics.aggregate()
+        pid = os.getpid()
+        lines = [
+            "# HELP app_uptime_seconds Seconds since the oldest live worker started.",
+            "# TYPE app_uptime_seconds gauge",
+            f"app_uptime_seconds {host['uptime_seconds']}",
+            "# HELP app_workers Worker processes reporting into the shared metrics store.",
+            "# TYPE app_workers gauge",
+            f"app_workers {host['workers']}",
+            "# HELP app_requests_total Completed requests across every worker.",
+            "# TYPE app_requests_total counter",
+            f"app_requests_total {host['total_requests']}",
+            "# HELP app_errors_total Requests across every worker that raised or returned a 5xx.",
+            "# TYPE app_errors_total counter",
+            f"app_errors_total {host['total_errors']}",
+        ]
+        lines += self._render_host_routes(host["routes"])
+        lines += [
+            "# HELP http_requests_in_flight Requests currently being served by this worker.",
+            "# TYPE http_requests_in_flight gauge",
+            f'http_requests_in_flight{{pid="{pid}"}} {self.in_flight}',
+            "# HELP http_requests_total Completed requests on this worker by route template and status code.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self._lock:
+            for (method, route, code), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{pid="{pid}",method="{method}",route="{route}",status="{code}"}} {count}')
+            lines += self._render_histograms(
+                "http_request_duration_seconds", "Request latency on this worker by route template.", self.latency, pid
+            )
+            lines += self._render_histograms(
+                "http_response_size_bytes", "Response body size on this worker by route template.", self.response_size, pid
+            )
+            lines += self._render_histograms(
+                "http_request_db_queries", "SQL statements executed per request on this worker by route template.",
+                self.db_queries, pid
+            )
+            lines += [
+                "# HELP http_request_db_seconds_total Time spent in SQL statements on this worker by route template.",
+                "# TYPE http_request_db_seconds_total counter",
+            ]
+            for (method, route), seconds in sorted(self.db_seconds.items()):
+                lines.append(f'http_request_db_seconds_total{{pid="{pid}",method="{method}",route="{route}"}} {seconds}')
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_host_routes(routes: Dict[str, dict]) -> List[str]:
+        lines = [
+            "# HELP http_host_requests_total Completed requests across every worker by route template.",
+            "# TYPE http_host_requests_total counter",
+        ]
+        labels = {}
+        for name in routes:
+            method, _, route = name.partition(" ")
+            labels[name] = f'method="{method}",route="{route}"' if route else f'method="",route="{name}"'
+        for name, stats in routes.items():
+            lines.append(f"http_host_requests_total{{{labels[name]}}} {stats['requests']}")
+        lines += [
+            "# HELP http_host_request_errors_total Failed requests across every worker by route template.",
+            "# TYPE http_host_request_errors_total counter",
+        ]
+        for name, stats in routes.items():
+            lines.append(f"http_host_request_errors_total{{{labels[name]}}} {stats['errors']}")
+        lines += [
+            "# HELP http_host_request_duration_seconds Request latency quantiles across every worker (~2% relative error).",
+            "# TYPE http_host_request_duration_seconds summary",
+        ]
+        for name, stats in routes.items():
+            for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                lines.append(
+                    f'http_host_request_duration_seconds{{{labels[name]},quantile="{quantile}"}} {round(stats[key] / 1000, 6)}'
+                )
+            lines.append(f"http_host_request_duration_seconds_count{{{labels[name]}}} {stats['requests']}")
+        return lines
+
+    @staticmethod
+    def _render_histograms(
+        name: str, help_text: str, histograms: Dict[Tuple[str, str], Histogram], pid: int
+    ) -> List[str]:
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for (method, route), histogram in sorted(histograms.items()):
+            labels = f'pid="{pid}",method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+            lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+metrics = MetricsRegistry()
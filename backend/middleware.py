@@ -1,35 +1,72 @@
+import itertools
 import logging
+import time
 import uuid
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
 from application_status import ApplicationStatus
+from metrics import metrics
+from shared_metrics import shared_metrics
+from db_instrumentation import start_request, finish_request
 
 logger = logging.getLogger(__name__)
 
-class MetricsMiddleware(BaseHTTPMiddleware):
-    """Middleware to log requests and track metrics."""
-    async def dispatch(self, request: Request, call_next) -> Response:
-        correlation_id = str(uuid.uuid4())
-        request.state.correlation_id = correlation_id
+# Correlation IDs are a per-process random prefix plus a counter: unique and far cheaper than uuid4 per request
+_CORRELATION_PREFIX = uuid.uuid4().hex[:12]
+_correlation_counter = itertools.count(1)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware that assigns correlation IDs and records per-route metrics."""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        correlation_id = f"{_CORRELATION_PREFIX}-{next(_correlation_counter):x}"
+        scope.setdefault("state", {})["correlation_id"] = correlation_id
         ApplicationStatus.increment_request()
+        status_code = 500
+        response_size = 0
 
+        async def send_with_metrics(message: Message) -> None:
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        metrics.in_flight += 1
+        query_stats_token = start_request(correlation_id)
+        start = time.perf_counter()
+        failed = False
         try:
-            response = await call_next(request)
-            logger.info(
-                f"[Request] {request.method} {request.url.path} - "
-                f"Status: {response.status_code} "
-                f"Content-Type: {response.headers.get('content-type', 'unknown')} "
-                f"Correlation-ID: {correlation_id}"
-            )
-            if "content-length" in response.headers:
-                del response.headers["content-length"]
-            return response
+            await self.app(scope, receive, send_with_metrics)
         except Exception as e:
+            failed = True
             ApplicationStatus.increment_error()
             logger.error(
                 f"Unexpected error: {str(e)} - "
-                f"Request: {request.method} {request.url} - "
+                f"Request: {scope['method']} {scope['path']} - "
                 f"Correlation-ID: {correlation_id}"
             )
-            raise
\ No newline at end of file
+            raise
+        finally:
+            metrics.in_flight -= 1
+            query_stats = finish_request(query_stats_token)
+            route = scope.get("route")
+            # Label by route template so path parameters don't explode cardinality
+            route_path = getattr(route, "path", None) or "unmatched"
+            duration = time.perf_counter() - start
+            metrics.observe(scope["method"], route_path, status_code, duration, response_size)
+            metrics.observe_queries(scope["method"], route_path, query_stats.query_count, query_stats.total_seconds)
+            shared_metrics.record(f"{scope['method']} {route_path}", duration, failed or status_code >= 500)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    f"[Request] {scope['method']} {scope['path']} - Status: {status_code} "
+                    f"Queries: {query_stats.query_count} ({query_stats.total_seconds * 1000:.1f} ms) "
+                    f"Correlation-ID: {correlation_id}"
+                )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, Date, ForeignKey, Index, UniqueConstraint, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -14,27 +14,109 @@ class User(Base):
     password_hash = Column(String, nullable=True)
     name = Column(String, nullable=True)
     avatar_url = Column(String, nullable=True)
+    # Bumped by every write to the user's data; ETags for conditional GETs derive from it
+    data_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     progress = relationship("Progress", back_populates="user", cascade="all, delete-orphan")
+    habits = relationship("Habit", back_populates="user", cascade="all, delete-orphan")
 
     def __repr__(self) -> str:
         return f"User(id={self.id}, email='{self.email}', name='{self.name}')"
 
+class Habit(Base):
+    """A user's habit; progress rows reference it by id."""
+    __tablename__ = "habits"
+    # The unique index also serves the per-user habit listing
+    __table_args__ = (UniqueConstraint("user_id", "name", name="uq_habits_user_name"),)
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    name = Column(String, nullable=False)
+    category = Column(String, nullable=True)
+    archived = Column(Boolean, nullable=False, default=False)
+    sort_order = Column(Integer, nullable=False, default=0)
+
+    user = relationship("User", back_populates="habits")
+
+    def __repr__(self) -> str:
+        return f"Habit(id={self.id}, user_id={self.user_id}, name='{self.name}', archived={self.archived})"
+
 class Progress(Base):
     """Model for tracking daily habit completion and streaks."""
     __tablename__ = "progress"
-    __table_args__ = (UniqueConstraint("user_id", "date", "habit", name="uq_progress_user_date_habit"),)
+    __table_args__ = (
+        # Also serves (user_id, date) range scans through its leading columns
+        UniqueConstraint("user_id", "date", "habit_id", name="uq_progress_user_date_habit"),
+        # Per-series access: streak scans and per-habit history ordered by date
+        Index("ix_progress_user_habit_date", "user_id", "habit_id", "date"),
+        # Change feed scans
+        Index("ix_progress_user_change_seq", "user_id", "change_seq"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    date = Column(Date, nullable=False, index=True)
-    habit = Column(String, nullable=False, index=True)
+    date = Column(Date, nullable=False)
+    habit_id = Column(Integer, ForeignKey("habits.id"), nullable=False)
     status = Column(Boolean, nullable=False, default=False)
     streak = Column(Integer, nullable=False, default=0)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
-    category = Column(String, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # The owner's data_version as of the last write to this record (0: not written since tracking began)
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
 
     user = relationship("User", back_populates="progress")
 
     def __repr__(self) -> str:
-        return (f"Progress(id={self.id}, date={self.date}, habit='{self.habit}', "
-                f"status={self.status}, streak={self.streak}, user_id={self.user_id})")
\ No newline at end of file
+        return (f"Progress(id={self.id}, date={self.date}, habit_id={self.habit_id}, "
+                f"status={self.status}, streak={self.streak}, user_id={self.user_id})")
+
+class ProgressTombstone(Base):
+    """A deleted progress record, kept so the change feed can report the deletion."""
+    __tablename__ = "progress_tombstones"
+    __table_args__ = (Index("ix_progress_tombstones_user_change_seq", "user_id", "change_seq"),)
+
+    id = Column(Integer, primary_key=True)  # The deleted record's id
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    habit_id = Column(Integer, nullable=False)
+    date = Column(Date, nullable=False)
+    change_seq = Column(Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"ProgressTombstone(id={self.id}, user_id={self.user_id}, change_seq={self.change_seq})"
+
+class DailyProgressRollup(Base):
+    """Per-user daily completion counts, kept in sync with progress on every write.
+
+    Analytics read one of these rows per day instead of one progress row per habit per day.
+    """
+    __tablename__ = "progress_daily_rollup"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    date = Column(Date, primary_key=True)
+    completed_count = Column(Integer, nullable=False, default=0)
+    total_count = Column(Integer, nullable=False, default=0)
+    # {str(habit_id): 1 if completed else 0} for every habit with a record that day; a habit
+    # has at most one record per day, so each listed habit adds 1 to total_count
+    habit_counts = Column(JSON, nullable=False, default=dict)
+
+    def __repr__(self) -> str:
+        return (f"DailyProgressRollup(user_id={self.user_id}, date={self.date}, "
+                f"completed_count={self.completed_count}, total_count={self.total_count})")
+
+class HabitBitmap(Base):
+    """One habit's completion history for one calendar year, used by the bitmap storage mode.
+
+    Bit n (little-endian within and across bytes) is day n of the year, Jan 1 being bit 0.
+    """
+    __tablename__ = "habit_bitmaps"
+    __table_args__ = (Index("ix_habit_bitmaps_user_year", "user_id", "year"),)
+
+    habit_id = Column(Integer, ForeignKey("habits.id"), primary_key=True)
+    year = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # Days that have a record (completed or not), and days marked completed
+    tracked = Column(LargeBinary, nullable=False)
+    completed = Column(LargeBinary, nullable=False)
+    # The owner's data_version as of the last write to this habit-year, for the change feed
+    change_seq = Column(Integer, nullable=False, default=0, server_default="0")
+
+    def __repr__(self) -> str:
+        return f"HabitBitmap(habit_id={self.habit_id}, year={self.year}, user_id={self.user_id})"
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from passlib.context import CryptContext
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Number of recent hash timings kept for latency percentiles
+LATENCY_SAMPLES = 512
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a bounded thread pool off the event loop.
+
+    At most max_workers hashes run at once and at most max_queue more wait for a
+    worker; beyond that requests are rejected with 503 and Retry-After instead of
+    piling up behind the pool. bcrypt releases the GIL, so threads scale across cores.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int, max_queue: int, retry_after_seconds: int):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after_seconds = retry_after_seconds
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latencies: deque = deque(maxlen=LATENCY_SAMPLES)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed: Optional[str]) -> bool:
+        return await self._run(self.context.verify, password, hashed)
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self._rejected += 1
+            logger.warning(f"Password hashing pool saturated ({self._in_flight} in flight), rejecting request")
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": str(self.retry_after_seconds)},
+            )
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._latencies.append(time.perf_counter() - start)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        """Return pool utilization, queue depth, rejections and latency (including queue wait) in ms."""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        busy = min(self._in_flight, self.max_workers)
+        return {
+            "workers": self.max_workers,
+            "busy": busy,
+            "queued": self._in_flight - busy,
+            "utilization": round(busy / self.max_workers, 2),
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "latency_ms": {"p50": percentile(0.50), "p95": percentile(0.95), "max": percentile(1.0)},
+        }
+
+password_hasher = PasswordHasher(
+    CryptContext(schemes=["bcrypt"], deprecated="auto"),
+    max_workers=Config.PASSWORD_HASH_WORKERS,
+    max_queue=Config.PASSWORD_HASH_MAX_QUEUE,
+    retry_after_seconds=Config.PASSWORD_HASH_RETRY_AFTER_SECONDS,
+)
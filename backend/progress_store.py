@@ -0,0 +1,277 @@
+import logging
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Any, Dict, List, Mapping, Optional, Protocol, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from config import Config
+from models import Progress
+from user_repository import (
+    fetch_all_progress_by_date, fetch_progress_date_range, upsert_progress, insert_missing_progress,
+    insert_missing_progress_cells, fetch_rollup_habit_counts, fetch_daily_rollups, refresh_daily_rollup, bump_data_version, fetch_data_version, fetch_progress_changes,
+    fetch_progress_tombstones, UPSERT_CHUNK_SIZE
+)
+from streak_calculations import recalculate_streaks_for_habit, recalc_all_streaks
+from streak_queue import streak_queue
+from analytics_cache import analytics_cache
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class ProgressCell:
+    """One habit's record for one day, independent of how it is stored."""
+    id: int
+    date: date
+    habit_id: int
+    status: bool
+    streak: int
+
+    @classmethod
+    def from_row(cls, row: Progress) -> "ProgressCell":
+        return cls(id=row.id, date=row.date, habit_id=row.habit_id, status=row.status, streak=row.streak)
+
+@dataclass
+class CompletionMatrix:
+    """Per-(habit, day) record and completion counts over a date range; rows follow habit_ids."""
+    habit_ids: List[int]
+    totals: np.ndarray
+    completed: np.ndarray
+
+    @classmethod
+    def empty(cls, days: int) -> "CompletionMatrix":
+        return cls([], np.zeros((0, days), dtype=np.int64), np.zeros((0, days), dtype=np.int64))
+
+@dataclass
+class ChangeCursor:
+    """Position in a user's change feed, serialized as "<seq>" or "<seq>.<id>".
+
+    Every change up to data version seq has been delivered or, with after_id, every
+    change ordered before (seq, after_id) when a page ended inside one version.
+    """
+    seq: int
+    after_id: Optional[int] = None
+
+    @classmethod
+    def parse(cls, value: str) -> "ChangeCursor":
+        """Parse a serialized cursor; raises ValueError if it is malformed."""
+        seq, _, after_id = value.partition(".")
+        return cls(int(seq), int(after_id) if after_id else None)
+
+    def __str__(self) -> str:
+        return str(self.seq) if self.after_id is None else f"{self.seq}.{self.after_id}"
+
+@dataclass
+class ChangeBatch:
+    """One page of the change feed: changed cells in change order, deleted cell ids, and the next cursor."""
+    cells: List[ProgressCell]
+    deleted: List[int]
+    cursor: ChangeCursor
+    has_more: bool
+
+class ProgressStore(Protocol):
+    """Storage engine for per-day habit completion records."""
+
+    async def write_statuses(
+        self, db: AsyncSession, user_id: int, day: date, statuses: Mapping[int, bool]
+    ) -> None:
+        """Set {habit_id: status} for a day, creating records as needed, and commit."""
+
+    async def day_cells(
+        self, db: AsyncSession, user_id: int, day: date, habit_ids: Sequence[int]
+    ) -> Dict[int, ProgressCell]:
+        """Return a cell per habit for a day, materializing missing ones as not completed."""
+
+    async def range_cells(self, db: AsyncSession, user_id: int, start_date: date, end_date: date) -> List[ProgressCell]:
+        """Return the recorded cells in a date range, ordered by date then habit display order."""
+
+    async def update_cell(
+        self, db: AsyncSession, user_id: int, cell_id: int, updates: Mapping[str, Any]
+    ) -> Optional[ProgressCell]:
+        """Apply updates to one cell and return it, or None if the user has no such cell."""
+
+    async def completion_matrix(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> CompletionMatrix:
+        """Return (habit, day) counts for habits with records in the range."""
+
+    async def habit_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[int, int, int]]:
+        """Return (habit_id, total, completed) for habits with records in the range."""
+
+    async def daily_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[date, int, int]]:
+        """Return (date, completed, total) for days with records in the range."""
+
+    async def fill_missing(
+        self, db: AsyncSession, user_id: int, habit_ids: Sequence[int], start_date: date, end_date: date,
+        chunk_size: int = UPSERT_CHUNK_SIZE,
+    ) -> int:
+        """Create not-completed records for every habit and day in the range that has none.
+
+        Commits per chunk of at most chunk_size records and returns the number created.
+        """
+
+    async def changes_since(
+        self, db: AsyncSession, user_id: int, cursor: Optional[ChangeCursor], limit: int
+    ) -> ChangeBatch:
+        """Return up to limit cells written after cursor (all cells when None) and the deletions since it."""
+
+class RowProgressStore:
+    """One progress row per (user, habit, day); streaks are stored and kept current by the recompute queue."""
+
+    async def write_statuses(
+        self, db: AsyncSession, user_id: int, day: date, statuses: Mapping[int, bool]
+    ) -> None:
+        await upsert_progress(
+            db, user_id, [{"date": day, "habit_id": habit_id, "status": status} for habit_id, status in statuses.items()]
+        )
+        for habit_id in statuses:
+            streak_queue.enqueue(user_id, habit_id, day)
+
+    async def day_cells(
+        self, db: AsyncSession, user_id: int, day: date, habit_ids: Sequence[int]
+    ) -> Dict[int, ProgressCell]:
+        row_map = {r.habit_id: r for r in await fetch_all_progress_by_date(db, day, user_id)}
+        # Materialize every missing habit for the day with a single statement
+        missing = [habit_id for habit_id in habit_ids if habit_id not in row_map]
+        if missing:
+            created = await insert_missing_progress(db, user_id, day, missing)
+            row_map.update({r.habit_id: r for r in created})
+            if len(created) < len(missing):  # Some were inserted concurrently
+                row_map = {r.habit_id: r for r in await fetch_all_progress_by_date(db, day, user_id)}
+            for habit_id in missing:
+                streak_queue.enqueue(user_id, habit_id, day)
+        return {habit_id: ProgressCell.from_row(row_map[habit_id]) for habit_id in habit_ids}
+
+    async def range_cells(self, db: AsyncSession, user_id: int, start_date: date, end_date: date) -> List[ProgressCell]:
+        rows = await fetch_progress_date_range(db, start_date, end_date, user_id)
+        return [ProgressCell.from_row(row) for row in rows]
+
+    async def update_cell(
+        self, db: AsyncSession, user_id: int, cell_id: int, updates: Mapping[str, Any]
+    ) -> Optional[ProgressCell]:
+        result = await db.execute(select(Progress).where(Progress.id == cell_id, Progress.user_id == user_id))
+        record = result.scalar_one_or_none()
+        if record is None:
+            return None
+        for key, value in updates.items():
+            setattr(record, key, value)
+        record.change_seq = await bump_data_version(db, user_id)
+        await refresh_daily_rollup(db, user_id, [record.date])
+        await db.commit()
+        analytics_cache.invalidate_user(user_id)
+        # Recalculate streaks from the edited date forward so the response carries the new streak
+        await recalculate_streaks_for_habit(db, record.habit_id, user_id, from_date=record.date)
+        await db.refresh(record)
+        return ProgressCell.from_row(record)
+
+    async def completion_matrix(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> CompletionMatrix:
+        days = (end_date - start_date).days + 1
+        # One rollup row per day, each listing {habit_id: completed} for that day's records
+        cells = [
+            (int(habit_id), day, done)
+            for day, habit_counts in await fetch_rollup_habit_counts(db, start_date, end_date, user_id)
+            for habit_id, done in habit_counts.items()
+        ]
+        if not cells:
+            return CompletionMatrix.empty(days)
+        habit_col, date_col, completed_col = zip(*cells)
+        habit_ids, habit_idx = np.unique(np.array(habit_col, dtype=np.int64), return_inverse=True)
+        day_idx = (np.array(date_col, dtype="datetime64[D]") - np.datetime64(start_date, "D")).astype(np.intp)
+        totals = np.zeros((len(habit_ids), days), dtype=np.int64)
+        completed = np.zeros((len(habit_ids), days), dtype=np.int64)
+        # A habit has at most one record per day, so plain fancy assignment is enough
+        totals[habit_idx, day_idx] = 1
+        completed[habit_idx, day_idx] = completed_col
+        return CompletionMatrix(habit_ids.tolist(), totals, completed)
+
+    async def habit_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[int, int, int]]:
+        counts: Dict[int, List[int]] = {}
+        for _, habit_counts in await fetch_rollup_habit_counts(db, start_date, end_date, user_id):
+            for habit_id, done in habit_counts.items():
+                total_done = counts.setdefault(int(habit_id), [0, 0])
+                total_done[0] += 1
+                total_done[1] += done
+        return [(habit_id, total, done) for habit_id, (total, done) in sorted(counts.items())]
+
+    async def daily_counts(
+        self, db: AsyncSession, user_id: int, start_date: date, end_date: date
+    ) -> List[Tuple[date, int, int]]:
+        return [tuple(row) for row in await fetch_daily_rollups(db, start_date, end_date, user_id)]
+
+    async def fill_missing(
+        self, db: AsyncSession, user_id: int, habit_ids: Sequence[int], start_date: date, end_date: date,
+        chunk_size: int = UPSERT_CHUNK_SIZE,
+    ) -> int:
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        cells = [(habit_id, day) for day in days for habit_id in habit_ids]
+        created = 0
+        try:
+            for start in range(0, len(cells), chunk_size):
+                chunk = cells[start:start + chunk_size]
+                change_seq = await bump_data_version(db, user_id)
+                inserted = await insert_missing_progress_cells(db, user_id, chunk, change_seq)
+                if inserted:
+                    await refresh_daily_rollup(db, user_id, {day for _, day in chunk})
+                else:
+                    await bump_data_version(db, user_id, step=-1)
+                await db.commit()
+                created += inserted
+        except Exception as e:
+            logger.error(f"Error filling missing progress for user {user_id}: {e}")
+            await db.rollback()
+            raise
+        finally:
+            if created:
+                analytics_cache.invalidate_user(user_id)
+        if created:
+            # A new miss can end a streak that used to run across the gap
+            await recalc_all_streaks(db, [user_id])
+        return created
+
+    async def changes_since(
+        self, db: AsyncSession, user_id: int, cursor: Optional[ChangeCursor], limit: int
+    ) -> ChangeBatch:
+        # Read the version first: records stamped up to it are committed along with it
+        through_seq = await fetch_data_version(db, user_id)
+        start = cursor or ChangeCursor(-1)
+        rows = await fetch_progress_changes(db, user_id, start.seq, start.after_id, through_seq, limit + 1)
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if has_more:
+            next_cursor = ChangeCursor(rows[-1].change_seq, rows[-1].id)
+        else:
+            next_cursor = ChangeCursor(max(through_seq, start.seq))
+        deleted: List[int] = []
+        if cursor is not None:
+            # Deletions are few, so a page repeats those of a version it starts inside
+            after_seq = start.seq if start.after_id is None else start.seq - 1
+            deleted = await fetch_progress_tombstones(db, user_id, after_seq, next_cursor.seq)
+        return ChangeBatch([ProgressCell.from_row(row) for row in rows], deleted, next_cursor, has_more)
+
+_store: Optional[ProgressStore] = None
+
+def get_progress_store() -> ProgressStore:
+    """Return the storage engine selected by Config.PROGRESS_STORAGE."""
+    global _store
+    if _store is None:
+        if Config.PROGRESS_STORAGE == "bitmap":
+            from bitmap_storage import BitmapProgressStore
+            _store = BitmapProgressStore()
+        else:
+            _store = RowProgressStore()
+        logger.info(f"Using '{Config.PROGRESS_STORAGE}' progress storage")
+    return _store
+
+def set_progress_store(store: ProgressStore) -> ProgressStore:
+    """Replace the storage engine, e.g. in tests or benchmarks."""
+    global _store
+    _store = store
+    return _store
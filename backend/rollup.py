@@ -0,0 +1,110 @@
+import argparse
+import asyncio
+import logging
+import sys
+from typing import Callable, List, Optional, Sequence
+from sqlalchemy import delete, exists, select, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_session_maker, init_db
+from models import Progress, DailyProgressRollup
+from user_repository import compute_daily_rollups, write_daily_rollups
+
+logger = logging.getLogger(__name__)
+
+# Users rebuilt or verified per transaction
+ROLLUP_USER_BATCH_SIZE = 200
+
+async def _rollup_user_ids(db: AsyncSession, user_ids: Optional[Sequence[int]]) -> List[int]:
+    """Return the requested users, or every user with progress or rollup rows."""
+    if user_ids:
+        return sorted(set(user_ids))
+    query = union(select(Progress.user_id), select(DailyProgressRollup.user_id))
+    result = await db.execute(query)
+    return sorted(result.scalars().all())
+
+def _batches(user_ids: List[int]) -> List[List[int]]:
+    return [user_ids[i:i + ROLLUP_USER_BATCH_SIZE] for i in range(0, len(user_ids), ROLLUP_USER_BATCH_SIZE)]
+
+async def rebuild_rollups(
+    session_factory: Callable[[], AsyncSession], user_ids: Optional[Sequence[int]] = None
+) -> int:
+    """Rebuild rollup rows from raw progress, committing per batch of users. Returns rows written."""
+    async with session_factory() as db:
+        users = await _rollup_user_ids(db, user_ids)
+
+    written = 0
+    for batch in _batches(users):
+        async with session_factory() as db:
+            await db.execute(delete(DailyProgressRollup).where(DailyProgressRollup.user_id.in_(batch)))
+            rollups = await compute_daily_rollups(db, batch)
+            await write_daily_rollups(db, list(rollups.values()))
+            await db.commit()
+            written += len(rollups)
+        logger.info(f"Rebuilt rollups for users {batch[0]}..{batch[-1]}: {len(rollups)} rows")
+    logger.info(f"Rollup rebuild complete: {written} rows for {len(users)} users")
+    return written
+
+async def verify_rollups(
+    session_factory: Callable[[], AsyncSession], user_ids: Optional[Sequence[int]] = None
+) -> List[str]:
+    """Compare stored rollup rows with raw progress and return a description of every mismatch."""
+    async with session_factory() as db:
+        users = await _rollup_user_ids(db, user_ids)
+
+    mismatches: List[str] = []
+    for batch in _batches(users):
+        async with session_factory() as db:
+            expected = await compute_daily_rollups(db, batch)
+            result = await db.execute(
+                select(DailyProgressRollup).where(DailyProgressRollup.user_id.in_(batch))
+            )
+            stored = {(r.user_id, r.date): r for r in result.scalars().all()}
+
+        for key in sorted(expected.keys() | stored.keys()):
+            want, have = expected.get(key), stored.get(key)
+            if want is None:
+                mismatches.append(f"user {key[0]} {key[1]}: stale rollup row")
+            elif have is None:
+                mismatches.append(f"user {key[0]} {key[1]}: missing rollup row")
+            elif (have.completed_count, have.total_count, have.habit_counts) != (
+                want["completed_count"], want["total_count"], want["habit_counts"]
+            ):
+                mismatches.append(
+                    f"user {key[0]} {key[1]}: stored {have.completed_count}/{have.total_count} "
+                    f"{have.habit_counts}, expected {want['completed_count']}/{want['total_count']} "
+                    f"{want['habit_counts']}"
+                )
+    logger.info(f"Rollup verification checked {len(users)} users: {len(mismatches)} mismatches")
+    return mismatches
+
+async def backfill_rollups_if_empty(session_factory: Callable[[], AsyncSession]) -> None:
+    """Build the rollup on first start after upgrading, when progress exists but no rollup rows do."""
+    async with session_factory() as db:
+        has_rollups = await db.scalar(select(exists().where(DailyProgressRollup.user_id.isnot(None))))
+        has_progress = await db.scalar(select(exists().where(Progress.id.isnot(None))))
+    if has_progress and not has_rollups:
+        logger.info("Daily rollup table is empty, backfilling from progress")
+        await rebuild_rollups(session_factory)
+
+async def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the progress_daily_rollup table.")
+    parser.add_argument("command", choices=["rebuild", "verify"])
+    parser.add_argument("--user-id", type=int, action="append", dest="user_ids",
+                        help="Limit to a user (repeatable); default is all users")
+    args = parser.parse_args(argv)
+
+    await init_db()
+    if args.command == "rebuild":
+        await rebuild_rollups(async_session_maker, args.user_ids)
+        return 0
+    mismatches = await verify_rollups(async_session_maker, args.user_ids)
+    for mismatch in mismatches:
+        logger.warning(mismatch)
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
+    sys.exit(asyncio.run(main()))
@@ -1,27 +1,39 @@
 import logging
 from datetime import date
 from typing import List, Dict
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
 from datetime import timedelta
-from typing import Optional
-from streak_calculations import recalc_all_streaks, recalculate_streaks_for_habit
+from typing import Literal, Optional
+from streak_queue import streak_queue
+from password_hashing import password_hasher
 
 from auth import (
-    get_current_user, register_user, login_user, google_login_user,
-    GoogleLoginRequest, LoginRequest, RegisterRequest
+    get_current_user, register_user, login_user, google_login_user, invalidate_user_snapshot, reload_user_snapshot,
+    GoogleLoginRequest, LoginRequest, RegisterRequest, UserSnapshot
 )
-from database import get_db
+from database import get_db, get_read_db
 from logic import (
-    get_progress_by_date, get_weekly_progress, update_progress,
-    bulk_update_progress, get_completion_stats, patch_progress_record
+    get_progress_by_date, get_weekly_progress, get_progress_grid, get_progress_grid_compact, update_progress,
+    bulk_update_progress, get_completion_stats, patch_progress_record, to_progress_read, week_range, MAX_GRID_DAYS,
+    get_progress_changes, DEFAULT_CHANGES_LIMIT, MAX_CHANGES_LIMIT
 )
-from streak_calculations import recalc_all_streaks
-from schemas import ProgressCreate, ProgressRead, ProgressUpdate, BulkUpdate, HabitCreate, AnalyticsResponse
+from schemas import (
+    ProgressCreate, ProgressRead, ProgressUpdate, BulkUpdate, HabitCreate, HabitRead, HabitUpdate, AnalyticsResponse,
+    ProgressChanges
+)
+from user_repository import fetch_habits, ensure_habits, bump_data_version, stamp_habit_progress
+from progress_store import get_progress_store
+from analytics_cache import analytics_cache
+from compact_encoding import CompactResponse, encode_stats, wants_compact
+from conditional_get import check_not_modified, validator_headers
 from application_status import ApplicationStatus
-from models import User, Progress
+from metrics import metrics
+from models import User, Habit
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api")
@@ -45,34 +57,112 @@ async def google_login(request: GoogleLoginRequest, db: AsyncSession = Depends(g
     return await google_login_user(request, db)
 
 @router.get("/auth/protected")
-async def protected_route(current_user: User = Depends(get_current_user)):
+async def protected_route(current_user: UserSnapshot = Depends(get_current_user)):
     """Test protected route."""
     return {"message": f"Hello, {current_user.name or current_user.email}!"}
 
 # --- Progress Routes ---
 @router.get("/progress/weekly", response_model=List[ProgressRead])
-async def weekly_progress(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """Get progress for the last 7 days."""
+async def weekly_progress(
+    request: Request,
+    response: Response,
+    start: Optional[date] = None,
+    format: Optional[Literal["json", "compact"]] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """Get progress for the last 7 days, or the 7 days starting at start.
+
+    format=compact (or Accept: application/vnd.habits.compact+json) returns the columnar encoding.
+    """
     try:
-        return await get_weekly_progress(db, current_user.id)
+        _, headers, not_modified = await check_not_modified(request, db, current_user.id)
+        if not_modified:
+            return not_modified
+        if wants_compact(request, format):
+            week_start, week_end = week_range(start)
+            return CompactResponse(
+                await get_progress_grid_compact(db, current_user.id, week_start, week_end), headers=headers
+            )
+        response.headers.update(headers)
+        return await get_weekly_progress(db, current_user.id, start)
     except HTTPException as he:
         raise he
     except Exception as e:
         logger.error(f"Error in weekly_progress: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch weekly progress")
 
+@router.get("/progress/range", response_model=List[ProgressRead])
+async def progress_range(
+    request: Request,
+    response: Response,
+    start: date,
+    end: date,
+    format: Optional[Literal["json", "compact"]] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """Get the habit x date progress grid for an inclusive date range, optionally in the compact encoding."""
+    if start > end:
+        raise HTTPException(status_code=400, detail="Start date must be before end date")
+    if (end - start).days + 1 > MAX_GRID_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range cannot exceed {MAX_GRID_DAYS} days")
+    try:
+        _, headers, not_modified = await check_not_modified(request, db, current_user.id)
+        if not_modified:
+            return not_modified
+        if wants_compact(request, format):
+            return CompactResponse(
+                await get_progress_grid_compact(db, current_user.id, start, end), headers=headers
+            )
+        response.headers.update(headers)
+        return await get_progress_grid(db, current_user.id, start, end)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logger.error(f"Error in progress_range: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch progress range")
+
+@router.get("/progress/changes", response_model=ProgressChanges)
+async def progress_changes(
+    since: Optional[str] = None,
+    limit: int = DEFAULT_CHANGES_LIMIT,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """Get progress records created or modified after a cursor, and the ids of deleted ones.
+
+    Pass the returned cursor as since on the next call; while hasMore is true, call again
+    right away. Omitting since returns every record.
+    """
+    if not 1 <= limit <= MAX_CHANGES_LIMIT:
+        raise HTTPException(status_code=400, detail=f"Limit must be between 1 and {MAX_CHANGES_LIMIT}")
+    return await get_progress_changes(db, current_user.id, since, limit)
+
 @router.get("/progress/{progress_date}", response_model=List[ProgressRead])
-async def get_progress(progress_date: date, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_progress(
+    progress_date: date,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
     """Get progress for a specific date."""
     try:
-        return await get_progress_by_date(progress_date, db, current_user.id)
+        _, headers, not_modified = await check_not_modified(request, db, current_user.id)
+        if not_modified:
+            return not_modified
+        result = await get_progress_by_date(progress_date, db, current_user.id)
+        # Reading a day materializes its missing records, which bumps the data version
+        response.headers.update(await validator_headers(request, db, current_user.id))
+        return result
     except Exception as e:
         logger.error(f"Error in get_progress for {progress_date}: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch progress")
 
 @router.post("/progress", status_code=201)
 async def create_or_update_progress(
-    progress: ProgressCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)
+    progress: ProgressCreate, db: AsyncSession = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)
 ):
     """Create or update a progress record."""
     try:
@@ -86,7 +176,7 @@ async def create_or_update_progress(
 
 @router.put("/progress/bulk", status_code=200)
 async def bulk_update(
-    data: BulkUpdate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)
+    data: BulkUpdate, db: AsyncSession = Depends(get_db), current_user: UserSnapshot = Depends(get_current_user)
 ):
     """Bulk update progress records."""
     try:
@@ -103,48 +193,33 @@ async def patch_progress(
     progress_id: int,
     progress_update: ProgressUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
-    try:
-        # Get the raw SQLAlchemy Progress object first
-        result = await db.execute(
-            select(Progress).where(Progress.id == progress_id, Progress.user_id == current_user.id)
-        )
-        progress_record = result.scalar_one_or_none()
-        if not progress_record:
-            raise HTTPException(status_code=404, detail="Progress record not found or unauthorized")
-
-        # Apply updates
-        updates_dict = progress_update.dict(exclude_unset=True)
-        if not updates_dict:
-            raise HTTPException(status_code=400, detail="No fields provided for update")
-        for key, value in updates_dict.items():
-            setattr(progress_record, key, value)
-        await db.commit()
-
-        # Recalculate streaks and refresh
-        await recalculate_streaks_for_habit(db, progress_record.habit, current_user.id)
-        await db.refresh(progress_record)  # Refresh the SQLAlchemy object
-
-        # Convert to ProgressRead for response
-        return ProgressRead.model_validate(progress_record)  # Or .from_orm() for Pydantic v1
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        logger.error(f"Error updating progress {progress_id}: {e}")
-        raise HTTPException(status_code=500, detail="Failed to update progress record")
+    """Update a progress record; the response carries the recalculated streak."""
+    return await patch_progress_record(progress_id, progress_update, db, current_user.id)
     
 # --- Analytics Routes ---
 @router.get("/analytics/completion", response_model=AnalyticsResponse)
 async def completion_stats(
+    request: Request,
+    response: Response,
     start: Optional[date] = None,
     end: Optional[date] = None,
     days: int = 30,
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    summary: bool = False,
+    format: Optional[Literal["json", "compact"]] = None,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
-    """Get habit completion percentages for a date range or last N days."""
+    """Get habit completion percentages for a date range or last N days.
+
+    With summary=true stackedData is omitted and only rollup rows plus per-habit totals are read.
+    format=compact (or the compact Accept media type) lists habits once with parallel arrays.
+    """
     try:
+        version, headers, not_modified = await check_not_modified(request, db, current_user.id)
+        if not_modified:
+            return not_modified
         if start and end:
             start_date = start
             end_date = end
@@ -153,7 +228,14 @@ async def completion_stats(
         else:
             end_date = date.today()
             start_date = end_date - timedelta(days=days - 1)
-        return await get_completion_stats(db, current_user.id, start_date, end_date)
+        stats = await analytics_cache.get_or_compute(
+            current_user.id, version, start_date, end_date, not summary,
+            lambda: get_completion_stats(db, current_user.id, start_date, end_date, include_habits=not summary),
+        )
+        if wants_compact(request, format):
+            return CompactResponse(encode_stats(stats, start_date), headers=headers)
+        response.headers.update(headers)
+        return stats
     except HTTPException as e:
         raise e
     except Exception as e:
@@ -166,8 +248,23 @@ class ProfileUpdate(BaseModel):
     avatar_url: str | None = None
 
 @router.get("/profile", response_model=dict)
-async def get_profile(current_user: User = Depends(get_current_user)):
-    """Get current user's profile."""
+async def get_profile(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """Get current user's profile.
+
+    The body comes from the primary-backed user snapshot, so the version is read there too;
+    a snapshot cached before that version (e.g. by another worker's write) is reloaded.
+    """
+    version, headers, not_modified = await check_not_modified(request, db, current_user.id)
+    if not_modified:
+        return not_modified
+    if current_user.data_version != version:
+        current_user = await reload_user_snapshot(db, current_user.id) or current_user
+    response.headers.update(headers)
     return {
         "id": current_user.id,
         "email": current_user.email,
@@ -179,23 +276,30 @@ async def get_profile(current_user: User = Depends(get_current_user)):
 async def update_profile(
     profile: ProfileUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
     """Update current user's profile."""
     try:
         updates = profile.dict(exclude_unset=True)
         if not updates:
             raise HTTPException(status_code=400, detail="No fields provided for update")
+        user = await db.get(User, current_user.id)
+        if user is None:
+            raise HTTPException(status_code=404, detail="User not found")
         for key, value in updates.items():
-            setattr(current_user, key, value)
+            setattr(user, key, value)
+        await bump_data_version(db, user.id)
         await db.commit()
-        await db.refresh(current_user)
+        await db.refresh(user)
+        invalidate_user_snapshot(user.id)
         return {
-            "id": current_user.id,
-            "email": current_user.email,
-            "name": current_user.name,
-            "avatar_url": current_user.avatar_url,
+            "id": user.id,
+            "email": user.email,
+            "name": user.name,
+            "avatar_url": user.avatar_url,
         }
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error updating profile: {e}")
         await db.rollback()
@@ -213,41 +317,105 @@ async def health_check(db: AsyncSession = Depends(get_db)) -> dict:
         database_status = "unhealthy"
 
     status = ApplicationStatus.get_status()
-    app_status = {"status": database_status, "uptime_seconds": status["uptime_seconds"]}
+    app_status = {
+        "status": database_status,
+        "uptime_seconds": status["uptime_seconds"],
+        "workers": status["workers"],
+        "total_requests": status["total_requests"],
+        "total_errors": status["total_errors"],
+        "streak_queue": streak_queue.stats(),
+        "password_hashing": password_hasher.stats(),
+    }
 
     if database_status == "unhealthy":
         raise HTTPException(status_code=503, detail=app_status)
     return app_status
 
+@router.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics_endpoint() -> PlainTextResponse:
+    """Expose request metrics in Prometheus text format: host-wide totals plus this worker's pid-labelled series."""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@router.get("/metrics/summary", tags=["Health"])
+async def metrics_summary() -> dict:
+    """Host-wide request totals and per-route latency percentiles, aggregated across workers."""
+    status = ApplicationStatus.get_status()
+    return {
+        "workers": status["workers"],
+        "uptime_seconds": status["uptime_seconds"],
+        "total_requests": status["total_requests"],
+        "total_errors": status["total_errors"],
+        "routes": ApplicationStatus.get_route_latencies(),
+    }
+
+@router.get("/habits", response_model=List[HabitRead])
+async def list_habits(
+    include_archived: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """List the user's habits in display order."""
+    try:
+        return await fetch_habits(db, current_user.id, include_archived)
+    except Exception as e:
+        logger.error(f"Error listing habits: {e}")
+        raise HTTPException(status_code=500, detail="Failed to list habits")
+
 @router.post("/habits", response_model=ProgressRead, status_code=201)
 async def create_habit(
     habit: HabitCreate, 
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: UserSnapshot = Depends(get_current_user)
 ):
     logger.info(f"Creating habit: {habit.habit} for user {habit.user_id}")
-    db_progress = Progress(
-        habit=habit.habit,
-        category=habit.category,
-        user_id=habit.user_id,
-        date=habit.date,
-        status=False,
-        streak=0
-    )
-    db.add(db_progress)
     try:
-        await db.commit()
-        await db.refresh(db_progress)
-        # Recalculate streaks after creating the habit
-        await recalc_all_streaks(db)
-        # Refresh again to get the updated streak value
-        await db.refresh(db_progress)
-        return ProgressRead.model_validate(db_progress)  # Or .from_orm() for Pydantic v1
+        habit_ids = await ensure_habits(db, habit.user_id, [habit.habit], {habit.habit: habit.category})
+        habit_id = habit_ids[habit.habit]
+        # Materializes a not-completed record for the start date (or returns the existing one)
+        cells = await get_progress_store().day_cells(db, habit.user_id, habit.date, [habit_id])
+        return to_progress_read(cells[habit_id], await db.get(Habit, habit_id))
     except Exception as e:
         await db.rollback()
         logger.error(f"Failed to create habit: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to create habit")
 
+@router.patch("/habits/{habit_id}", response_model=HabitRead)
+async def update_habit(
+    habit_id: int,
+    updates: HabitUpdate,
+    db: AsyncSession = Depends(get_db),
+    current_user: UserSnapshot = Depends(get_current_user)
+):
+    """Rename, reorder or archive a habit. Archived habits keep their history."""
+    try:
+        updates_dict = updates.dict(exclude_unset=True)
+        if not updates_dict:
+            raise HTTPException(status_code=400, detail="No fields provided for update")
+        habit = await db.get(Habit, habit_id)
+        if habit is None or habit.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail="Habit not found or unauthorized")
+        renamed = "name" in updates_dict and updates_dict["name"] != habit.name
+        for key, value in updates_dict.items():
+            setattr(habit, key, value)
+        change_seq = await bump_data_version(db, current_user.id)
+        if renamed:
+            # Records carry the habit name, so synced clients need them again
+            await stamp_habit_progress(db, habit_id, change_seq)
+        await db.commit()
+        # Cached analytics are keyed by habit name
+        analytics_cache.invalidate_user(current_user.id)
+        await db.refresh(habit)
+        return habit
+    except HTTPException as he:
+        raise he
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="A habit with this name already exists")
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error updating habit {habit_id}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to update habit")
+
 # --- Root Endpoint ---
 @router.get("/")
 async def root():
@@ -56,6 +56,22 @@ class HabitCreate(BaseModel):
     class Config:
         from_attributes = True
 
+class HabitRead(BaseModel):
+    id: int
+    name: str
+    category: Optional[str] = None
+    archived: bool
+    sort_order: int
+    class Config:
+        from_attributes = True
+
+class HabitUpdate(BaseModel):
+    name: Optional[str] = None
+    archived: Optional[bool] = None
+    sort_order: Optional[int] = None
+    class Config:
+        from_attributes = True
+
 
 class AnalyticsResponse(BaseModel):
     completionRates: Dict[str, float]
@@ -75,4 +91,10 @@ class AnalyticsResponse(BaseModel):
                 "dates": ["2025-04-01", "2025-04-02", "2025-04-03"],
                 "lineData": [66.7, 50.0, 33.3]
             }
-        }
\ No newline at end of file
+        }
+
+class ProgressChanges(BaseModel):
+    changes: List[ProgressRead]
+    deleted: List[int]
+    cursor: str
+    hasMore: bool
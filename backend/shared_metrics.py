@@ -0,0 +1,172 @@
+import glob
+import logging
+import math
+import os
+import time
+from typing import Dict, Optional
+import numpy as np
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Log-bucketed latency sketch: bucket i covers (MIN * GAMMA**(i-1), MIN * GAMMA**i], so any
+# quantile read back is within ~2% relative error, and sketches merge by adding counts.
+SKETCH_GAMMA = 1.04
+SKETCH_MIN_SECONDS = 1e-4
+SKETCH_MAX_SECONDS = 120.0
+_LOG_GAMMA = math.log(SKETCH_GAMMA)
+SKETCH_BUCKETS = int(math.ceil(math.log(SKETCH_MAX_SECONDS / SKETCH_MIN_SECONDS) / _LOG_GAMMA)) + 1
+
+MAX_ROUTES = 128  # The last slot collects every route beyond the limit
+ROUTE_NAME_BYTES = 120
+OVERFLOW_ROUTE = "other"
+
+# Worker file layout: header | route names | per-route errors | per-route sketch counts
+_HEADER_FIELDS = 8  # pid, start time (ns since epoch), requests, errors, route count
+_NAMES_OFFSET = _HEADER_FIELDS * 8
+_ERRORS_OFFSET = _NAMES_OFFSET + MAX_ROUTES * ROUTE_NAME_BYTES
+_COUNTS_OFFSET = _ERRORS_OFFSET + MAX_ROUTES * 8
+FILE_SIZE = _COUNTS_OFFSET + MAX_ROUTES * SKETCH_BUCKETS * 8
+
+def bucket_index(seconds: float) -> int:
+    if seconds <= SKETCH_MIN_SECONDS:
+        return 0
+    return min(SKETCH_BUCKETS - 1, int(math.ceil(math.log(seconds / SKETCH_MIN_SECONDS) / _LOG_GAMMA)))
+
+def bucket_value(index: int) -> float:
+    """Representative latency of a bucket (midpoint in relative terms)."""
+    if index == 0:
+        return SKETCH_MIN_SECONDS
+    return SKETCH_MIN_SECONDS * SKETCH_GAMMA ** index * 2 / (1 + SKETCH_GAMMA)
+
+def sketch_quantile(counts: np.ndarray, q: float) -> float:
+    total = int(counts.sum())
+    if total == 0:
+        return 0.0
+    rank = max(1, int(math.ceil(q * total)))
+    return bucket_value(int(np.searchsorted(np.cumsum(counts), rank)))
+
+class _WorkerArrays:
+    """Views over one worker's metrics, backed by an mmap'd file or plain memory."""
+
+    def __init__(self, path: Optional[str], mode: str):
+        if path is None:
+            self.header = np.zeros(_HEADER_FIELDS, dtype=np.int64)
+            self.names = np.zeros(MAX_ROUTES, dtype=f"S{ROUTE_NAME_BYTES}")
+            self.errors = np.zeros(MAX_ROUTES, dtype=np.uint64)
+            self.counts = np.zeros((MAX_ROUTES, SKETCH_BUCKETS), dtype=np.uint64)
+            return
+        self.header = np.memmap(path, np.int64, mode, 0, (_HEADER_FIELDS,))
+        self.names = np.memmap(path, f"S{ROUTE_NAME_BYTES}", mode, _NAMES_OFFSET, (MAX_ROUTES,))
+        self.errors = np.memmap(path, np.uint64, mode, _ERRORS_OFFSET, (MAX_ROUTES,))
+        self.counts = np.memmap(path, np.uint64, mode, _COUNTS_OFFSET, (MAX_ROUTES, SKETCH_BUCKETS))
+
+class SharedMetricsStore:
+    """Host-wide request metrics shared by every uvicorn worker.
+
+    Each worker process writes only its own file in METRICS_DIR, so writes need no
+    locks; any worker aggregates the host view by summing all files. Without
+    METRICS_DIR the store lives in process memory and reports this worker alone.
+    """
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory or None
+        self._pid: Optional[int] = None
+        self._arrays: Optional[_WorkerArrays] = None
+        self._slots: Dict[str, int] = {}
+
+    def _worker(self) -> _WorkerArrays:
+        # Re-open after fork so every worker process gets its own file
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._slots = {}
+            path = None
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+                self._remove_dead_worker_files()
+                path = os.path.join(self.directory, f"worker-{self._pid}.bin")
+                with open(path, "wb") as f:
+                    f.truncate(FILE_SIZE)
+            self._arrays = _WorkerArrays(path, "r+")
+            self._arrays.header[0] = self._pid
+            self._arrays.header[1] = time.time_ns()
+        return self._arrays
+
+    def _remove_dead_worker_files(self) -> None:
+        for path in glob.glob(os.path.join(self.directory, "worker-*.bin")):
+            try:
+                pid = int(os.path.basename(path)[len("worker-"):-len(".bin")])
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                os.remove(path)
+            except (ValueError, PermissionError, OSError):
+                continue
+
+    def _slot(self, arrays: _WorkerArrays, route: str) -> int:
+        slot = self._slots.get(route)
+        if slot is None:
+            slot = len(self._slots)
+            if slot >= MAX_ROUTES - 1:
+                slot = MAX_ROUTES - 1
+                route = OVERFLOW_ROUTE
+            else:
+                self._slots[route] = slot
+            arrays.names[slot] = route.encode()[:ROUTE_NAME_BYTES]
+            arrays.header[4] = len(self._slots)
+        return slot
+
+    def record(self, route: str, duration: float, error: bool) -> None:
+        """Record one finished request for this worker."""
+        arrays = self._worker()
+        slot = self._slot(arrays, route)
+        arrays.counts[slot, bucket_index(duration)] += 1
+        arrays.header[2] += 1
+        if error:
+            arrays.errors[slot] += 1
+            arrays.header[3] += 1
+
+    def aggregate(self) -> dict:
+        """Merge every live worker's metrics into one host-level view."""
+        workers = [self._worker()]
+        if self.directory:
+            workers = []
+            for path in glob.glob(os.path.join(self.directory, "worker-*.bin")):
+                if os.path.getsize(path) == FILE_SIZE:
+                    workers.append(_WorkerArrays(path, "r"))
+
+        requests = errors = 0
+        started_ns = time.time_ns()
+        route_counts: Dict[str, np.ndarray] = {}
+        route_errors: Dict[str, int] = {}
+        for arrays in workers:
+            requests += int(arrays.header[2])
+            errors += int(arrays.header[3])
+            if arrays.header[1]:
+                started_ns = min(started_ns, int(arrays.header[1]))
+            for slot in range(MAX_ROUTES):
+                name = arrays.names[slot].decode()
+                if not name:
+                    continue
+                counts = np.array(arrays.counts[slot])
+                route_counts[name] = route_counts.get(name, 0) + counts
+                route_errors[name] = route_errors.get(name, 0) + int(arrays.errors[slot])
+
+        routes = {
+            name: {
+                "requests": int(counts.sum()),
+                "errors": route_errors[name],
+                "p50_ms": round(sketch_quantile(counts, 0.50) * 1000, 2),
+                "p95_ms": round(sketch_quantile(counts, 0.95) * 1000, 2),
+                "p99_ms": round(sketch_quantile(counts, 0.99) * 1000, 2),
+            }
+            for name, counts in sorted(route_counts.items())
+        }
+        return {
+            "workers": len(workers),
+            "uptime_seconds": int((time.time_ns() - started_ns) / 1e9),
+            "total_requests": requests,
+            "total_errors": errors,
+            "routes": routes,
+        }
+
+shared_metrics = SharedMetricsStore(Config.METRICS_DIR)
@@ -1,80 +1,194 @@
+import asyncio
 import logging
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import case, func, select, update
 from models import Progress
+from user_repository import bump_data_version, progress_change_seq
 from fastapi import HTTPException
 
 logger = logging.getLogger(__name__)
 
-async def recalculate_streaks_for_habit(db: AsyncSession, habit: str, user_id: int) -> None:
-    """Recalculate streaks for a specific habit and user."""
-    try:
-        logger.info(f"Recalculating streaks for habit '{habit}' and user {user_id}")
-        # Fetch all progress records for the habit and user, ordered by date
+# Number of (id, date, status, streak) tuples read per round trip while scanning a series
+STREAK_SCAN_BATCH = 256
+
+# Defaults for the partitioned full recompute: users per transaction and batches in flight
+RECALC_USER_BATCH_SIZE = 500
+RECALC_CONCURRENCY = 4
+
+async def _streak_before(db: AsyncSession, habit_id: int, user_id: int, from_date: date) -> int:
+    """Return the stored streak of the last record before from_date (0 if none)."""
+    query = (
+        select(Progress.streak)
+        .where(Progress.user_id == user_id, Progress.habit_id == habit_id, Progress.date < from_date)
+        .order_by(Progress.date.desc())
+        .limit(1)
+    )
+    result = await db.execute(query)
+    return result.scalar_one_or_none() or 0
+
+async def _collect_streak_changes(
+    db: AsyncSession,
+    habit_id: int,
+    user_id: int,
+    from_date: Optional[date] = None,
+    through_date: Optional[date] = None,
+) -> List[Dict[str, int]]:
+    """Walk a habit series in date order and collect the rows whose streak is stale.
+
+    Without from_date the whole series is scanned. With from_date the walk starts at
+    that date, seeded with the streak stored just before it, and stops at the first
+    record after max(from_date, through_date) whose stored streak already matches:
+    every later streak only depends on that value, so the rest of the series is
+    unchanged.
+    """
+    current_streak = await _streak_before(db, habit_id, user_id, from_date) if from_date else 0
+    stop_after = max(from_date, through_date or from_date) if from_date else None
+    changes: List[Dict[str, int]] = []
+    last_date: Optional[date] = None
+
+    while True:
         query = (
-            select(Progress)
-            .where(Progress.habit == habit, Progress.user_id == user_id)
+            select(Progress.id, Progress.date, Progress.status, Progress.streak)
+            .where(Progress.user_id == user_id, Progress.habit_id == habit_id)
             .order_by(Progress.date)
+            .limit(STREAK_SCAN_BATCH)
         )
-        result = await db.execute(query)
-        records = result.scalars().all()
-
-        current_streak = 0
-        for record in records:
-            if record.status:
-                current_streak += 1
-            else:
-                current_streak = 0
-            # Update streak if changed
-            if record.streak != current_streak:
-                await db.execute(
-                    update(Progress)
-                    .where(Progress.id == record.id)
-                    .values(streak=current_streak)
-                )
-        
+        if last_date is not None:
+            query = query.where(Progress.date > last_date)
+        elif from_date is not None:
+            query = query.where(Progress.date >= from_date)
+        rows = (await db.execute(query)).all()
+
+        for row_id, row_date, status, stored_streak in rows:
+            current_streak = current_streak + 1 if status else 0
+            if stored_streak != current_streak:
+                changes.append({"id": row_id, "streak": current_streak})
+            elif stop_after is not None and row_date > stop_after:
+                return changes
+
+        if len(rows) < STREAK_SCAN_BATCH:
+            return changes
+        last_date = rows[-1].date
+
+async def _apply_streak_changes(db: AsyncSession, changes: List[Dict[str, int]]) -> None:
+    """Write collected streak changes as a single executemany UPDATE keyed by primary key."""
+    if changes:
+        await db.execute(update(Progress), changes)
+
+async def recalculate_streaks_for_habit(
+    db: AsyncSession,
+    habit_id: int,
+    user_id: int,
+    from_date: Optional[date] = None,
+    through_date: Optional[date] = None,
+) -> None:
+    """Recalculate streaks for a specific habit and user.
+
+    Pass from_date (the earliest edited date) to only recompute the part of the series
+    that can have changed; through_date extends the range that is always rescanned when
+    several edits are folded into one call. Omitting from_date rescans the full history.
+    """
+    try:
+        logger.info(f"Recalculating streaks for habit {habit_id} and user {user_id} from {from_date or 'start'}")
+        changes = await _collect_streak_changes(db, habit_id, user_id, from_date, through_date)
+        if changes:
+            change_seq = await bump_data_version(db, user_id)
+            for change in changes:
+                change["change_seq"] = change_seq
+        await _apply_streak_changes(db, changes)
         await db.commit()
-        logger.info(f"Streaks recalculated for habit '{habit}' and user {user_id}")
+        logger.info(f"Streaks recalculated for habit {habit_id} and user {user_id}: {len(changes)} rows updated")
     except Exception as e:
         await db.rollback()
-        logger.error(f"Error recalculating streaks for habit '{habit}' and user {user_id}: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to recalculate streaks for '{habit}': {str(e)}")
+        logger.error(f"Error recalculating streaks for habit {habit_id} and user {user_id}: {e}")
+        raise HTTPException(status_code=500, detail=f"Failed to recalculate streaks for habit {habit_id}: {str(e)}")
 
-async def recalc_all_streaks(db: AsyncSession) -> None:
-    """Recalculate streaks for all habits and users."""
-    try:
-        logger.info("Starting streak recalculation for all habits")
-        # Fetch all distinct user_id and habit combinations
-        query = select(Progress.user_id, Progress.habit).distinct()
-        result = await db.execute(query)
-        user_habit_pairs = result.all()
-
-        for user_id, habit in user_habit_pairs:
-            # Fetch records for this user and habit
-            subquery = (
-                select(Progress)
-                .where(Progress.user_id == user_id, Progress.habit == habit)
-                .order_by(Progress.date)
-            )
-            subresult = await db.execute(subquery)
-            records = subresult.scalars().all()
-
-            current_streak = 0
-            for record in records:
-                if record.status:
-                    current_streak += 1
-                else:
-                    current_streak = 0
-                if record.streak != current_streak:
-                    await db.execute(
-                        update(Progress)
-                        .where(Progress.id == record.id)
-                        .values(streak=current_streak)
-                    )
+def _computed_streaks(user_ids: Optional[Sequence[int]] = None):
+    """Build a subquery of (id, stored, computed) streaks using gaps-and-islands.
+
+    Every non-completed record starts a new island, so a running count of misses per
+    (user, habit) series labels the islands; the streak of a record is then the running
+    count of completions inside its island. Both steps are window functions, which lets
+    SQLite and Postgres compute every streak in a single pass; the UPDATE ... FROM that
+    applies them needs SQLite 3.33+.
+    """
+    island = func.sum(case((Progress.status, 0), else_=1)).over(
+        partition_by=(Progress.user_id, Progress.habit_id),
+        order_by=Progress.date,
+        rows=(None, 0),
+    )
+    islands = select(
+        Progress.id, Progress.user_id, Progress.habit_id, Progress.date,
+        Progress.status, Progress.streak, island.label("island"),
+    )
+    if user_ids is not None:
+        islands = islands.where(Progress.user_id.in_(user_ids))
+    islands = islands.subquery("islands")
+
+    computed = func.sum(case((islands.c.status, 1), else_=0)).over(
+        partition_by=(islands.c.user_id, islands.c.habit_id, islands.c.island),
+        order_by=islands.c.date,
+        rows=(None, 0),
+    )
+    return select(
+        islands.c.id, islands.c.streak.label("stored"), computed.label("computed")
+    ).subquery("streaks")
 
+async def recalc_all_streaks(db: AsyncSession, user_ids: Optional[Sequence[int]] = None) -> int:
+    """Recalculate streaks for all habits and users (or only the given users).
+
+    Runs as one set-based UPDATE ... FROM that only touches rows whose streak changed,
+    stamping them for the change feed, and returns the number of rows updated. On SQLite
+    this needs MIN_SQLITE_VERSION, which database.py checks when it creates the engine.
+    """
+    try:
+        scope = f"{len(user_ids)} users" if user_ids is not None else "all users"
+        logger.info(f"Starting streak recalculation for {scope}")
+        streaks = _computed_streaks(user_ids)
+        stmt = (
+            update(Progress)
+            .where(Progress.id == streaks.c.id, streaks.c.stored != streaks.c.computed)
+            .values(streak=streaks.c.computed, change_seq=progress_change_seq())
+            .execution_options(synchronize_session=False)
+        )
+        # Bump before stamping so the stamps carry the new versions
+        await bump_data_version(db, user_ids)
+        result = await db.execute(stmt)
+        if not result.rowcount:
+            await bump_data_version(db, user_ids, step=-1)
         await db.commit()
-        logger.info("Streak recalculation completed successfully")
+        logger.info(f"Streak recalculation completed successfully for {scope}: {result.rowcount} rows updated")
+        return result.rowcount
     except Exception as e:
         await db.rollback()
         logger.error(f"Error during streak recalculation: {e}")
-        raise HTTPException(status_code=500, detail=f"Failed to recalculate streaks: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to recalculate streaks: {str(e)}")
+
+async def recalc_all_streaks_partitioned(
+    session_factory: Callable[[], AsyncSession],
+    batch_size: int = RECALC_USER_BATCH_SIZE,
+    concurrency: int = RECALC_CONCURRENCY,
+) -> int:
+    """Recalculate all streaks in per-user batches, each in its own session and transaction.
+
+    Batches of batch_size users commit independently so no single write lock covers the
+    whole table, and up to concurrency batches run at once. On SQLite writers still
+    serialize on the database lock; the win there is the short transactions.
+    """
+    async with session_factory() as db:
+        result = await db.execute(select(Progress.user_id).distinct().order_by(Progress.user_id))
+        user_ids = result.scalars().all()
+
+    batches = [user_ids[i:i + batch_size] for i in range(0, len(user_ids), batch_size)]
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    logger.info(f"Recalculating streaks for {len(user_ids)} users in {len(batches)} batches")
+
+    async def run_batch(batch: Sequence[int]) -> int:
+        async with semaphore:
+            async with session_factory() as db:
+                return await recalc_all_streaks(db, batch)
+
+    updated = await asyncio.gather(*(run_batch(batch) for batch in batches))
+    return sum(updated)
@@ -0,0 +1,160 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import async_session_maker
+from streak_calculations import recalculate_streaks_for_habit
+
+logger = logging.getLogger(__name__)
+
+# Attempts per job before it is given up on (e.g. while SQLite stays busy)
+STREAK_JOB_MAX_ATTEMPTS = 3
+# A failed job waits STREAK_RETRY_BASE_SECONDS * 2**(attempts - 1) before its next attempt
+STREAK_RETRY_BASE_SECONDS = 0.5
+
+@dataclass
+class PendingRecompute:
+    """A queued streak recompute for one (user, habit_id) series."""
+    from_date: date
+    through_date: date
+    enqueued_at: float
+    attempts: int = 0
+    # Monotonic time before which a retried job is not run
+    not_before: float = 0.0
+
+class StreakRecomputeQueue:
+    """In-process queue of deferred per-series streak recomputes.
+
+    Requests for the same (user, habit_id) series are merged while they wait: the merged
+    job starts at the earliest requested date and always rescans through the latest one,
+    so one incremental pass covers every edit. A single worker task drains the queue in
+    FIFO order, each job in its own session. Failed jobs are queued again with
+    exponential backoff, up to STREAK_JOB_MAX_ATTEMPTS attempts; the worker sleeps until
+    the earliest one is due.
+    """
+
+    def __init__(self, session_factory: Callable[[], AsyncSession]):
+        self._session_factory = session_factory
+        self._pending: Dict[Tuple[int, int], PendingRecompute] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task: Optional[asyncio.Task] = None
+        self._enqueued = 0
+        self._merged = 0
+        self._processed = 0
+        self._failed = 0
+        self._retried = 0
+        self._last_lag_seconds = 0.0
+
+    def enqueue(self, user_id: int, habit_id: int, from_date: date) -> None:
+        """Schedule a streak recompute for a series starting at from_date."""
+        self._enqueued += 1
+        self._add((user_id, habit_id), PendingRecompute(from_date, from_date, time.monotonic()))
+
+    def _add(self, key: Tuple[int, int], job: PendingRecompute) -> None:
+        """Queue a job, merging it into one already pending for the same series."""
+        pending = self._pending.get(key)
+        if pending:
+            pending.from_date = min(pending.from_date, job.from_date)
+            pending.through_date = max(pending.through_date, job.through_date)
+            pending.attempts = max(pending.attempts, job.attempts)
+            pending.not_before = max(pending.not_before, job.not_before)
+            self._merged += 1
+        else:
+            self._pending[key] = job
+        self._wakeup.set()
+
+    async def start(self) -> None:
+        """Start the background worker."""
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+            logger.info("Streak recompute queue started")
+
+    async def stop(self) -> None:
+        """Drain pending jobs and stop the background worker.
+
+        The worker is signalled rather than cancelled, so a job in flight completes
+        instead of being lost halfway. Jobs waiting out a retry delay run right away.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        await self.drain()
+        logger.info("Streak recompute queue stopped")
+
+    async def drain(self, due_only: bool = False) -> None:
+        """Process pending jobs in the calling task; with due_only, skip those still waiting to retry."""
+        while True:
+            now = time.monotonic()
+            key = next((key for key, job in self._pending.items() if not due_only or job.not_before <= now), None)
+            if key is None:
+                return
+            await self._process(key, self._pending.pop(key))
+
+    def _next_due_in(self) -> Optional[float]:
+        """Seconds until the earliest pending job is due, or None when nothing is pending."""
+        if not self._pending:
+            return None
+        return max(0.0, min(job.not_before for job in self._pending.values()) - time.monotonic())
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            await self.drain(due_only=True)
+            if self._stopping:
+                break
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_due_in())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _process(self, key: Tuple[int, int], job: PendingRecompute) -> None:
+        user_id, habit_id = key
+        self._last_lag_seconds = time.monotonic() - job.enqueued_at
+        try:
+            async with self._session_factory() as db:
+                await recalculate_streaks_for_habit(
+                    db, habit_id, user_id, from_date=job.from_date, through_date=job.through_date
+                )
+            self._processed += 1
+        except Exception as e:
+            job.attempts += 1
+            if job.attempts < STREAK_JOB_MAX_ATTEMPTS:
+                self._retried += 1
+                delay = STREAK_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1)
+                job.not_before = time.monotonic() + delay
+                logger.warning(
+                    f"Deferred streak recompute failed for habit {habit_id} and user {user_id} "
+                    f"(attempt {job.attempts}), retrying in {delay:.1f}s: {e}"
+                )
+                self._add(key, job)
+            else:
+                self._failed += 1
+                logger.error(
+                    f"Deferred streak recompute failed for habit {habit_id} and user {user_id} "
+                    f"after {job.attempts} attempts, streaks from {job.from_date} stay stale: {e}"
+                )
+
+    def stats(self) -> dict:
+        """Return queue depth, lag and throughput counters."""
+        now = time.monotonic()
+        oldest = min((job.enqueued_at for job in self._pending.values()), default=None)
+        return {
+            "depth": len(self._pending),
+            "oldest_pending_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+            "last_lag_seconds": round(self._last_lag_seconds, 3),
+            "enqueued": self._enqueued,
+            "merged": self._merged,
+            "processed": self._processed,
+            "retried": self._retried,
+            "failed": self._failed,
+        }
+
+streak_queue = StreakRecomputeQueue(async_session_maker)
@@ -1,13 +1,29 @@
 import logging
 from datetime import date
-from typing import List, Optional, Mapping, Any
-from sqlalchemy import select, update
+from typing import Dict, Iterable, List, Optional, Mapping, Any, Sequence, Tuple, Union
+from sqlalchemy import delete, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.exc import SQLAlchemyError, IntegrityError, MultipleResultsFound
 from sqlalchemy.ext.asyncio import AsyncSession
-from models import User, Progress
+from models import User, Habit, HabitBitmap, Progress, ProgressTombstone, DailyProgressRollup
+from analytics_cache import analytics_cache
 
 logger = logging.getLogger(__name__)
 
+# Columns of uq_progress_user_date_habit, the conflict target for progress upserts
+PROGRESS_KEY_COLUMNS = ("user_id", "date", "habit_id")
+# Rows per INSERT statement; keeps bound parameters well under SQLite's limit
+UPSERT_CHUNK_SIZE = 500
+
+def _dialect_insert(db: AsyncSession):
+    """Return the dialect-specific insert() construct that supports ON CONFLICT."""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise RuntimeError(f"Progress upserts are not supported on dialect '{dialect}'")
+
 # User-related functions
 async def find_user_by_google_sub(db: AsyncSession, google_sub: str) -> Optional[User]:
     """Find a user by Google sub."""
@@ -61,52 +77,229 @@ async def get_or_create_user(
         await db.rollback()
         raise
 
+async def fetch_data_version(db: AsyncSession, user_id: int) -> int:
+    """Return a user's data version (a primary-key lookup), 0 if the user does not exist."""
+    try:
+        result = await db.execute(select(User.data_version).where(User.id == user_id))
+        return result.scalar_one_or_none() or 0
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching data version for user {user_id}: {e}")
+        raise
+
+async def bump_data_version(
+    db: AsyncSession, user_ids: Union[int, Sequence[int], None], step: int = 1
+) -> Optional[int]:
+    """Increment users' data version inside the caller's transaction; None bumps every user.
+
+    ETags for conditional GETs and the progress change feed are built from this version,
+    so every write that changes what a user can read must call this before committing.
+    Progress writes bump first and stamp the records they touch with the new version:
+    the bump row-locks the user, so versions commit in order. Returns the new version
+    when a single user id is given.
+
+    step=-1 undoes a bump in the same transaction when the write turned out to change nothing.
+    """
+    try:
+        stmt = update(User).values(data_version=User.data_version + step)
+        if isinstance(user_ids, int):
+            stmt = stmt.where(User.id == user_ids).returning(User.data_version)
+            result = await db.execute(stmt.execution_options(synchronize_session=False))
+            return result.scalar_one_or_none()
+        if user_ids is not None:
+            if not user_ids:
+                return None
+            stmt = stmt.where(User.id.in_(user_ids))
+        await db.execute(stmt.execution_options(synchronize_session=False))
+        return None
+    except SQLAlchemyError as e:
+        logger.error(f"Error bumping data version for users {user_ids}: {e}")
+        raise
+
+def progress_change_seq():
+    """The owning user's current data version, for stamping progress records in multi-user UPDATEs."""
+    return select(User.data_version).where(User.id == Progress.user_id).scalar_subquery()
+
+# Habit-related functions
+async def fetch_habits(db: AsyncSession, user_id: int, include_archived: bool = False) -> List[Habit]:
+    """Fetch a user's habits in display order (sort_order, then name)."""
+    try:
+        query = select(Habit).where(Habit.user_id == user_id).order_by(Habit.sort_order, Habit.name)
+        if not include_archived:
+            query = query.where(Habit.archived.is_(False))
+        result = await db.execute(query)
+        return result.scalars().all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching habits for user {user_id}: {e}")
+        raise
+
+async def ensure_habits(
+    db: AsyncSession,
+    user_id: int,
+    names: Iterable[str],
+    categories: Optional[Mapping[str, Optional[str]]] = None,
+) -> Dict[str, int]:
+    """Return {name: habit_id} for the given habit names, creating missing habits.
+
+    New habits take their category from categories. Runs in the caller's
+    transaction without committing.
+    """
+    try:
+        wanted = list(dict.fromkeys(names))
+        if not wanted:
+            return {}
+        query = select(Habit.name, Habit.id).where(Habit.user_id == user_id, Habit.name.in_(wanted))
+        habit_ids = dict((await db.execute(query)).all())
+        missing = [name for name in wanted if name not in habit_ids]
+        if missing:
+            insert = _dialect_insert(db)
+            stmt = (
+                insert(Habit)
+                .values([
+                    {"user_id": user_id, "name": name, "category": (categories or {}).get(name),
+                     "archived": False, "sort_order": 0}
+                    for name in missing
+                ])
+                .on_conflict_do_nothing(index_elements=("user_id", "name"))
+                .returning(Habit.name, Habit.id)
+            )
+            habit_ids.update((await db.execute(stmt)).all())
+            if len(habit_ids) < len(wanted):  # Some were created concurrently
+                habit_ids = dict((await db.execute(query)).all())
+            logger.info(f"Created habits {missing} for user {user_id}")
+        return habit_ids
+    except SQLAlchemyError as e:
+        logger.error(f"Error resolving habits for user {user_id}: {e}")
+        raise
+
 # Progress-related functions
 async def fetch_progress_by_date_and_habit(
-    db: AsyncSession, date_obj: date, habit: str, user_id: int
+    db: AsyncSession, date_obj: date, habit_id: int, user_id: int
 ) -> Optional[Progress]:
     """Fetch a progress record for a specific date, habit, and user."""
     try:
         query = select(Progress).where(
             Progress.date == date_obj,
-            Progress.habit == habit,
+            Progress.habit_id == habit_id,
             Progress.user_id == user_id,
         )
         result = await db.execute(query)
         return result.scalar_one_or_none()
     except SQLAlchemyError as e:
-        logger.error(f"Error fetching progress for {date_obj}, {habit}, user {user_id}: {e}")
+        logger.error(f"Error fetching progress for {date_obj}, habit {habit_id}, user {user_id}: {e}")
         raise
 
-async def update_progress_status(
-    db: AsyncSession, date_obj: date, habit: Optional[str], user_id: int, updates: Mapping[str, Any]
+async def upsert_progress(
+    db: AsyncSession, user_id: int, rows: Sequence[Mapping[str, Any]], commit: bool = True
 ) -> None:
-    """Update or create a progress record for single or multiple habits."""
-    try:
-        if habit:  # Single habit update
-            # Check for existing record first
-            existing = await fetch_progress_by_date_and_habit(db, date_obj, habit, user_id)
-            if existing:
-                await db.execute(
-                    update(Progress).where(Progress.id == existing.id).values(**updates)
+    """Insert or update many progress records with INSERT ... ON CONFLICT DO UPDATE.
+
+    Each row holds "date" and "habit_id" plus the columns to write; all rows must carry
+    the same columns. Existing (user_id, date, habit_id) records get those columns
+    overwritten. Everything runs in one transaction, committed unless commit=False;
+    callers passing commit=False must invalidate the analytics cache after committing.
+    """
+    try:
+        # Later entries for the same key win, as they would with sequential writes
+        deduped = {(row["date"], row["habit_id"]): {"user_id": user_id, **row} for row in rows}
+        values = list(deduped.values())
+        if not values:
+            return
+        insert = _dialect_insert(db)
+        update_columns = [key for key in values[0] if key not in PROGRESS_KEY_COLUMNS]
+        change_seq = await bump_data_version(db, user_id)
+        for row in values:
+            row["change_seq"] = change_seq
+        for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+            stmt = insert(Progress).values(values[start:start + UPSERT_CHUNK_SIZE])
+            if update_columns:
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=PROGRESS_KEY_COLUMNS,
+                    set_={key: stmt.excluded[key] for key in [*update_columns, "change_seq"]},
                 )
             else:
-                db.add(Progress(date=date_obj, habit=habit, user_id=user_id, **updates))
-        else:  # Multiple habits
-            for habit_key, values in updates.items():
-                existing = await fetch_progress_by_date_and_habit(db, date_obj, habit_key, user_id)
-                if existing:
-                    await db.execute(
-                        update(Progress).where(Progress.id == existing.id).values(**values)
-                    )
-                else:
-                    db.add(Progress(date=date_obj, habit=habit_key, user_id=user_id, **values))
+                stmt = stmt.on_conflict_do_nothing(index_elements=PROGRESS_KEY_COLUMNS)
+            await db.execute(stmt)
+        await refresh_daily_rollup(db, user_id, [row["date"] for row in values])
+        if commit:
+            await db.commit()
+            analytics_cache.invalidate_user(user_id)
+    except SQLAlchemyError as e:
+        logger.error(f"Error upserting {len(rows)} progress records for user {user_id}: {e}")
+        await db.rollback()
+        raise
+
+async def insert_missing_progress(
+    db: AsyncSession, user_id: int, date_obj: date, habit_ids: Sequence[int]
+) -> List[Progress]:
+    """Create not-completed records for habits on a date in one INSERT ... RETURNING.
+
+    Habits that already have a record (e.g. created by a concurrent request) are
+    skipped and not returned.
+    """
+    try:
+        if not habit_ids:
+            return []
+        insert = _dialect_insert(db)
+        change_seq = await bump_data_version(db, user_id)
+        stmt = (
+            insert(Progress)
+            .values([
+                {"user_id": user_id, "date": date_obj, "habit_id": habit_id, "status": False, "streak": 0,
+                 "change_seq": change_seq}
+                for habit_id in habit_ids
+            ])
+            .on_conflict_do_nothing(index_elements=PROGRESS_KEY_COLUMNS)
+            .returning(Progress)
+        )
+        result = await db.execute(stmt)
+        created = result.scalars().all()
+        await refresh_daily_rollup(db, user_id, [date_obj])
+        if not created:
+            await bump_data_version(db, user_id, step=-1)
         await db.commit()
+        analytics_cache.invalidate_user(user_id)
+        return created
     except SQLAlchemyError as e:
-        logger.error(f"Error updating progress for {habit or 'multiple habits'} on {date_obj}: {e}")
+        logger.error(f"Error creating missing progress for user {user_id} on {date_obj}: {e}")
         await db.rollback()
         raise
 
+async def insert_missing_progress_cells(
+    db: AsyncSession, user_id: int, cells: Sequence[Tuple[int, date]], change_seq: int
+) -> int:
+    """Create not-completed records for (habit_id, date) cells in one INSERT ... ON CONFLICT DO NOTHING.
+
+    Runs inside the caller's transaction (no commit, rollup refresh or data version bump;
+    the caller bumps and passes the version as change_seq) and returns the number of
+    records created; cells that already have one are left untouched.
+    """
+    try:
+        if not cells:
+            return 0
+        insert = _dialect_insert(db)
+        stmt = insert(Progress).values([
+            {"user_id": user_id, "date": day, "habit_id": habit_id, "status": False, "streak": 0,
+             "change_seq": change_seq}
+            for habit_id, day in cells
+        ]).on_conflict_do_nothing(index_elements=PROGRESS_KEY_COLUMNS)
+        result = await db.execute(stmt)
+        return result.rowcount
+    except SQLAlchemyError as e:
+        logger.error(f"Error inserting {len(cells)} missing progress cells for user {user_id}: {e}")
+        raise
+
+async def update_progress_status(
+    db: AsyncSession, date_obj: date, habit: Optional[str], user_id: int, updates: Mapping[str, Any]
+) -> None:
+    """Update or create a progress record for single or multiple habits, by habit name."""
+    if habit:  # Single habit update
+        habit_ids = await ensure_habits(db, user_id, [habit])
+        rows = [{"date": date_obj, "habit_id": habit_ids[habit], **updates}]
+    else:  # Multiple habits, updates maps habit -> values
+        habit_ids = await ensure_habits(db, user_id, updates.keys())
+        rows = [{"date": date_obj, "habit_id": habit_ids[name], **values} for name, values in updates.items()]
+    await upsert_progress(db, user_id, rows)
+
 async def fetch_all_progress_by_date(
     db: AsyncSession, start_date: date, user_id: int, end_date: Optional[date] = None
 ) -> List[Progress]:
@@ -126,12 +319,14 @@ async def fetch_all_progress_by_date(
 async def fetch_progress_date_range(
     db: AsyncSession, start_date: date, end_date: date, user_id: int
 ) -> List[Progress]:
-    """Fetch progress records for a date range."""
+    """Fetch progress records for a date range, ordered by date then habit display order."""
     try:
-        query = select(Progress).where(
-            Progress.date.between(start_date, end_date),
-            Progress.user_id == user_id,
-        ).order_by(Progress.date)
+        query = (
+            select(Progress)
+            .join(Habit, Habit.id == Progress.habit_id)
+            .where(Progress.date.between(start_date, end_date), Progress.user_id == user_id)
+            .order_by(Progress.date, Habit.sort_order, Habit.name)
+        )
         result = await db.execute(query)
         return result.scalars().all()
     except SQLAlchemyError as e:
@@ -139,13 +334,205 @@ async def fetch_progress_date_range(
         raise
 
 async def fetch_all_habits(db: AsyncSession, user_id: int) -> List[str]:
-    """Fetch all distinct habits for a user."""
+    """Fetch the names of a user's active habits in display order."""
     try:
-        query = select(Progress.habit).where(Progress.user_id == user_id).distinct().order_by(Progress.habit)
+        query = (
+            select(Habit.name)
+            .where(Habit.user_id == user_id, Habit.archived.is_(False))
+            .order_by(Habit.sort_order, Habit.name)
+        )
         result = await db.execute(query)
         habits = result.scalars().all()
         logger.debug(f"Fetched habits for user {user_id}: {habits}")
         return habits
     except SQLAlchemyError as e:
         logger.error(f"Error fetching habits for user {user_id}: {e}")
-        raise
\ No newline at end of file
+        raise
+
+# Change feed functions
+async def stamp_habit_progress(db: AsyncSession, habit_id: int, change_seq: int) -> None:
+    """Mark every record of a habit (rows and yearly bitmaps) as changed, e.g. after a rename, without committing."""
+    try:
+        for model in (Progress, HabitBitmap):
+            await db.execute(
+                update(model).where(model.habit_id == habit_id).values(change_seq=change_seq)
+                .execution_options(synchronize_session=False)
+            )
+    except SQLAlchemyError as e:
+        logger.error(f"Error stamping progress of habit {habit_id}: {e}")
+        raise
+
+async def delete_progress(db: AsyncSession, user_id: int, progress_ids: Sequence[int]) -> int:
+    """Delete a user's progress records, leaving tombstones for the change feed.
+
+    Runs inside the caller's transaction and refreshes the affected rollup days; the caller
+    commits, invalidates the analytics cache and reschedules streaks from the earliest
+    deleted date. Returns the number of records deleted.
+    """
+    try:
+        result = await db.execute(
+            select(Progress.id, Progress.habit_id, Progress.date)
+            .where(Progress.user_id == user_id, Progress.id.in_(progress_ids))
+        )
+        rows = result.all()
+        if not rows:
+            return 0
+        change_seq = await bump_data_version(db, user_id)
+        await db.execute(ProgressTombstone.__table__.insert(), [
+            {"id": row_id, "user_id": user_id, "habit_id": habit_id, "date": day, "change_seq": change_seq}
+            for row_id, habit_id, day in rows
+        ])
+        await db.execute(delete(Progress).where(Progress.id.in_([row.id for row in rows])))
+        await refresh_daily_rollup(db, user_id, [row.date for row in rows])
+        return len(rows)
+    except SQLAlchemyError as e:
+        logger.error(f"Error deleting {len(progress_ids)} progress records for user {user_id}: {e}")
+        raise
+
+async def fetch_progress_changes(
+    db: AsyncSession, user_id: int, after_seq: int, after_id: Optional[int], through_seq: int, limit: int
+) -> List[Progress]:
+    """Fetch records changed after (after_seq, after_id) up to through_seq, ordered by (change_seq, id).
+
+    after_id=None means every record stamped after_seq was already seen.
+    """
+    try:
+        query = (
+            select(Progress)
+            .where(Progress.user_id == user_id, Progress.change_seq <= through_seq)
+            .order_by(Progress.change_seq, Progress.id)
+            .limit(limit)
+        )
+        if after_id is None:
+            query = query.where(Progress.change_seq > after_seq)
+        else:
+            # The range condition keeps the scan on ix_progress_user_change_seq
+            query = query.where(
+                Progress.change_seq >= after_seq,
+                or_(Progress.change_seq > after_seq, Progress.id > after_id),
+            )
+        result = await db.execute(query)
+        return result.scalars().all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching progress changes for user {user_id}: {e}")
+        raise
+
+async def fetch_progress_tombstones(
+    db: AsyncSession, user_id: int, after_seq: int, through_seq: int
+) -> List[int]:
+    """Fetch the ids of records deleted after after_seq up to through_seq."""
+    try:
+        query = (
+            select(ProgressTombstone.id)
+            .where(
+                ProgressTombstone.user_id == user_id,
+                ProgressTombstone.change_seq > after_seq,
+                ProgressTombstone.change_seq <= through_seq,
+            )
+            .order_by(ProgressTombstone.change_seq, ProgressTombstone.id)
+        )
+        result = await db.execute(query)
+        return result.scalars().all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching progress tombstones for user {user_id}: {e}")
+        raise
+
+# Daily rollup functions
+async def compute_daily_rollups(
+    db: AsyncSession, user_ids: Sequence[int], dates: Optional[Sequence[date]] = None
+) -> Dict[Tuple[int, date], Dict[str, Any]]:
+    """Aggregate raw progress into rollup rows keyed by (user_id, date)."""
+    try:
+        query = (
+            select(Progress.user_id, Progress.date, Progress.habit_id, Progress.status)
+            .where(Progress.user_id.in_(user_ids))
+        )
+        if dates is not None:
+            query = query.where(Progress.date.in_(dates))
+        result = await db.execute(query)
+
+        rollups: Dict[Tuple[int, date], Dict[str, Any]] = {}
+        for user_id, day, habit_id, status in result.all():
+            rollup = rollups.setdefault((user_id, day), {
+                "user_id": user_id, "date": day,
+                "completed_count": 0, "total_count": 0, "habit_counts": {},
+            })
+            rollup["completed_count"] += int(status)
+            rollup["total_count"] += 1
+            rollup["habit_counts"][str(habit_id)] = int(status)
+        return rollups
+    except SQLAlchemyError as e:
+        logger.error(f"Error aggregating daily rollups for {len(user_ids)} users: {e}")
+        raise
+
+async def write_daily_rollups(db: AsyncSession, rollups: Sequence[Mapping[str, Any]]) -> None:
+    """Insert or overwrite rollup rows without committing."""
+    try:
+        if not rollups:
+            return
+        insert = _dialect_insert(db)
+        for start in range(0, len(rollups), UPSERT_CHUNK_SIZE):
+            stmt = insert(DailyProgressRollup).values(list(rollups[start:start + UPSERT_CHUNK_SIZE]))
+            stmt = stmt.on_conflict_do_update(
+                index_elements=("user_id", "date"),
+                set_={
+                    "completed_count": stmt.excluded.completed_count,
+                    "total_count": stmt.excluded.total_count,
+                    "habit_counts": stmt.excluded.habit_counts,
+                },
+            )
+            await db.execute(stmt)
+    except SQLAlchemyError as e:
+        logger.error(f"Error writing {len(rollups)} daily rollups: {e}")
+        raise
+
+async def refresh_daily_rollup(db: AsyncSession, user_id: int, dates: Iterable[date]) -> None:
+    """Recompute a user's rollup rows for the given days inside the caller's transaction."""
+    try:
+        days = sorted(set(dates))
+        if not days:
+            return
+        rollups = await compute_daily_rollups(db, [user_id], days)
+        empty_days = [day for day in days if (user_id, day) not in rollups]
+        if empty_days:
+            await db.execute(
+                delete(DailyProgressRollup).where(
+                    DailyProgressRollup.user_id == user_id, DailyProgressRollup.date.in_(empty_days)
+                )
+            )
+        await write_daily_rollups(db, list(rollups.values()))
+    except SQLAlchemyError as e:
+        logger.error(f"Error refreshing daily rollup for user {user_id}: {e}")
+        raise
+
+async def fetch_daily_rollups(
+    db: AsyncSession, start_date: date, end_date: date, user_id: int
+) -> List[tuple]:
+    """Fetch (date, completed_count, total_count) rollup rows for a date range."""
+    try:
+        query = select(
+            DailyProgressRollup.date, DailyProgressRollup.completed_count, DailyProgressRollup.total_count
+        ).where(
+            DailyProgressRollup.user_id == user_id,
+            DailyProgressRollup.date.between(start_date, end_date),
+        )
+        result = await db.execute(query)
+        return result.all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching daily rollups for user {user_id}: {e}")
+        raise
+
+async def fetch_rollup_habit_counts(
+    db: AsyncSession, start_date: date, end_date: date, user_id: int
+) -> List[tuple]:
+    """Fetch (date, habit_counts) rollup rows for a date range."""
+    try:
+        query = select(DailyProgressRollup.date, DailyProgressRollup.habit_counts).where(
+            DailyProgressRollup.user_id == user_id,
+            DailyProgressRollup.date.between(start_date, end_date),
+        )
+        result = await db.execute(query)
+        return result.all()
+    except SQLAlchemyError as e:
+        logger.error(f"Error fetching rollup habit counts for user {user_id}: {e}")
+        raise